@@ -4,7 +4,19 @@ MIT License
 '''
 from .reporter import Reporter
 from .stage import Stage
-from typing import List, Dict, Union
+from .connection import ConnectionMode, ConnectionPool
+from .engine import EngineType, init_process_worker
+from .scheduler import Timeline
+from .checkpoint import Checkpoint
+from .dag import StageGraph
+from .ratelimit import RateLimiter
+from .guardrails import Guardrails
+from .histogram import histogram_settings
+from typing import List, Dict, Union, Iterator, Tuple, Set
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+import multiprocessing
+import threading
+import asyncio
 import logging
 
 _top_logger = logging.getLogger(__name__)
@@ -13,29 +25,250 @@ _top_logger = logging.getLogger(__name__)
 class TestPlan:
     ''' Create and execute the Test Plan'''
     name:str = ""
-    stages:Dict[str, Stage] = {}    # key - stage name
+    definition:dict = {}
     pool_size:int = 0
+    connection:ConnectionMode = ConnectionMode.REUSE
+    engine:EngineType = EngineType.THREAD
 
-    def __init__(self, plan_name:str, plan_definition:dict, reporter:Reporter, max_concurrency:int=10):
+    def __init__(self, plan_name:str, plan_definition:dict, reporter:Reporter, max_concurrency:int=10, engine:Union[str, None]=None,
+                 checkpoint:Union[Checkpoint, None]=None):
+        ''' 
+        max_concurrency - max number of jobs running in parallel (can be overridden by plan "max_concurrency")
+
+        engine - "thread", "asyncio" or "process" (overrides plan "engine")
+
+        checkpoint - completed stages and jobs are recorded (and skipped if already completed) when provided
+        '''
         self.name = plan_name
-        # we need to create underlying Jobs first
-        self.stages = {
-            k: Stage(k, v, reporter, max_concurrency) 
-                for k,v in plan_definition.get("stages",{}).items()
-                    # if we want to sort the stages we need to:
-                    # dict(
-                    #     sorted(
-                    #         plan_definition.get("stages",{}).items(),
-                    #         key=lambda stageDef: f'{int(stageDef[0].split("_")[0]):05}' #if stageName[0].split("_")[0].isnumeric() else stageName
-                    #     )
-                    # ).items()
-        }
+        self.reporter = reporter
+        self.checkpoint = checkpoint
+        max_concurrency = int(plan_definition.get("max_concurrency", max_concurrency))
+        # stages are created from the definition one-by-one when executed (see _iter_stages)
+        self.definition = plan_definition
+        # optional "after" dependencies of stages
+        self.stage_graph = StageGraph(plan_definition.get("stages",{}))
         self.pool_size = max_concurrency
+        # "connection": "reuse" (default) | "fresh" - can be overridden per task
+        self.connection = ConnectionMode.byValue(plan_definition.get("connection", ConnectionMode.REUSE.value))
+        # "engine": "thread" (default) | "asyncio" | "process"
+        self.engine = EngineType.byValue(engine or plan_definition.get("engine", EngineType.THREAD.value))
+        # "process_heavy_fields": true - "process" engine workers send body and headers of results as well (see WorkerBatchQueue)
+        self.process_heavy_fields = bool(plan_definition.get("process_heavy_fields", False))
+        # "overhead_timers": true - requests records get harness overhead timings (see ResultCollector)
+        self.overhead_timers = bool(plan_definition.get("overhead_timers", False))
+        # "latency_histograms": true | {..} - latencies are recorded into mergeable histograms per stage and task (see LatencyHistogram)
+        self.latency_histograms:Union[dict, None] = histogram_settings(plan_definition.get("latency_histograms", None))
+        # "rate_limit" - shared by all requests of the plan (see RateLimiter), stages can have their own
+        self.rate_limiter:Union[RateLimiter, None] = RateLimiter(plan_name, plan_definition["rate_limit"]) if "rate_limit" in plan_definition else None
+        # "guardrails" - stop the stage or the whole plan when results are not acceptable (see Guardrails), stages can have their own
+        self.guardrails:Union[Guardrails, None] = Guardrails(plan_name, plan_definition["guardrails"]) if "guardrails" in plan_definition else None
+        self._has_guardrails = self.guardrails is not None or any(
+            isinstance(stage_definition, dict) and "guardrails" in stage_definition for stage_definition in plan_definition.get("stages",{}).values()
+        )
+        # set when any guardrail stops the whole plan
+        self.plan_stop = None
 
-    def execute(self, dry_run:bool=False, options:Union[Dict, None]=None):
-        ''' execute all Stages sequentially '''
+    def _iter_stages(self)->Iterator[Tuple[str, Stage]]:
+        ''' 
+        stages to be executed one-by-one
+        every Stage is created right before the execution and released after, so memory use doesn't grow with the plan size
+        '''
+        # if we want to sort the stages we need to:
+        # dict(
+        #     sorted(
+        #         self.definition.get("stages",{}).items(),
+        #         key=lambda stageDef: f'{int(stageDef[0].split("_")[0]):05}' #if stageName[0].split("_")[0].isnumeric() else stageName
+        #     )
+        # ).items()
+        for stage_name, stage_definition in self.definition.get("stages",{}).items():
+            if self.checkpoint is not None and self.checkpoint.is_stage_done(stage_name):
+                _top_logger.info(f"Stage {stage_name} is already completed per checkpoint")
+                continue
+            yield (stage_name, self._create_stage(stage_name))
+            if self._plan_stopped():
+                # stopped stage is not completed so it'll be executed again on resume
+                _top_logger.error(f"Test Plan {self.name} is STOPPED by the guardrail in stage {stage_name}")
+                return
+            # we're here only when the stage is executed without exception
+            self._stage_done(stage_name)
+
+    def _stage_done(self, stage_name:str):
+        ''' stage is checkpointed only when all its records are stored (stage collector is closed when the stage is completed) '''
+        if self.checkpoint is not None:
+            self.reporter.flush()
+            self.checkpoint.stage_done(stage_name)
+
+    def _plan_stopped(self)->bool:
+        return self.plan_stop is not None and self.plan_stop.is_set()
+
+    def _guardrail_options(self, process_manager=None)->dict:
+        ''' run options for guardrails - plan stop event is shared with worker processes through the manager (if any) '''
+        if not self._has_guardrails:
+            return {}
+        self.plan_stop = process_manager.Event() if process_manager is not None else threading.Event()
+        return {"guardrails": self.guardrails, "plan_stop": self.plan_stop, "stop_events": [self.plan_stop]}
+
+    def _create_stage(self, stage_name:str)->Stage:
+        return Stage(stage_name, self.definition["stages"][stage_name], self.reporter, self.pool_size)
+
+    def _stage_timeline(self, stage_name:str, timelines:Dict[str, Timeline])->Timeline:
+        ''' 
+        stage continues the timeline of its only dependency so waits of every chain are counted from the chain requests
+        first stage of the chain (or stage joining several chains) gets the new timeline
+        '''
+        dependencies = [dependency for dependency in self.stage_graph.dependencies[stage_name] if dependency in timelines]
+        if len(dependencies) == 1:
+            return timelines[dependencies[0]]
+        timeline = Timeline()
+        for dependency in dependencies:
+            timeline.mark(timelines[dependency].anchor())
+        return timeline
 
-        for stage_name, stage in self.stages.items():
+    def _start_ready_stages(self, completed:Set[str], started:Set[str], timelines:Dict[str, Timeline], 
+                            run_options:dict)->List[Tuple[str, Stage, dict]]:
+        ''' (stage name, stage, stage options) for all stages which can be started now '''
+        ready = []
+        if self._plan_stopped():
+            return ready
+        for stage_name in self.stage_graph.ready(completed, started):
+            started.add(stage_name)
+            timelines[stage_name] = self._stage_timeline(stage_name, timelines)
             _top_logger.info(f"Will execute the stage {stage_name}")
-            stage.execute(dry_run=dry_run)
+            ready.append((stage_name, self._create_stage(stage_name), {**run_options, "timeline": timelines[stage_name]}))
+        return ready
 
+    def _stage_completed(self, stage_name:str, exception:Union[BaseException, None], completed:Set[str])->Union[BaseException, None]:
+        ''' register completed stage, returns stage exception if stage failed '''
+        if exception is not None:
+            _top_logger.error(f"Stage {stage_name} failed with exception {exception}. Dependent stages will not be started")
+            return exception
+        if self._plan_stopped():
+            _top_logger.error(f"Test Plan {self.name} is STOPPED by the guardrail. Stage {stage_name} is not completed")
+            return None
+        completed.add(stage_name)
+        self._stage_done(stage_name)
+        return None
+
+    def _completed_stages(self)->Set[str]:
+        return {
+            stage_name for stage_name in self.stage_graph.names
+                if self.checkpoint is not None and self.checkpoint.is_stage_done(stage_name)
+        }
+
+    def _execute_graph(self, dry_run:bool, run_options:dict):
+        ''' 
+        every stage is started as soon as all its dependencies are completed - independent chains run in parallel
+        if any stage fails no new stages are started and the exception is raised when running stages are completed
+        '''
+        completed = self._completed_stages()
+        started = set(completed)
+        timelines:Dict[str, Timeline] = {}
+        running:Dict[Future, str] = {}
+        failure:Union[BaseException, None] = None
+        with ThreadPoolExecutor(max_workers=max(1, len(self.stage_graph.names))) as stages_pool:
+            while True:
+                if failure is None:
+                    for stage_name, stage, stage_options in self._start_ready_stages(completed, started, timelines, run_options):
+                        running[stages_pool.submit(stage.execute, dry_run=dry_run, options=stage_options)] = stage_name
+                if len(running) == 0:
+                    break
+                done, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+                for stage_future in done:
+                    failure = self._stage_completed(running.pop(stage_future), stage_future.exception(), completed) or failure
+        if failure is not None:
+            raise failure
+
+    async def _execute_graph_async(self, dry_run:bool, run_options:dict):
+        ''' asyncio engine version of _execute_graph '''
+        completed = self._completed_stages()
+        started = set(completed)
+        timelines:Dict[str, Timeline] = {}
+        running:Dict[asyncio.Task, str] = {}
+        failure:Union[BaseException, None] = None
+        while True:
+            if failure is None:
+                for stage_name, stage, stage_options in self._start_ready_stages(completed, started, timelines, run_options):
+                    running[asyncio.create_task(stage.execute_async(dry_run=dry_run, options=stage_options))] = stage_name
+            if len(running) == 0:
+                break
+            done, _ = await asyncio.wait(running.keys(), return_when=asyncio.FIRST_COMPLETED)
+            for stage_task in done:
+                failure = self._stage_completed(running.pop(stage_task), stage_task.exception(), completed) or failure
+        if failure is not None:
+            raise failure
+
+    def execute(self, dry_run:bool=False, options:Union[Dict, None]=None):
+        ''' execute all Stages sequentially (or per stage dependencies if any stage has "after") '''
+        _top_logger.info(f"Test Plan {self.name} will use '{self.engine.value}' engine and '{self.connection.value}' connections")
+        if self.engine == EngineType.ASYNCIO:
+            asyncio.run(self._execute_async(dry_run=dry_run, options=options))
+            return
+        # keep-alive connections are shared by all stages and sized to the stage thread pool
+        connection_pool = ConnectionPool(pool_size=self.pool_size)
+        run_options = {
+            **(options or {}),
+            "engine": self.engine,
+            "connection": self.connection,
+            "connection_pool": connection_pool,
+            # waits are counted from the latest request completion across the plan
+            "timeline": Timeline(),
+            "checkpoint": self.checkpoint,
+            "overhead_timers": self.overhead_timers,
+            "latency_histograms": self.latency_histograms,
+            "rate_limiters": [self.rate_limiter] if self.rate_limiter is not None else [],
+        }
+        process_pool:Union[ProcessPoolExecutor, None] = None
+        process_manager = None
+        if self.engine == EngineType.PROCESS:
+            # worker processes are shared by all stages, results are sent back through the manager queues
+            mp_context = multiprocessing.get_context("spawn")
+            process_manager = mp_context.Manager()
+            process_pool = ProcessPoolExecutor(max_workers=self.pool_size, mp_context=mp_context,
+                                               initializer=init_process_worker, initargs=(self.pool_size,))
+            run_options["process_pool"] = process_pool
+            run_options["process_manager"] = process_manager
+            run_options["process_heavy_fields"] = self.process_heavy_fields
+            # jobs of parallel stage chains share plan rate limits (see Stage._execute_in_processes)
+            run_options["process_plan_share"] = 1.0 / self.pool_size if self.stage_graph.has_dependencies else None
+        run_options.update(self._guardrail_options(process_manager))
+        try:
+            if self.stage_graph.has_dependencies:
+                self._execute_graph(dry_run, run_options)
+                return
+            for stage_name, stage in self._iter_stages():
+                _top_logger.info(f"Will execute the stage {stage_name}")
+                stage.execute(dry_run=dry_run, options=run_options)
+        finally:
+            # records collected so far are stored even if the plan failed or was stopped
+            self.reporter.flush()
+            connection_pool.close()
+            if process_pool is not None:
+                process_pool.shutdown()
+            if process_manager is not None:
+                process_manager.shutdown()
+
+    async def _execute_async(self, dry_run:bool=False, options:Union[Dict, None]=None):
+        ''' execute all Stages in one event loop '''
+        from .async_request import AsyncConnectionPool   # aiohttp is required by asyncio engine only
+        async_connection_pool = AsyncConnectionPool(pool_size=self.pool_size)
+        run_options = {
+            **(options or {}),
+            "connection": self.connection,
+            "async_connection_pool": async_connection_pool,
+            "timeline": Timeline(),
+            "checkpoint": self.checkpoint,
+            "overhead_timers": self.overhead_timers,
+            "latency_histograms": self.latency_histograms,
+            "rate_limiters": [self.rate_limiter] if self.rate_limiter is not None else [],
+        }
+        run_options.update(self._guardrail_options())
+        try:
+            if self.stage_graph.has_dependencies:
+                await self._execute_graph_async(dry_run, run_options)
+                return
+            for stage_name, stage in self._iter_stages():
+                _top_logger.info(f"Will execute the stage {stage_name}")
+                await stage.execute_async(dry_run=dry_run, options=run_options)
+        finally:
+            self.reporter.flush()
+            await async_connection_pool.close()
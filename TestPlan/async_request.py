@@ -0,0 +1,147 @@
+'''
+© 2024 Daniil Sokolov <daniil.sokolov@webcloudai.com>
+MIT License
+'''
+from typing import Dict, Union
+from time import perf_counter
+import datetime
+import aiohttp
+from .request import TestRequest, DEFAULT_POOLSIZE
+import logging
+_top_logger = logging.getLogger(__name__)
+
+
+def _create_trace_config()->aiohttp.TraceConfig:
+    ''' 
+    collect connection phases timings into the dict provided as trace_request_ctx
+    NOTE aiohttp reports connection creation as one step so TLS handshake is included into latency_connect
+    '''
+    async def on_dns_resolvehost_start(session, trace_config_ctx, params):
+        trace_config_ctx.trace_request_ctx["_dns_start"] = perf_counter()
+
+    async def on_dns_resolvehost_end(session, trace_config_ctx, params):
+        timing = trace_config_ctx.trace_request_ctx
+        timing["latency_dns"] = (perf_counter() - timing.pop("_dns_start")) * 1000
+
+    async def on_connection_create_start(session, trace_config_ctx, params):
+        trace_config_ctx.trace_request_ctx["_connect_start"] = perf_counter()
+
+    async def on_connection_create_end(session, trace_config_ctx, params):
+        timing = trace_config_ctx.trace_request_ctx
+        timing["latency_connect"] = max(0.0, (perf_counter() - timing.pop("_connect_start")) * 1000 - timing["latency_dns"])
+        timing["connection_reused"] = False
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_dns_resolvehost_start.append(on_dns_resolvehost_start)
+    trace_config.on_dns_resolvehost_end.append(on_dns_resolvehost_end)
+    trace_config.on_connection_create_start.append(on_connection_create_start)
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+    return trace_config
+
+
+class AsyncConnectionPool:
+    ''' aiohttp sessions for the asyncio engine. Sessions are created lazily inside the running event loop '''
+
+    def __init__(self, pool_size:int=DEFAULT_POOLSIZE):
+        ''' pool_size - max number of connections per host '''
+        self.pool_size = max(1, pool_size)
+        self._sessions:Dict[int, aiohttp.ClientSession] = {}   # key - max number of connections per host
+
+    def session(self, connections:int=0)->aiohttp.ClientSession:
+        ''' 
+        keep-alive session shared by all requests (aiohttp pools connections per host)
+        connections - number of requests the task keeps in flight at the same time (see ConnectionPool.session_for)
+        '''
+        limit_per_host = max(self.pool_size, connections)
+        if limit_per_host not in self._sessions:
+            self._sessions[limit_per_host] = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=0, limit_per_host=limit_per_host),
+                trace_configs=[_create_trace_config()]
+            )
+        return self._sessions[limit_per_host]
+
+    def fresh_session(self)->aiohttp.ClientSession:
+        ''' new session with no connection reuse (caller is responsible for closing it) '''
+        return aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(force_close=True, use_dns_cache=False),
+            trace_configs=[_create_trace_config()]
+        )
+
+    async def close(self):
+        for session in self._sessions.values():
+            await session.close()
+        self._sessions = {}
+
+
+class AsyncTestRequest(TestRequest):
+    ''' TestRequest placing the call with aiohttp session - used by asyncio engine '''
+
+    def __init__(self, *, session:aiohttp.ClientSession, own_session:bool=False, region="us-east-1", overhead_timers:bool=False):
+        ''' own_session - session will be closed by close_async() '''
+        super().__init__(region=region, session=session, overhead_timers=overhead_timers)
+        self._own_session = own_session
+
+    def close(self):
+        ''' use close_async() '''
+
+    async def close_async(self):
+        if self._own_session:
+            await self._session.close()
+
+    async def place_async(self, *,
+              url: str,
+              method: str,
+              body={},
+              headers={},
+              dry_run:bool=False):
+        ''' asyncio version of TestRequest.place - returns the same response dict '''
+        self._timed_prepare(url=url, method=method, body=body, headers=headers)
+
+        # place http request
+        place_timestamp = datetime.datetime.now().timestamp()
+        phase_timing:Dict[str, Union[float, bool, None]] = {
+            "latency_dns": 0.0,
+            "latency_connect": 0.0,
+            "latency_tls": None,
+            "connection_reused": True,
+        }
+        if dry_run:
+            start_req = perf_counter()
+            status_code = 200
+            response_headers = {}
+            headers_received = perf_counter()
+            response_content = b""
+        else:
+            start_req = perf_counter()
+            async with self._session.request(
+                    self._method, url,
+                    data=self._body,
+                    headers=self._headers,
+                    trace_request_ctx=phase_timing) as response:
+                headers_received = perf_counter()
+                response_content = await response.read()
+                status_code = response.status
+                response_headers = {k:v for k,v in response.headers.items()}
+        latency = (perf_counter() - start_req) * 1000
+        # time-to-first-byte is counted after the connection is ready
+        phase_timing["latency_ttfb"] = max(0.0, (headers_received - start_req) * 1000 
+                                            - phase_timing["latency_dns"] - phase_timing["latency_connect"])
+        phase_timing["latency_download"] = latency - (headers_received - start_req) * 1000
+        phase_timing["response_bytes"] = len(response_content)
+        # try to parse response
+        parse_start = perf_counter()
+        response_body = self._parse_body(response_content.decode("utf-8", errors="replace"))
+        self._overhead["overhead_parse"] = (perf_counter() - parse_start) * 1000
+
+        return {
+            "place_timestamp": place_timestamp,
+            "statusCode": status_code,
+            "latency": latency,
+            **phase_timing,
+            "request_url": url,
+            "request_method": method,
+            "request_headers": self._headers,
+            "body": response_body,
+            "headers": response_headers,
+            **self.overhead_timing(),
+        }
@@ -0,0 +1,114 @@
+'''
+© 2024 Daniil Sokolov <daniil.sokolov@webcloudai.com>
+MIT License
+'''
+from typing import List, Dict, Set, Union
+from pathlib import Path
+import threading
+import hashlib
+import datetime
+import json
+import os
+import logging
+_top_logger = logging.getLogger(__name__)
+
+
+def plan_hash(plan_definition:dict)->str:
+    ''' hash of the Test Plan definition - checkpoint can be used only with exactly the same plan '''
+    return hashlib.sha256(json.dumps(plan_definition, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class Checkpoint:
+    '''
+    Progress of the Test Plan execution stored in the small json file so stopped run can be resumed:
+
+        {"plan_hash": .., "completed_stages": [..], "started_stages": [..], "completed_jobs": {<stage name>: [..]}, "updated": ..}
+
+    Only jobs and start of not completed stages are kept. File is rewritten atomically when the stage is started and
+    when completed jobs (see ResultCollector.job_done) and stages are stored by the reporter.
+    Stage started but not completed by the stopped run is interrupted - records of its not completed jobs are dropped
+    before the jobs are executed again (see Stage._drop_interrupted_jobs)
+    '''
+    def __init__(self, checkpoint_file:Union[str, Path], plan_definition:dict, resume:bool=False):
+        '''
+        checkpoint_file - location of the checkpoint
+
+        resume - continue from the existing checkpoint (if any), otherwise checkpoint starts from scratch
+        '''
+        self.file = Path(checkpoint_file)
+        self.plan_hash = plan_hash(plan_definition)
+        self.completed_stages:List[str] = []
+        self.started_stages:List[str] = []
+        self.completed_jobs:Dict[str, List[str]] = {}
+        # stages interrupted by the stopped run which are not started again yet
+        self._interrupted_stages:Set[str] = set()
+        self._lock = threading.Lock()
+        if resume:
+            self._load()
+        self._save()
+
+    def _load(self):
+        if not self.file.exists():
+            _top_logger.warning(f"No checkpoint {self.file} found. Test Plan will be executed from the start")
+            return
+        with open(self.file, "r") as f:
+            stored = json.load(f)
+        if stored.get("plan_hash", None) != self.plan_hash:
+            raise ValueError(f"Checkpoint {self.file} was created for another Test Plan and can't be used to resume")
+        self.completed_stages = stored.get("completed_stages", [])
+        self.completed_jobs = stored.get("completed_jobs", {})
+        self.started_stages = stored.get("started_stages", [])
+        self._interrupted_stages = set(self.started_stages) - set(self.completed_stages)
+        _top_logger.info(f"Resuming from checkpoint {self.file} - {len(self.completed_stages)} stages completed")
+
+    def _save(self):
+        ''' write into the temp file and replace the checkpoint so it's never left half-written '''
+        self.file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.file.with_name(f"{self.file.name}.tmp")
+        with open(tmp_file, "w") as f:
+            json.dump({
+                "plan_hash": self.plan_hash,
+                "completed_stages": self.completed_stages,
+                "started_stages": self.started_stages,
+                "completed_jobs": self.completed_jobs,
+                "updated": datetime.datetime.now().isoformat(),
+            }, f, indent=3)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.file)
+
+    def is_stage_done(self, stage_name:str)->bool:
+        return stage_name in self.completed_stages
+
+    def is_stage_interrupted(self, stage_name:str)->bool:
+        ''' stage was started but not completed by the stopped run (and is not started again yet) '''
+        return stage_name in self._interrupted_stages
+
+    def is_job_done(self, stage_name:str, job_name:str)->bool:
+        return job_name in self.completed_jobs.get(stage_name, [])
+
+    def job_done(self, stage_name:str, job_name:str):
+        self.jobs_done(stage_name, [job_name])
+
+    def jobs_done(self, stage_name:str, job_names:List[str]):
+        ''' several jobs are recorded with one write '''
+        if len(job_names) == 0:
+            return
+        with self._lock:
+            self.completed_jobs.setdefault(stage_name, []).extend(job_names)
+            self._save()
+
+    def stage_started(self, stage_name:str):
+        with self._lock:
+            self._interrupted_stages.discard(stage_name)
+            if stage_name not in self.started_stages:
+                self.started_stages.append(stage_name)
+                self._save()
+
+    def stage_done(self, stage_name:str):
+        with self._lock:
+            self.completed_stages.append(stage_name)
+            self.completed_jobs.pop(stage_name, None)
+            if stage_name in self.started_stages:
+                self.started_stages.remove(stage_name)
+            self._save()
@@ -0,0 +1,278 @@
+'''
+© 2024 Daniil Sokolov <daniil.sokolov@webcloudai.com>
+MIT License
+'''
+from .reporter import Reporter, LogRecord, LogRecordType
+from .guardrails import GuardrailMonitor
+from .histogram import LatencyHistograms
+from typing import List, Dict, Union, Tuple, Callable, Any
+from queue import Queue, Empty
+import threading
+import time
+import logging
+_top_logger = logging.getLogger(__name__)
+
+
+class CollectorQueue:
+    '''
+    Queue-like entry point of the ResultCollector for one job and one record type.
+    Tasks use it exactly like a regular Queue (put / put_nowait) but every message lands
+    in the single collector queue tagged with the job name and record type
+    '''
+    def __init__(self, target:Queue, job_name:str, log_type:LogRecordType):
+        self._target = target
+        self._job_name = job_name
+        self._log_type = log_type
+
+    def put(self, item:Any, block:bool=True, timeout:Union[float, None]=None):
+        self._target.put((self._job_name, self._log_type, item), block, timeout)
+
+    def put_nowait(self, item:Any):
+        self._target.put_nowait((self._job_name, self._log_type, item))
+
+
+class OverheadStats:
+    ''' constant memory count / mean / max of the harness overhead timings (msec) '''
+    def __init__(self):
+        self.fields:Dict[str, Tuple[int, float, float]] = {}
+
+    def add(self, field:str, value:float):
+        count, total, top = self.fields.get(field, (0, 0.0, 0.0))
+        self.fields[field] = (count + 1, total + value, max(top, value))
+
+    def summary(self)->Dict[str, Dict[str, float]]:
+        return {
+            field: {"count": count, "mean": total / count, "max": top}
+                for field, (count, total, top) in self.fields.items()
+        }
+
+
+class ResultCollector:
+    '''
+    Drains results and errors of all jobs of the stage as they arrive
+    and streams them into the Reporter in batches.
+
+    All jobs write into one merged Queue, dedicated consumer thread is blocked on this Queue
+    so records are sent to the Reporter not later than flush_interval seconds after they arrive.
+
+    When tasks provide harness overhead timings ("overhead_timers" plan option) collector adds
+    overhead_queue (msec from the task enqueue to the reporter flush) to every such record and reports
+    the "overhead_summary" OTHER record (including reporter write time) when closed
+
+    When latency histograms are enabled ("latency_histograms" plan option) latencies of all jobs are recorded
+    into histograms per task which are reported as OTHER records every interval and when closed (see TestPlan/histogram.py)
+
+    Completed jobs are announced by job_done - the marker goes through the same queue after all job messages, so
+    on_jobs_stored (checkpoint) is called with job names only after all their records are sent to the Reporter
+    and the Reporter is flushed (at most every checkpoint_interval and when closed)
+    '''
+    # job name of the message which stops the consumer (must survive pickling for multiprocessing queues)
+    _STOP = None
+    # job name of the message with the list of (job name, log type, message) sent by the worker process (see WorkerBatchQueue)
+    _BATCH = "<batch>"
+    # job name of the message with the name of the completed job as the message
+    _JOB_DONE = "<job done>"
+
+    def __init__(self, stage_name:str, reporter:Reporter,
+                 batch_size:int=500, flush_interval:float=0.2,
+                 queue:Union[Queue, None]=None, checkpoint_interval:float=5.0):
+        '''
+        stage_name - used for all assembled records
+
+        batch_size - max number of records sent to the Reporter in one add_bunch call
+
+        flush_interval - max time (sec) collected records can wait before sent to the Reporter
+
+        queue - merged queue to listen to (new Queue will be created if not provided)
+
+        checkpoint_interval - max time (sec) completed jobs with stored records can wait for the Reporter flush and on_jobs_stored
+        '''
+        self.stage_name = stage_name
+        self.reporter = reporter
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.queue:Queue = queue if queue is not None else Queue()
+        self.records_count:Dict[LogRecordType, int] = {LogRecordType.LATENCY: 0, LogRecordType.ERROR: 0, LogRecordType.OTHER: 0}
+        self._thread:Union[threading.Thread, None] = None
+        self.overhead = OverheadStats()
+        # guardrails of the stage evaluated on every result and error (see Stage._start_collector)
+        self.monitor:Union[GuardrailMonitor, None] = None
+        # latency histograms of the stage (see Stage._start_collector)
+        self.histograms:Union[LatencyHistograms, None] = None
+        self._reporter_writes = 0
+        self._reporter_msec = 0.0
+        # called with names of completed jobs which records are stored (see Stage._start_collector)
+        self.on_jobs_stored:Union[Callable[[List[str]], None], None] = None
+        self.checkpoint_interval = checkpoint_interval
+        self._jobs_written:List[str] = []
+        self._jobs_stored = time.monotonic()
+
+    def queue_for(self, job_name:str, log_type:LogRecordType)->CollectorQueue:
+        ''' Queue-like object to be used by the job for messages of log_type '''
+        return CollectorQueue(self.queue, job_name, log_type)
+
+    def job_done(self, job_name:str):
+        ''' all messages of the job are queued - job is passed to on_jobs_stored once they are stored '''
+        self.queue.put((ResultCollector._JOB_DONE, None, job_name))
+
+    def start(self):
+        ''' start consumer thread '''
+        self._thread = threading.Thread(target=self._consume, name=f"collector-{self.stage_name}", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        ''' wait for all already queued messages to be reported and stop consumer thread '''
+        if self._thread is None:
+            return
+        self.queue.put((ResultCollector._STOP, None, None))
+        self._thread.join()
+        self._thread = None
+        self._report_histograms()
+        self._report_overhead()
+        self._store_jobs()
+
+    def _store_jobs(self):
+        ''' flush the Reporter and pass jobs which records were sent to the Reporter to on_jobs_stored '''
+        self._jobs_stored = time.monotonic()
+        if len(self._jobs_written) == 0:
+            return
+        job_names, self._jobs_written = self._jobs_written, []
+        try:
+            # histograms of raw_records false are the only records of latencies
+            if self.histograms is not None and not self.histograms.raw_records:
+                self._report_histograms()
+            self.reporter.flush()
+            self.on_jobs_stored(job_names)
+        except Exception as e:
+            _top_logger.error(f"Fail to store completed jobs {job_names} of stage {self.stage_name} with exception {e}")
+
+    def _report_histograms(self):
+        ''' histograms collected since the last report '''
+        if self.histograms is None:
+            return
+        try:
+            self.reporter.add_bunch([self._to_record("collector", LogRecordType.OTHER, data) for data in self.histograms.take()])
+        except Exception as e:
+            _top_logger.error(f"Fail to report latency histograms of stage {self.stage_name} with exception {e}")
+
+    def _report_overhead(self):
+        ''' overhead_summary OTHER record - only if any task provided overhead timings '''
+        if len(self.overhead.fields) == 0:
+            return
+        records_count = sum(self.records_count.values())
+        summary = {
+            "task": "overhead_summary",
+            **self.overhead.summary(),
+            "reporter_write": {
+                "batches": self._reporter_writes,
+                "records": records_count,
+                "msec": self._reporter_msec,
+                "msec_per_record": self._reporter_msec / records_count if records_count > 0 else 0.0,
+            },
+        }
+        _top_logger.info(f"Harness overhead of stage {self.stage_name}: {summary}")
+        try:
+            self.reporter.add_bunch([self._to_record("collector", LogRecordType.OTHER, summary)])
+        except Exception as e:
+            _top_logger.error(f"Fail to report overhead summary of stage {self.stage_name} with exception {e}")
+
+    def _to_record(self, job_name:str, log_type:LogRecordType, message:Any)->LogRecord:
+        return LogRecord(
+            stage=self.stage_name,
+            job=job_name,
+            task=message.get("task","NA") if isinstance(message, dict) else "NIM",
+            logType=log_type,
+            data=message
+        )
+
+    def _account_overhead(self, batch:List[LogRecord], flush_start:float):
+        ''' replace the enqueue moment with the time spent in the collector and count overhead timings '''
+        for one_rec in batch:
+            data = one_rec.data
+            if not isinstance(data, dict) or "overhead_enqueued" not in data:
+                continue
+            data["overhead_queue"] = (flush_start - data.pop("overhead_enqueued")) * 1000
+            for field, value in data.items():
+                if field.startswith("overhead_") and isinstance(value, (int, float)):
+                    self.overhead.add(field, value)
+
+    def _flush(self, batch:List[LogRecord]):
+        if len(batch)==0:
+            return
+        flush_start = time.perf_counter()
+        self._account_overhead(batch, flush_start)
+        reported = self._record_histograms(batch)
+        try:
+            if len(reported) > 0:
+                self.reporter.add_bunch(reported)
+        except Exception as e:
+            _top_logger.error(f"Fail to report {len(reported)} records of stage {self.stage_name} with exception {e}")
+        self._reporter_writes += 1
+        self._reporter_msec += (time.perf_counter() - flush_start) * 1000
+        for one_rec in batch:
+            self.records_count[one_rec.logType] = self.records_count.get(one_rec.logType, 0) + 1
+        batch.clear()
+
+    def _record_histograms(self, batch:List[LogRecord])->List[LogRecord]:
+        ''' record latencies into histograms - returns records to be reported (without latency records if raw records are off) '''
+        if self.histograms is None:
+            return batch
+        for one_rec in batch:
+            if one_rec.logType != LogRecordType.LATENCY or not isinstance(one_rec.data, dict):
+                continue
+            latency = one_rec.data.get("latency", None)
+            if isinstance(latency, (int, float)) and not isinstance(latency, bool):
+                self.histograms.record(one_rec.task, latency)
+        if self.histograms.raw_records:
+            return batch
+        return [one_rec for one_rec in batch if one_rec.logType != LogRecordType.LATENCY]
+
+    def _accept(self, batch:List[LogRecord], job_name:str, log_type:LogRecordType, message:Any):
+        ''' add the message (or all messages of the worker batch) to the batch and let guardrails observe it '''
+        if job_name == ResultCollector._BATCH:
+            for one_job, one_type, one_message in message:
+                self._accept(batch, one_job, one_type, one_message)
+            return
+        if job_name == ResultCollector._JOB_DONE:
+            # all messages of the job are in the batch or already sent to the Reporter
+            if self.on_jobs_stored is not None:
+                self._jobs_written.append(message)
+            return
+        _top_logger.debug(f"Got a message in the {log_type.value} queue of job {job_name}: {message}")
+        batch.append(self._to_record(job_name, log_type, message))
+        if self.monitor is not None:
+            breach = self.monitor.observe(log_type, message)
+            if breach is not None:
+                batch.append(self._to_record(job_name, LogRecordType.OTHER, breach))
+
+    def _consume(self):
+        ''' consumer thread body '''
+        batch:List[LogRecord] = []
+        stop = False
+        while not stop:
+            deadline = time.monotonic() + self.flush_interval
+            # collect the batch until it's full or flush_interval expired
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                try:
+                    job_name, log_type, message = self.queue.get(timeout=timeout) if timeout > 0 else self.queue.get_nowait()
+                except Empty:
+                    break
+                if job_name is ResultCollector._STOP:
+                    stop = True
+                    break
+                self._accept(batch, job_name, log_type, message)
+            self._flush(batch)
+            if self.histograms is not None and self.histograms.is_due():
+                self._report_histograms()
+            if len(self._jobs_written) > 0 and time.monotonic() - self._jobs_stored >= self.checkpoint_interval:
+                self._store_jobs()
+        # drain what is left (messages queued after the stop marker are not expected but let's be safe)
+        while True:
+            try:
+                job_name, log_type, message = self.queue.get_nowait()
+            except Empty:
+                break
+            if job_name is not ResultCollector._STOP:
+                self._accept(batch, job_name, log_type, message)
+        self._flush(batch)
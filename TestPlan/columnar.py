@@ -0,0 +1,376 @@
+'''
+© 2024 Daniil Sokolov <daniil.sokolov@webcloudai.com>
+MIT License
+'''
+from typing import List, Dict, Union, Tuple, Iterator, Any
+from pathlib import Path
+from array import array
+from uuid import uuid4
+import threading
+import datetime
+import shutil
+import time
+import mmap
+import json
+import math
+import os
+import sys
+from .reporter import Reporter, LogRecord, LogRecordType, record_matches
+import logging
+_top_logger = logging.getLogger(__name__)
+
+# fields of the LogRecord stored as columns with the same names (data fields with these names get DATA_PREFIX)
+RECORD_COLUMNS = ("stage", "job", "task")
+DATA_PREFIX = "data."
+# column with the whole data of the records which data is not a dictionary
+RAW_DATA_COLUMN = "_raw_data"
+# heavy nested fields of the request results
+HEAVY_COLUMNS = ("body", "headers", "request_headers")
+# data field missing in the record (field with None value is stored as null)
+_MISSING = object()
+
+
+class ColumnType:
+    ''' 
+    column types of the part - every column is stored in a separate file (or files) with the validity mask
+    (see ColumnMask) so None and NaN values are kept as they were added
+    '''
+    FLOAT = "f8"    # float64
+    INT = "i8"      # int64
+    BOOL = "b1"     # int8
+    STR = "str"     # int32 codes of the dictionary stored in json
+    JSON = "json"   # int64 offsets (rows + 1) of utf-8 json values in the blob
+
+
+class ColumnMask:
+    ''' validity mask of the column - 1 byte per row (parts of older versions have masks of INT columns only) '''
+    MISSING = 0     # record has no such field
+    VALUE = 1
+    NULL = 2        # field value is None
+
+
+def _column_type(values:List[Any])->str:
+    ''' the most specific type for all not missing and not None values of the column '''
+    kinds = {type(one_value) for one_value in values if one_value is not None and one_value is not _MISSING}
+    if len(kinds) == 0 or kinds == {bool}:
+        return ColumnType.BOOL
+    if kinds == {int} and all(not isinstance(one_value, int) or -2**63 <= one_value < 2**63 for one_value in values):
+        return ColumnType.INT
+    # large int would lose precision as float (NaN and infinity are float values)
+    if kinds <= {int, float} and all(not isinstance(one_value, int) or abs(one_value) < 2**63 for one_value in values):
+        return ColumnType.FLOAT
+    if kinds == {str}:
+        return ColumnType.STR
+    return ColumnType.JSON
+
+
+class _Part:
+    '''
+    Row group of records of one type - folder with meta.json and column files.
+    meta.json is written last so part without it (not completed write) is ignored by readers
+    '''
+    META = "meta.json"
+
+    def __init__(self, folder:Path):
+        self.folder = folder
+        with open(folder / _Part.META, "r") as f:
+            meta = json.load(f)
+        self.rows:int = meta["rows"]
+        # column name -> (column type, file stem)
+        self.columns:Dict[str, Tuple[str, str]] = {name: (column[0], column[1]) for name, column in meta["columns"].items()}
+
+    @staticmethod
+    def write(folder:Path, columns:Dict[str, List[Any]], rows:int):
+        folder.mkdir(parents=True)
+        meta_columns = {}
+        for column_i, (name, values) in enumerate(columns.items()):
+            stem = f"c{column_i:04}"
+            column_type = _column_type(values)
+            _Part._write_column(folder / stem, column_type, values)
+            meta_columns[name] = [column_type, stem]
+        tmp_meta = folder / f"{_Part.META}.tmp"
+        with open(tmp_meta, "w") as f:
+            json.dump({"rows": rows, "columns": meta_columns}, f)
+        os.replace(tmp_meta, folder / _Part.META)
+
+    @staticmethod
+    def _write_column(path:Path, column_type:str, values:List[Any]):
+        ''' values of missing and None rows are placeholders (see ColumnMask) '''
+        mask = bytes(ColumnMask.MISSING if one_value is _MISSING else ColumnMask.NULL if one_value is None else ColumnMask.VALUE for one_value in values)
+        with open(path.with_suffix(".mask"), "wb") as f:
+            f.write(mask)
+        values = [one_value if mask[row_i] == ColumnMask.VALUE else None for row_i, one_value in enumerate(values)]
+        match column_type:
+            case ColumnType.FLOAT:
+                data = array("d", (math.nan if one_value is None else float(one_value) for one_value in values))
+            case ColumnType.INT:
+                data = array("q", (0 if one_value is None else one_value for one_value in values))
+            case ColumnType.BOOL:
+                data = array("b", (-1 if one_value is None else int(one_value) for one_value in values))
+            case ColumnType.STR:
+                dictionary:Dict[str, int] = {}
+                data = array("i", (-1 if one_value is None else dictionary.setdefault(one_value, len(dictionary)) for one_value in values))
+                with open(path.with_suffix(".dict.json"), "w") as f:
+                    json.dump(list(dictionary.keys()), f)
+            case _:
+                encoded = [b"" if one_value is None else json.dumps(one_value).encode("utf-8") for one_value in values]
+                offsets = array("q", [0])
+                for one_value in encoded:
+                    offsets.append(offsets[-1] + len(one_value))
+                with open(path.with_suffix(".offsets"), "wb") as f:
+                    _write_array(f, offsets)
+                with open(path.with_suffix(".bin"), "wb") as f:
+                    f.write(b"".join(encoded))
+                return
+        with open(path.with_suffix(".bin"), "wb") as f:
+            _write_array(f, data)
+
+    def read(self, name:str, missing:Any=None)->List[Any]:
+        ''' values of the column (missing for rows without the field and for columns not present in this part) '''
+        if name not in self.columns:
+            return [missing] * self.rows
+        column_type, stem = self.columns[name]
+        path = self.folder / stem
+        values = _Part._read_values(path, column_type, self.rows)
+        if not path.with_suffix(".mask").exists():
+            # part of older versions - NaN, -1 code and empty value are missing values
+            return [missing if one_value is None or (column_type == ColumnType.FLOAT and math.isnan(one_value)) else one_value for one_value in values]
+        mask = _mapped(path.with_suffix(".mask"), "B")
+        return [
+            one_value if mask[row_i] == ColumnMask.VALUE else None if mask[row_i] == ColumnMask.NULL else missing
+                for row_i, one_value in enumerate(values)
+        ]
+
+    @staticmethod
+    def _read_values(path:Path, column_type:str, rows:int)->List[Any]:
+        ''' stored values of the column file (placeholders of BOOL, STR and JSON columns are None) '''
+        match column_type:
+            case ColumnType.FLOAT:
+                return list(_mapped(path.with_suffix(".bin"), "d"))
+            case ColumnType.INT:
+                return list(_mapped(path.with_suffix(".bin"), "q"))
+            case ColumnType.BOOL:
+                return [None if one_value < 0 else bool(one_value) for one_value in _mapped(path.with_suffix(".bin"), "b")]
+            case ColumnType.STR:
+                with open(path.with_suffix(".dict.json"), "r") as f:
+                    dictionary = json.load(f)
+                return [None if code < 0 else dictionary[code] for code in _mapped(path.with_suffix(".bin"), "i")]
+            case _:
+                offsets = _mapped(path.with_suffix(".offsets"), "q")
+                blob = _mapped(path.with_suffix(".bin"), "B")
+                return [
+                    json.loads(bytes(blob[offsets[row_i]:offsets[row_i + 1]])) if offsets[row_i + 1] > offsets[row_i] else None
+                        for row_i in range(rows)
+                ]
+
+
+def _write_array(f, data:array):
+    ''' column files are little-endian '''
+    if sys.byteorder != "little":
+        data = array(data.typecode, data)
+        data.byteswap()
+    data.tofile(f)
+
+def _mapped(path:Path, typecode:str)->Union[memoryview, array]:
+    ''' memory mapped column file as typed values (files are small enough to be mapped as a whole) '''
+    size = path.stat().st_size
+    if size == 0:
+        return array(typecode)
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if sys.byteorder != "little" and typecode not in ("b", "B"):
+        data = array(typecode, bytes(mapped))
+        data.byteswap()
+        return data
+    return memoryview(mapped).cast(typecode)
+
+
+class ReporterColumnar(Reporter):
+    '''
+    Records are stored in the typed columnar format - every field of the record data is a separate column file,
+    so aggregation can read just the columns it needs (see get_columns). Column files are memory mapped when read.
+
+    Records are kept in memory till part_rows records of the type are collected, the oldest of them is kept
+    for flush_interval or the reporter is flushed (every stage flushes it when completed)
+    and stored as the part (row group) folder <folder>/<record type>/part-..
+
+    reporter_options keys:
+
+        folder - location of the store, default "log_columns"
+
+        part_rows - max number of records in one part, default 50000
+
+        flush_interval - max time (sec) records are kept in memory while new records are added, default 30
+
+        heavy_columns - store "body", "headers" and "request_headers" of the results, default True
+    '''
+    def __init__(self, reporter_options:dict):
+        ''' '''
+        self._folder = Path(reporter_options.get("folder", "log_columns"))
+        self._part_rows = max(1, int(reporter_options.get("part_rows", 50000)))
+        self._heavy_columns = bool(reporter_options.get("heavy_columns", True))
+        self._flush_interval = float(reporter_options.get("flush_interval", 30))
+        self._pending:Dict[LogRecordType, List[LogRecord]] = {record_type: [] for record_type in LogRecordType}
+        # when the first pending record of the type was added
+        self._pending_since:Dict[LogRecordType, float] = {}
+        self._lock = threading.Lock()
+        # parts of several reporters (and runs) in the same folder must not collide
+        self._prefix = f"part-{datetime.datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid4().hex[:8]}"
+        self._seq = 0
+        for record_type in LogRecordType:
+            (self._folder / record_type.value).mkdir(parents=True, exist_ok=True)
+
+    def _columns_of(self, records:List[LogRecord])->Dict[str, List[Any]]:
+        ''' record fields and data fields as columns (data field missing in the record is _MISSING) '''
+        columns:Dict[str, List[Any]] = {name: [] for name in RECORD_COLUMNS}
+        for row_i, one_rec in enumerate(records):
+            columns["stage"].append(one_rec.stage)
+            columns["job"].append(one_rec.job)
+            columns["task"].append(one_rec.task)
+            fields = one_rec.data if isinstance(one_rec.data, dict) else {RAW_DATA_COLUMN: one_rec.data}
+            for field, value in fields.items():
+                if not self._heavy_columns and field in HEAVY_COLUMNS:
+                    continue
+                name = f"{DATA_PREFIX}{field}" if field in RECORD_COLUMNS else field
+                column = columns.get(name, None)
+                if column is None:
+                    column = columns[name] = [_MISSING] * row_i
+                column.append(value)
+            for column in columns.values():
+                if len(column) == row_i:
+                    column.append(_MISSING)
+        return columns
+
+    def _write_part(self, record_type:LogRecordType, records:List[LogRecord]):
+        if len(records) == 0:
+            return
+        self._seq += 1
+        _Part.write(self._folder / record_type.value / f"{self._prefix}-{self._seq:05}", self._columns_of(records), len(records))
+
+    def add(self, record:LogRecord):
+        ''' '''
+        self.add_bunch([record])
+
+    def add_bunch(self, records:List[LogRecord]):
+        ''' '''
+        with self._lock:
+            now = time.monotonic()
+            for one_rec in records:
+                record_type = one_rec.logType if isinstance(one_rec.logType, LogRecordType) else LogRecordType(one_rec.logType)
+                pending = self._pending[record_type]
+                if len(pending) == 0:
+                    self._pending_since[record_type] = now
+                pending.append(one_rec)
+                if len(pending) >= self._part_rows:
+                    self._write_pending(record_type)
+            for record_type, since in list(self._pending_since.items()):
+                if now - since >= self._flush_interval:
+                    self._write_pending(record_type)
+
+    def _write_pending(self, record_type:LogRecordType):
+        self._write_part(record_type, self._pending[record_type])
+        self._pending[record_type] = []
+        self._pending_since.pop(record_type, None)
+
+    def flush(self):
+        ''' store all collected records as parts '''
+        with self._lock:
+            for record_type in LogRecordType:
+                self._write_pending(record_type)
+
+    def _parts(self, record_type:LogRecordType)->Iterator[_Part]:
+        ''' completed parts in the order they were written '''
+        self.flush()
+        for part_folder in sorted((self._folder / record_type.value).glob("part-*")):
+            if (part_folder / _Part.META).exists():
+                yield _Part(part_folder)
+
+    def column_names(self, record_type:LogRecordType)->List[str]:
+        ''' all columns of the record type (columns of the record data fields named as fields) '''
+        names:Dict[str, None] = {}
+        for part in self._parts(record_type):
+            names.update({name: None for name in part.columns})
+        return list(names.keys())
+
+    @staticmethod
+    def _matching_rows(record_type:LogRecordType, part:_Part, filters:Union[Dict, None])->Union[List[int], None]:
+        ''' rows of the part matching filters (None if there are no filters) - only stage, job, task and place_timestamp columns are read '''
+        if not filters:
+            return None
+        stages, jobs, tasks = (part.read(name) for name in RECORD_COLUMNS)
+        timestamps = part.read("place_timestamp")
+        return [
+            row_i for row_i in range(part.rows)
+                if record_matches(LogRecord(stage=stages[row_i], job=jobs[row_i], task=tasks[row_i], logType=record_type,
+                                            data={"place_timestamp": timestamps[row_i]}), filters)
+        ]
+
+    def get_columns(self, record_type:LogRecordType, columns:List[str], filters:Union[Dict, None]=None)->Dict[str, List[Any]]:
+        ''' values of the requested columns of records matching filters (None for missing values) - only these column files are read '''
+        result:Dict[str, List[Any]] = {name: [] for name in columns}
+        for part in self._parts(record_type):
+            rows = ReporterColumnar._matching_rows(record_type, part, filters)
+            for name in columns:
+                values = part.read(name)
+                result[name].extend(values if rows is None else [values[row_i] for row_i in rows])
+        return result
+
+    def _part_records(self, record_type:LogRecordType, part:_Part)->List[LogRecord]:
+        columns = {name: part.read(name, missing=_MISSING) for name in part.columns}
+        records = []
+        for row_i in range(part.rows):
+            if RAW_DATA_COLUMN in columns and columns[RAW_DATA_COLUMN][row_i] is not _MISSING:
+                data = columns[RAW_DATA_COLUMN][row_i]
+            else:
+                data = {
+                    (name[len(DATA_PREFIX):] if name.startswith(DATA_PREFIX) else name): values[row_i]
+                        for name, values in columns.items() if name not in RECORD_COLUMNS and name != RAW_DATA_COLUMN and values[row_i] is not _MISSING
+                }
+            records.append(LogRecord(stage=columns["stage"][row_i], job=columns["job"][row_i], task=columns["task"][row_i],
+                                     logType=record_type.value, data=data))
+        return records
+
+    def drop_records(self, stage:str, job_names:List[str]):
+        ''' parts with records of the jobs are rewritten without them '''
+        job_names_set = set(job_names)
+        dropped = 0
+        for record_type in LogRecordType:
+            for part in list(self._parts(record_type)):
+                stages, jobs = part.read("stage"), part.read("job")
+                if not any(stages[row_i] == stage and jobs[row_i] in job_names_set for row_i in range(part.rows)):
+                    continue
+                kept = [one_rec for one_rec in self._part_records(record_type, part) if not (one_rec.stage == stage and one_rec.job in job_names_set)]
+                dropped += part.rows - len(kept)
+                # temp folder name doesn't match parts glob
+                tmp_folder = part.folder.with_name(f"tmp-{part.folder.name}")
+                if len(kept) > 0:
+                    _Part.write(tmp_folder, self._columns_of(kept), len(kept))
+                shutil.rmtree(part.folder)
+                if len(kept) > 0:
+                    os.replace(tmp_folder, part.folder)
+        _top_logger.info(f"{dropped} records of {len(job_names)} jobs of stage {stage} are dropped")
+
+    def list_all(self, record_type:LogRecordType)->List[str]:
+        ''' ids of all records - <part folder>#<row> '''
+        return [f"{part.folder}#{row_i}" for part in self._parts(record_type) for row_i in range(part.rows)]
+
+    def get_all(self, record_type:LogRecordType)->List[LogRecord]:
+        ''' all records with all columns (use get_columns to read only required ones) '''
+        result = []
+        for part in self._parts(record_type):
+            result.extend(self._part_records(record_type, part))
+        return result
+
+    def iter_records(self, record_type:LogRecordType, filters:Union[Dict, None]=None)->Iterator[LogRecord]:
+        ''' records are built part by part '''
+        for part in self._parts(record_type):
+            for one_rec in self._part_records(record_type, part):
+                if record_matches(one_rec, filters):
+                    yield one_rec
+
+    def get_one(self, record_id)->LogRecord:
+        ''' record id is from list_all '''
+        part_folder, row = str(record_id).rsplit("#", 1)
+        self.flush()
+        record_type = LogRecordType(Path(part_folder).parent.name)
+        return self._part_records(record_type, _Part(Path(part_folder)))[int(row)]
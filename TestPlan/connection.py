@@ -0,0 +1,62 @@
+'''
+© 2024 Daniil Sokolov <daniil.sokolov@webcloudai.com>
+MIT License
+'''
+from __future__ import annotations
+from typing import Dict, Union, Tuple
+from enum import Enum
+from urllib.parse import urlsplit
+import threading
+import requests
+from .request import create_session, DEFAULT_POOLSIZE
+import logging
+_top_logger = logging.getLogger(__name__)
+
+
+class ConnectionMode(Enum):
+    ''' how requests get their http connections. Values to be used in Test Template and Plan json '''
+    REUSE = "reuse"     # keep-alive connections shared across all requests to the same host ("warm connection")
+    FRESH = "fresh"     # new session (DNS + TCP + TLS) for every request ("cold connection")
+
+    @staticmethod
+    def byValue(value:str) -> ConnectionMode:
+        for mode in ConnectionMode:
+            if mode.value == value:
+                return mode
+        raise ValueError(f"Unknown ConnectionMode value '{value}'")
+
+
+class ConnectionPool:
+    ''' keep-alive sessions shared across all tasks and jobs of the Test Plan - one session per host (and pool size) '''
+
+    def __init__(self, pool_size:int=DEFAULT_POOLSIZE):
+        ''' pool_size - max number of kept alive connections per host (expected to be the size of Stage thread pool) '''
+        self.pool_size = max(1, pool_size)
+        self._sessions:Dict[Tuple[str, int], requests.Session] = {}   # key - (<scheme>://<netloc>, pool size)
+        self._lock = threading.Lock()
+
+    def session_for(self, url:str, connections:int=0)->requests.Session:
+        ''' 
+        pooled session for the host of the url
+        connections - number of requests the task keeps in flight at the same time (e.g. max_in_flight of the rate task).
+        Session keeps alive at least that many connections - otherwise connections over the pool size are closed 
+        after every request and the open-loop load turns into a new connection per request
+        '''
+        parsed_url = urlsplit(url)
+        session_key = (f"{parsed_url.scheme}://{parsed_url.netloc}", max(self.pool_size, connections))
+        session = self._sessions.get(session_key, None)
+        if session is None:
+            with self._lock:
+                session = self._sessions.get(session_key, None)
+                if session is None:
+                    _top_logger.debug(f"Creating pooled session for {session_key[0]} with pool size {session_key[1]}")
+                    session = create_session(pool_maxsize=session_key[1])
+                    self._sessions[session_key] = session
+        return session
+
+    def close(self):
+        ''' close all pooled sessions '''
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions = {}
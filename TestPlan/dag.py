@@ -0,0 +1,49 @@
+'''
+© 2024 Daniil Sokolov <daniil.sokolov@webcloudai.com>
+MIT License
+'''
+from typing import List, Dict, Set
+import logging
+_top_logger = logging.getLogger(__name__)
+
+
+class StageGraph:
+    '''
+    Dependencies of the Test Plan stages. Stage can have "after": [<stage name>, ...]
+    and will be started only when all listed stages are completed ("after": [] - stage can start immediately).
+    Stage without "after" depends on the previous stage of the plan, so plan without "after" is executed sequentially
+    '''
+    def __init__(self, stages_definition:dict):
+        ''' '''
+        self.names:List[str] = list(stages_definition.keys())
+        self.dependencies:Dict[str, List[str]] = {}
+        self.has_dependencies = False
+        for stage_i, stage_name in enumerate(self.names):
+            stage_definition = stages_definition[stage_name]
+            after = stage_definition.get("after", None) if isinstance(stage_definition, dict) else None
+            if after is None:
+                self.dependencies[stage_name] = [self.names[stage_i-1]] if stage_i > 0 else []
+                continue
+            self.has_dependencies = True
+            after = [after] if isinstance(after, str) else list(after)
+            for dependency in after:
+                if dependency not in stages_definition:
+                    raise ValueError(f"Stage {stage_name} is expected to run after unknown stage {dependency}")
+            self.dependencies[stage_name] = after
+        self._check_cycles()
+
+    def _check_cycles(self):
+        ''' all stages must be reachable by completing stages with completed dependencies '''
+        completed:Set[str] = set()
+        while len(completed) < len(self.names):
+            ready = self.ready(completed, completed)
+            if len(ready) == 0:
+                raise ValueError(f"Stages {[one_name for one_name in self.names if one_name not in completed]} have circular dependencies")
+            completed.update(ready)
+
+    def ready(self, completed:Set[str], started:Set[str])->List[str]:
+        ''' not started stages (in the plan order) with all dependencies completed '''
+        return [
+            stage_name for stage_name in self.names
+                if stage_name not in started and all(dependency in completed for dependency in self.dependencies[stage_name])
+        ]
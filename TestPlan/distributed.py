@@ -0,0 +1,369 @@
+'''
+© 2024 Daniil Sokolov <daniil.sokolov@webcloudai.com>
+MIT License
+
+Coordinator/worker mode - one Test Plan executed from many nodes.
+
+Coordinator and workers talk over TCP with newline-delimited JSON messages:
+
+    worker -> coordinator   {"type": "hello", "host": ..., "pid": ...}
+    coordinator -> worker   {"type": "clock"}                                   (repeated for clock offset estimation)
+    worker -> coordinator   {"type": "clock", "worker_time": ...}
+    coordinator -> worker   {"type": "plan", "name": ..., "definition": {...}, "dry_run": ...}  (plan definition without stages)
+    coordinator -> worker   {"type": "stage", "name": ..., "definition": {...}, "start_at": <worker clock>}
+    worker -> coordinator   {"type": "records", "records": [...]}               (any number while stage is running)
+    worker -> coordinator   {"type": "breach", "stage": ..., "breach": {...}}   (guardrail of the worker is breached)
+    coordinator -> worker   {"type": "stop", "stage": ..., "action": ...}       (breach of another worker - stop the stage or the plan)
+    worker -> coordinator   {"type": "stage_done", "name": ...}
+    coordinator -> worker   {"type": "shutdown"}
+'''
+from .reporter import Reporter, LogRecord, LogRecordType
+from .stage import Stage
+from .guardrails import GuardrailAction
+from . import TestPlan
+from typing import List, Dict, Union, Iterator, Tuple, Any
+from queue import Queue
+import threading
+import socket
+import json
+import time
+import os
+import logging
+_top_logger = logging.getLogger(__name__)
+
+# result fields with the wall clock timestamps of the worker (will be moved to the coordinator clock)
+_TIMESTAMP_FIELDS = ("place_timestamp", "intended_timestamp")
+
+
+def parse_address(address:str)->Tuple[str, int]:
+    ''' <host>:<port> '''
+    host, _, port = address.rpartition(":")
+    return (host or "127.0.0.1", int(port))
+
+
+class _Connection:
+    ''' newline-delimited JSON messages over the socket '''
+    def __init__(self, sock:socket.socket):
+        self._sock = sock
+        self._reader = sock.makefile("rb")
+        self._send_lock = threading.Lock()
+
+    def send(self, message:dict):
+        data = (json.dumps(message) + "\n").encode("utf-8")
+        with self._send_lock:
+            self._sock.sendall(data)
+
+    def receive(self)->Union[dict, None]:
+        ''' next message or None if connection closed '''
+        line = self._reader.readline()
+        if not line:
+            return None
+        return json.loads(line)
+
+    def close(self):
+        try:
+            # reader blocked in receive() (if any) gets the end of the stream
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError as e:
+            _top_logger.debug(f"Fail to shutdown connection with exception {e}")
+        try:
+            self._reader.close()
+            self._sock.close()
+        except Exception as e:
+            _top_logger.debug(f"Fail to close connection with exception {e}")
+
+
+class ReporterSocket(Reporter):
+    ''' worker side Reporter - all records are sent to the coordinator '''
+    def __init__(self, reporter_options:dict):
+        ''' reporter_options["connection"] - connection to the coordinator '''
+        self._connection:_Connection = reporter_options["connection"]
+
+    def add(self, record:LogRecord):
+        ''' '''
+        self.add_bunch([record])
+
+    def add_bunch(self, records:List[LogRecord]):
+        ''' '''
+        self._connection.send({"type": "records", "records": [one_rec.as_dict() for one_rec in records]})
+
+    def list_all(self, record_type:LogRecordType)->List[str]:
+        ''' records are stored by the coordinator '''
+        return []
+
+    def get_all(self, record_type:LogRecordType)->List[LogRecord]:
+        ''' records are stored by the coordinator '''
+        return []
+
+    def get_one(self, record_id)->LogRecord:
+        ''' '''
+        raise ValueError(f"Records are stored by the coordinator")
+
+
+class WorkerTestPlan(TestPlan):
+    ''' 
+    Test Plan which gets stages one-by-one from the coordinator
+    guardrail breaches of the worker are sent to the coordinator and the stage (or the plan) is stopped
+    when the coordinator passes on the breach of another worker
+    '''
+
+    def __init__(self, plan_name:str, plan_definition:dict, connection:_Connection):
+        super().__init__(plan_name, plan_definition, ReporterSocket({"connection": connection}))
+        self._connection = connection
+        # coordinator messages except "stop" (None - connection closed), see _read_coordinator
+        self._messages:Queue = Queue()
+        self._reader:Union[threading.Thread, None] = None
+        self._stage_name:Union[str, None] = None
+        self.stage_stop = None
+
+    def _guardrail_options(self, process_manager=None)->dict:
+        ''' worker can be stopped by the coordinator even if it has no guardrails of its own '''
+        new_event = process_manager.Event if process_manager is not None else threading.Event
+        self.plan_stop, self.stage_stop = new_event(), new_event()
+        return {
+            "guardrails": self.guardrails, 
+            "plan_stop": self.plan_stop, 
+            "stop_events": [self.plan_stop, self.stage_stop],
+            "on_guardrail_breach": self._send_breach,
+        }
+
+    def _send_breach(self, stage_name:str, breach:dict):
+        try:
+            self._connection.send({"type": "breach", "stage": stage_name, "breach": breach})
+        except Exception as e:
+            _top_logger.error(f"Fail to send guardrail breach of stage {stage_name} to coordinator with exception {e}")
+
+    def _read_coordinator(self):
+        ''' reader thread - "stop" is applied right away (while the stage is running), other messages are passed to _iter_stages '''
+        while True:
+            try:
+                message = self._connection.receive()
+            except Exception as e:
+                _top_logger.error(f"Fail to read from coordinator with exception {e}")
+                message = None
+            if message is not None and message.get("type") == "stop":
+                if message.get("action") == GuardrailAction.STOP_PLAN.value:
+                    _top_logger.error(f"Test Plan {self.name} is STOPPED by the guardrail of another worker")
+                    self.plan_stop.set()
+                elif message.get("stage") == self._stage_name:
+                    _top_logger.error(f"Stage {self._stage_name} is STOPPED by the guardrail of another worker")
+                    self.stage_stop.set()
+                continue
+            self._messages.put(message)
+            if message is None:
+                return
+
+    def _iter_stages(self)->Iterator[Tuple[str, Stage]]:
+        ''' wait for the stage from coordinator, wait for the stage start barrier and report stage completion '''
+        self._reader = threading.Thread(target=self._read_coordinator, name="coordinator-reader", daemon=True)
+        self._reader.start()
+        while True:
+            message = self._messages.get()
+            if message is None or message.get("type") == "shutdown":
+                return
+            if message.get("type") != "stage":
+                _top_logger.warning(f"Unexpected message from coordinator {message}")
+                continue
+            self.stage_stop.clear()
+            self._stage_name = message["name"]
+            stage = Stage(message["name"], message["definition"], self.reporter, self.pool_size)
+            # stage start barrier
+            time.sleep(max(0.0, message["start_at"] - time.time()))
+            yield (message["name"], stage)
+            self._connection.send({"type": "stage_done", "name": message["name"]})
+            if self._plan_stopped():
+                _top_logger.error(f"Test Plan {self.name} is STOPPED by the guardrail in stage {message['name']}")
+                return
+
+
+def run_worker(coordinator_address:str):
+    ''' connect to the coordinator and execute stages sent by it till shutdown '''
+    host, port = parse_address(coordinator_address)
+    connection = _Connection(socket.create_connection((host, port)))
+    connection.send({"type": "hello", "host": socket.gethostname(), "pid": os.getpid()})
+    try:
+        plan_message = None
+        while plan_message is None:
+            message = connection.receive()
+            if message is None:
+                return
+            match message.get("type"):
+                case "clock":
+                    connection.send({"type": "clock", "worker_time": time.time()})
+                case "plan":
+                    plan_message = message
+                case "shutdown":
+                    return
+        _top_logger.info(f"Worker got Test Plan {plan_message['name']} from coordinator {coordinator_address}")
+        worker_plan = WorkerTestPlan(plan_message["name"], plan_message["definition"], connection)
+        worker_plan.execute(dry_run=bool(plan_message.get("dry_run", False)))
+    finally:
+        connection.close()
+
+
+class _WorkerHandle:
+    ''' coordinator side state of one connected worker '''
+    def __init__(self, index:int, connection:_Connection, hello:dict):
+        self.index = index
+        self.connection = connection
+        self.hello = hello
+        self.clock_offset = 0.0     # worker clock - coordinator clock (sec)
+        self.clock_replies:Queue = Queue()
+        self.stages_done:Queue = Queue()
+        self.reader:Union[threading.Thread, None] = None
+
+
+class Coordinator:
+    ''' split the Test Plan stages across workers and merge workers results into one Reporter '''
+
+    def __init__(self, plan_name:str, plan_definition:dict, reporter:Reporter,
+                 address:str, workers_count:int,
+                 start_delay:float=1.0, clock_samples:int=5):
+        '''
+        address - <host>:<port> to listen for workers
+
+        workers_count - number of workers to wait for before the plan is started
+
+        start_delay - (sec) how far in future stage start barrier is set
+        '''
+        self.name = plan_name
+        self.definition = plan_definition
+        self.reporter = reporter
+        self.address = parse_address(address)
+        self.workers_count = max(1, workers_count)
+        self.start_delay = start_delay
+        self.clock_samples = max(1, clock_samples)
+        self._workers:List[_WorkerHandle] = []
+        self._report_lock = threading.Lock()
+        # set when guardrail of any worker stops the whole plan
+        self.plan_stop = threading.Event()
+
+    def _accept_workers(self):
+        server = socket.create_server(self.address)
+        _top_logger.info(f"Coordinator is waiting for {self.workers_count} workers on {self.address[0]}:{self.address[1]}")
+        try:
+            while len(self._workers) < self.workers_count:
+                sock, peer = server.accept()
+                connection = _Connection(sock)
+                hello = connection.receive() or {}
+                worker = _WorkerHandle(len(self._workers), connection, hello)
+                self._workers.append(worker)
+                _top_logger.info(f"Worker {worker.index} connected from {peer} ({hello})")
+                worker.reader = threading.Thread(target=self._read_worker, args=(worker,), name=f"worker-{worker.index}", daemon=True)
+                worker.reader.start()
+        finally:
+            server.close()
+
+    def _read_worker(self, worker:_WorkerHandle):
+        ''' reader thread - dispatch messages of one worker '''
+        while True:
+            try:
+                message = worker.connection.receive()
+            except Exception as e:
+                _top_logger.error(f"Fail to read from worker {worker.index} with exception {e}")
+                message = None
+            if message is None:
+                # unblock coordinator if worker is gone
+                worker.stages_done.put(None)
+                return
+            match message.get("type"):
+                case "records":
+                    self._report(worker, message.get("records", []))
+                case "clock":
+                    worker.clock_replies.put((time.time(), message["worker_time"]))
+                case "breach":
+                    self._breach(worker, message)
+                case "stage_done":
+                    worker.stages_done.put(message.get("name"))
+                case _:
+                    _top_logger.warning(f"Unexpected message from worker {worker.index} {message}")
+
+    def _report(self, worker:_WorkerHandle, records:List[dict]):
+        ''' move worker timestamps to the coordinator clock and store records '''
+        log_records = []
+        for one_rec in records:
+            data = one_rec.get("data", None)
+            if isinstance(data, dict):
+                for ts_field in _TIMESTAMP_FIELDS:
+                    if isinstance(data.get(ts_field, None), (int, float)):
+                        data[ts_field] = data[ts_field] - worker.clock_offset
+                data["worker"] = worker.index
+            log_records.append(LogRecord(
+                stage=one_rec["stage"], job=one_rec["job"], task=one_rec["task"],
+                logType=LogRecordType(one_rec["logType"]), data=data
+            ))
+        with self._report_lock:
+            self.reporter.add_bunch(log_records)
+
+    def _breach(self, worker:_WorkerHandle, message:dict):
+        ''' guardrail of the worker is breached - the stage (or the whole plan) is stopped on all other workers as well '''
+        breach = message.get("breach", None) or {}
+        action = breach.get("action", GuardrailAction.STOP_STAGE.value)
+        _top_logger.error(f"Guardrail {breach.get('rule', '')} is breached on worker {worker.index} in stage {message.get('stage')}. Will {action} on all workers")
+        if action == GuardrailAction.STOP_PLAN.value:
+            self.plan_stop.set()
+        for other_worker in self._workers:
+            if other_worker is worker:
+                continue
+            try:
+                other_worker.connection.send({"type": "stop", "stage": message.get("stage"), "action": action})
+            except Exception as e:
+                _top_logger.error(f"Fail to send stop to worker {other_worker.index} with exception {e}")
+
+    def _sync_clock(self, worker:_WorkerHandle):
+        ''' estimate worker clock offset using the sample with the shortest round trip '''
+        best_rtt = None
+        for _ in range(self.clock_samples):
+            sent = time.time()
+            worker.connection.send({"type": "clock"})
+            received, worker_time = worker.clock_replies.get()
+            rtt = received - sent
+            if best_rtt is None or rtt < best_rtt:
+                best_rtt = rtt
+                worker.clock_offset = worker_time - (sent + received) / 2
+        _top_logger.info(f"Worker {worker.index} clock offset {worker.clock_offset*1000:.3f} msec (round trip {best_rtt*1000:.3f} msec)")
+
+    def _split_jobs(self, stage_definition:dict)->List[dict]:
+        ''' round-robin split of the stage jobs across workers '''
+        workers_jobs:List[Dict[str, Any]] = [{} for _ in self._workers]
+        for job_i, (job_name, job_def) in enumerate(stage_definition.get("jobs", {}).items()):
+            workers_jobs[job_i % len(self._workers)][job_name] = job_def
+        return [{**stage_definition, "jobs": one_worker_jobs} for one_worker_jobs in workers_jobs]
+
+    def execute(self, dry_run:bool=False):
+        ''' wait for workers and execute all Stages sequentially across them '''
+        self._accept_workers()
+        for worker in self._workers:
+            self._sync_clock(worker)
+        plan_options = {k:v for k,v in self.definition.items() if k != "stages"}
+        for worker in self._workers:
+            worker.connection.send({"type": "plan", "name": self.name, "definition": plan_options, "dry_run": dry_run})
+        try:
+            for stage_name, stage_definition in self.definition.get("stages", {}).items():
+                _top_logger.info(f"Will execute the stage {stage_name} on {len(self._workers)} workers")
+                start_at = time.time() + self.start_delay
+                for worker, worker_stage_definition in zip(self._workers, self._split_jobs(stage_definition)):
+                    worker.connection.send({
+                        "type": "stage",
+                        "name": stage_name,
+                        "definition": worker_stage_definition,
+                        "start_at": start_at + worker.clock_offset,
+                    })
+                # stage completion barrier
+                for worker in self._workers:
+                    if worker.stages_done.get() is None:
+                        raise ConnectionError(f"Worker {worker.index} disconnected during the stage {stage_name}")
+                if self.plan_stop.is_set():
+                    print(f"Test Plan {self.name} STOPPED by the guardrail in stage {stage_name}")
+                    return
+                print(f"Stage {stage_name} COMPLETED on {len(self._workers)} workers")
+        finally:
+            for worker in self._workers:
+                try:
+                    worker.connection.send({"type": "shutdown"})
+                except Exception as e:
+                    _top_logger.debug(f"Fail to send shutdown to worker {worker.index} with exception {e}")
+            for worker in self._workers:
+                if worker.reader is not None:
+                    worker.reader.join()
+                worker.connection.close()
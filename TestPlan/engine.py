@@ -0,0 +1,142 @@
+'''
+© 2024 Daniil Sokolov <daniil.sokolov@webcloudai.com>
+MIT License
+'''
+from __future__ import annotations
+from enum import Enum
+from typing import List, Dict, Union, Tuple
+from time import perf_counter
+import threading
+import os
+from .reporter import LogRecordType
+from .collector import CollectorQueue, ResultCollector
+from .columnar import HEAVY_COLUMNS
+from .connection import ConnectionPool
+from .scheduler import Timeline
+from .ratelimit import RateLimiter
+from .guardrails import PolledStopEvent
+from .job import Job, JobExecuteOptions
+import logging
+_top_logger = logging.getLogger(__name__)
+
+
+class EngineType(Enum):
+    ''' how jobs of the stage are executed. Values to be used in Test Plan json and load_latency.py --engine '''
+    THREAD = "thread"       # one OS thread per job (pool of max_concurrency threads)
+    ASYNCIO = "asyncio"     # one coroutine per job in a single event loop (requires aiohttp)
+    PROCESS = "process"     # jobs are spread across pool of max_concurrency worker processes
+
+    @staticmethod
+    def byValue(value:str) -> EngineType:
+        for engine in EngineType:
+            if engine.value == value:
+                return engine
+        raise ValueError(f"Unknown EngineType value '{value}'")
+
+
+# options of the worker process which can't be sent from the parent process
+_worker_options:Dict = {}
+# rate limiters of the worker process by plan / stage name and share
+_worker_rate_limiters:Dict[Tuple[str, float], RateLimiter] = {}
+
+class WorkerBatchQueue:
+    '''
+    Target of the job CollectorQueues in the worker process - every put into the parent collector queue
+    (process manager proxy) is a round trip to the manager process, so messages are sent as one batch message
+    when batch_size of them are collected and at least every flush_interval (see ResultCollector._BATCH).
+    "body", "headers" and "request_headers" of the results are dropped unless heavy_fields (errors are sent as is)
+    '''
+    def __init__(self, target, batch_size:int=200, flush_interval:float=0.2, heavy_fields:bool=False):
+        self._target = target
+        self._batch_size = max(1, batch_size)
+        self._flush_interval = flush_interval
+        self._heavy_fields = heavy_fields
+        self._items:List[Tuple] = []
+        self._lock = threading.Lock()
+        # batches are sent one at a time so messages keep their order
+        self._send_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._flush_loop, name="worker-batch", daemon=True)
+        self._thread.start()
+
+    def put(self, item:Tuple, block:bool=True, timeout:Union[float, None]=None):
+        job_name, log_type, message = item
+        if not self._heavy_fields and log_type == LogRecordType.LATENCY and isinstance(message, dict):
+            message = {k:v for k,v in message.items() if k not in HEAVY_COLUMNS}
+        with self._lock:
+            self._items.append((job_name, log_type, message))
+            full = len(self._items) >= self._batch_size
+        if full:
+            self.flush()
+
+    def put_nowait(self, item:Tuple):
+        self.put(item, block=False)
+
+    def flush(self):
+        with self._send_lock:
+            with self._lock:
+                items, self._items = self._items, []
+            if len(items) > 0:
+                self._target.put((ResultCollector._BATCH, None, items))
+
+    def _flush_loop(self):
+        while not self._stop.wait(self._flush_interval):
+            self.flush()
+
+    def close(self):
+        ''' send everything collected so far and stop the flush thread '''
+        self._stop.set()
+        self._thread.join()
+        self.flush()
+
+def init_process_worker(pool_size:int):
+    ''' initializer of the worker process for the "process" engine '''
+    _worker_options["connection_pool"] = ConnectionPool(pool_size=pool_size)
+
+def worker_rate_limiters(rate_limits:List[Tuple[str, Union[dict, int, float], float]])->List[RateLimiter]:
+    ''' 
+    rate limiters of the worker process (created once per plan / stage) from (name, definition, share)
+    limiters can't be shared across processes so every worker process gets its share of the limit
+    '''
+    limiters = []
+    for owner_name, definition, share in rate_limits:
+        if (owner_name, share) not in _worker_rate_limiters:
+            _worker_rate_limiters[(owner_name, share)] = RateLimiter(owner_name, definition, share=share)
+        limiters.append(_worker_rate_limiters[(owner_name, share)])
+    return limiters
+
+def execute_job_in_process(job_name:str, job_definition:dict, dry_run:bool, options:dict, queue)->Tuple[dict, Union[float, None]]:
+    ''' 
+    execute one job in the worker process of the "process" engine
+    all job messages and the worker CPU usage record are sent in batches into the queue shared with parent-side ResultCollector
+    (all of them are in the queue when the job is completed). 
+    Returns the CPU usage of the job and the latest mark of the job timeline (started at options "timeline_anchor")
+    '''
+    batch_queue = WorkerBatchQueue(queue, heavy_fields=options.pop("heavy_fields", False))
+    job = Job(job_name, job_definition, JobExecuteOptions(
+        results_queue=CollectorQueue(batch_queue, job_name, LogRecordType.LATENCY),
+        errors_queue=CollectorQueue(batch_queue, job_name, LogRecordType.ERROR),
+        others_queue=CollectorQueue(batch_queue, job_name, LogRecordType.OTHER)
+    ))
+    try:
+        cpu_start = os.times()
+        wall_start = perf_counter()
+        rate_limiters = worker_rate_limiters(options.pop("rate_limits", []))
+        # stop events are checked before every request so they are not asked from the manager process every time
+        stop_events = [PolledStopEvent(stop_event) for stop_event in options.pop("stop_events", [])]
+        timeline = Timeline(options.pop("timeline_anchor", None))
+        job.execute(dry_run=dry_run, options={**options, **_worker_options, "timeline": timeline, "rate_limiters": rate_limiters, "stop_events": stop_events})
+        cpu_end = os.times()
+        wall = perf_counter() - wall_start
+        cpu_usage = {
+            "task": "cpu_usage",
+            "pid": os.getpid(),
+            "cpu_user_sec": cpu_end.user - cpu_start.user,
+            "cpu_system_sec": cpu_end.system - cpu_start.system,
+            "wall_sec": wall,
+            "cpu_utilization": (cpu_end.user - cpu_start.user + cpu_end.system - cpu_start.system) / wall if wall > 0 else 0.0,
+        }
+        CollectorQueue(batch_queue, job_name, LogRecordType.OTHER).put(cpu_usage)
+    finally:
+        batch_queue.close()
+    return (cpu_usage, timeline.last_mark)
@@ -0,0 +1,148 @@
+'''
+© 2024 Daniil Sokolov <daniil.sokolov@webcloudai.com>
+MIT License
+'''
+from typing import List, Dict, Union, Any, Callable
+from collections import deque
+from enum import Enum
+import bisect
+import math
+import time
+import logging
+from .reporter import LogRecordType
+from .scheduler import STOP_CHECK_SEC
+_top_logger = logging.getLogger(__name__)
+
+
+class GuardrailAction(Enum):
+    ''' what is stopped when guardrail is breached. Values to be used in Test Plan json '''
+    STOP_STAGE = "stop_stage"   # jobs of the stage are stopped and the plan continues with the next stage
+    STOP_PLAN = "stop_plan"     # running stages are stopped and no new stages are started
+
+    @staticmethod
+    def byValue(value:str):
+        for action in GuardrailAction:
+            if action.value == value:
+                return action
+        raise ValueError(f"Unknown GuardrailAction value '{value}'")
+
+
+def is_stopped(options:Union[Dict, None])->bool:
+    ''' True if the stage or the whole plan was stopped by the guardrail (see "stop_events" run option) '''
+    return options is not None and any(stop_event.is_set() for stop_event in options.get("stop_events", []))
+
+
+class PolledStopEvent:
+    '''
+    Stop event of the parent process (process manager Event proxy) as seen by the worker process.
+    Every proxy is_set() is a round trip to the manager process, so the event is polled at most every interval
+    and the cached state is returned in between (once set it stays set)
+    '''
+    def __init__(self, event, interval:float=STOP_CHECK_SEC):
+        self._event = event
+        self._interval = interval
+        self._checked = -math.inf
+        self._stopped = False
+
+    def is_set(self)->bool:
+        if not self._stopped:
+            now = time.monotonic()
+            if now - self._checked >= self._interval:
+                self._checked = now
+                self._stopped = self._event.is_set()
+        return self._stopped
+
+
+class Guardrails:
+    '''
+    "guardrails" of the Test Plan (stage can have its own ones replacing plan guardrails) evaluated on the results stream:
+
+        "max_error_rate" - max share of errors (0..1) among the last "window" requests
+
+        "max_p99_msec" - max p99 latency of the last "window" requests
+
+        "window" - number of the latest requests for error rate and p99, 100 by default
+
+        "min_requests" - error rate and p99 are checked only when window has at least this number of requests, 20 by default
+
+        "max_consecutive_failures" - max number of errors in a row
+
+        "action" - "stop_stage" (default) or "stop_plan"
+    '''
+    def __init__(self, owner_name:str, definition:dict):
+        if not isinstance(definition, dict):
+            raise ValueError(f"Guardrails of {owner_name} should be a dictionary but are {definition}")
+        self.owner_name = owner_name
+        self.max_error_rate:Union[float, None] = float(definition["max_error_rate"]) if "max_error_rate" in definition else None
+        self.max_p99:Union[float, None] = float(definition["max_p99_msec"]) if "max_p99_msec" in definition else None
+        self.max_consecutive_failures:Union[int, None] = int(definition["max_consecutive_failures"]) if "max_consecutive_failures" in definition else None
+        if self.max_error_rate is None and self.max_p99 is None and self.max_consecutive_failures is None:
+            raise ValueError(f"Guardrails of {owner_name} should have at least one of max_error_rate, max_p99_msec or max_consecutive_failures")
+        self.window = max(1, int(definition.get("window", 100)))
+        self.min_requests = max(1, min(self.window, int(definition.get("min_requests", 20))))
+        self.action = GuardrailAction.byValue(definition.get("action", GuardrailAction.STOP_STAGE.value))
+
+
+class GuardrailMonitor:
+    '''
+    Sliding window of the latest requests of the stage - fed by the ResultCollector with every result and error.
+    When any guardrail is breached the stop event of the stage or the plan (per guardrail action) is set once
+    and on_breach (if any) is called with the breach record
+    '''
+    def __init__(self, guardrails:Guardrails, stage_stop, plan_stop):
+        ''' stage_stop and plan_stop - Event-like objects (threading.Event or multiprocessing manager Event) '''
+        self.guardrails = guardrails
+        self._stop_event = plan_stop if guardrails.action == GuardrailAction.STOP_PLAN else stage_stop
+        # (is error, latency) of the latest requests and sorted latencies of the same requests for p99
+        self._window:deque = deque()
+        self._latencies:List[float] = []
+        self._errors = 0
+        self._consecutive_failures = 0
+        self.breach:Union[dict, None] = None
+        self.on_breach:Union[Callable[[dict], None], None] = None
+
+    def _add(self, is_error:bool, latency:Union[float, None]):
+        self._window.append((is_error, latency))
+        self._errors += 1 if is_error else 0
+        if latency is not None:
+            bisect.insort(self._latencies, latency)
+        if len(self._window) > self.guardrails.window:
+            dropped_error, dropped_latency = self._window.popleft()
+            self._errors -= 1 if dropped_error else 0
+            if dropped_latency is not None:
+                del self._latencies[bisect.bisect_left(self._latencies, dropped_latency)]
+        self._consecutive_failures = self._consecutive_failures + 1 if is_error else 0
+
+    def _check(self)->Union[dict, None]:
+        ''' first breached guardrail as (rule, value, threshold) dict or None '''
+        guardrails = self.guardrails
+        if guardrails.max_consecutive_failures is not None and self._consecutive_failures >= guardrails.max_consecutive_failures:
+            return {"rule": "max_consecutive_failures", "value": self._consecutive_failures, "threshold": guardrails.max_consecutive_failures}
+        if len(self._window) < guardrails.min_requests:
+            return None
+        if guardrails.max_error_rate is not None and self._errors / len(self._window) > guardrails.max_error_rate:
+            return {"rule": "max_error_rate", "value": self._errors / len(self._window), "threshold": guardrails.max_error_rate}
+        if guardrails.max_p99 is not None and len(self._latencies) >= guardrails.min_requests:
+            p99 = self._latencies[min(len(self._latencies) - 1, math.ceil(0.99 * len(self._latencies)) - 1)]
+            if p99 > guardrails.max_p99:
+                return {"rule": "max_p99_msec", "value": p99, "threshold": guardrails.max_p99}
+        return None
+
+    def observe(self, log_type:LogRecordType, message:Any)->Union[dict, None]:
+        '''
+        account result or error message of the request
+        returns the breach record (to be reported as OTHER record) when guardrail is breached for the first time
+        '''
+        if self.breach is not None or log_type == LogRecordType.OTHER:
+            return None
+        latency = message.get("latency", None) if isinstance(message, dict) else None
+        self._add(log_type == LogRecordType.ERROR, float(latency) if isinstance(latency, (int, float)) else None)
+        breach = self._check()
+        if breach is None:
+            return None
+        self.breach = {"task": "guardrail", **breach, "action": self.guardrails.action.value, "window": len(self._window)}
+        _top_logger.error(f"Guardrail {breach['rule']} of {self.guardrails.owner_name} is breached ({breach['value']} vs {breach['threshold']}). Will {self.guardrails.action.value}")
+        self._stop_event.set()
+        if self.on_breach is not None:
+            self.on_breach(self.breach)
+        return self.breach
@@ -0,0 +1,216 @@
+'''
+© 2024 Daniil Sokolov <daniil.sokolov@webcloudai.com>
+MIT License
+'''
+from typing import List, Dict, Union, Tuple, Iterator
+import base64
+import math
+import time
+import zlib
+from .reporter import Reporter, LogRecord, LogRecordType
+import logging
+_top_logger = logging.getLogger(__name__)
+
+# data key of the OTHER record with the serialized histogram (see ResultCollector)
+HISTOGRAM_FIELD = "latency_histogram"
+
+# "latency_histograms" settings used when the plan has just true
+DEFAULT_HISTOGRAMS = {
+    "significant_digits": 2,    # relative error of recorded values is below 10^-significant_digits
+    "resolution_msec": 0.001,   # smallest distinguishable latency
+    "interval_sec": 60,         # histograms are reported (and started over) every interval so long runs don't lose them on crash
+    "raw_records": True,        # false - latency records are not stored, only histograms (errors are stored as usual)
+}
+
+
+def histogram_settings(definition:Union[dict, bool, None])->Union[dict, None]:
+    ''' plan "latency_histograms" definition into the settings (None - histograms are not recorded) '''
+    if definition is None or definition is False:
+        return None
+    if definition is True:
+        return dict(DEFAULT_HISTOGRAMS)
+    if isinstance(definition, dict):
+        return {**DEFAULT_HISTOGRAMS, **definition}
+    raise ValueError(f"Incorrect latency_histograms definition {definition}")
+
+
+class LatencyHistogram:
+    '''
+    High dynamic range histogram of latencies (msec) with constant memory and fixed relative error.
+    Values are counted in log-linear buckets - every power of 2 range of values (in resolution units)
+    is split into the same number of linear sub-buckets (2^ceil(log2(2 * 10^significant_digits)) / 2),
+    so value of any bucket is known with relative error below 10^-significant_digits.
+    Only not empty buckets are kept. Count, sum, min and max are exact.
+
+    Histograms with the same significant_digits and resolution can be merged (jobs, processes, workers and runs)
+    '''
+    def __init__(self, significant_digits:int=2, resolution_msec:float=0.001):
+        if not 1 <= int(significant_digits) <= 5:
+            raise ValueError(f"Histogram significant_digits should be 1..5 but is {significant_digits}")
+        self.significant_digits = int(significant_digits)
+        self.resolution = float(resolution_msec)
+        # sub-buckets of every bucket above the first one
+        self._magnitude = math.ceil(math.log2(2 * 10 ** self.significant_digits)) - 1
+        self._half = 1 << self._magnitude
+        self.counts:Dict[int, int] = {}
+        self.count = 0
+        self.sum = 0.0
+        self.sum_squares = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def _index(self, units:int)->int:
+        ''' bucket index of the value in resolution units '''
+        bucket = max(0, units.bit_length() - self._magnitude - 1)
+        return (bucket << self._magnitude) + (units >> bucket)
+
+    def _range(self, index:int)->Tuple[float, float]:
+        ''' lowest and highest values (msec) of the bucket '''
+        bucket = max(0, (index >> self._magnitude) - 1)
+        sub_bucket = index - (bucket << self._magnitude)
+        return ((sub_bucket << bucket) * self.resolution, (((sub_bucket + 1) << bucket) - 1) * self.resolution)
+
+    def record(self, value:float, count:int=1):
+        ''' count value (msec) '''
+        value = max(0.0, float(value))
+        index = self._index(int(round(value / self.resolution)))
+        self.counts[index] = self.counts.get(index, 0) + count
+        self.count += count
+        self.sum += value * count
+        self.sum_squares += value * value * count
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other:"LatencyHistogram"):
+        ''' add all values of the other histogram '''
+        if other.significant_digits != self.significant_digits or other.resolution != self.resolution:
+            raise ValueError(f"Histograms with different significant_digits or resolution can't be merged")
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.sum += other.sum
+        self.sum_squares += other.sum_squares
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def mean(self)->Union[float, None]:
+        return self.sum / self.count if self.count > 0 else None
+
+    def stddev(self)->Union[float, None]:
+        ''' sample standard deviation '''
+        if self.count == 0:
+            return None
+        if self.count == 1:
+            return 0.0
+        return math.sqrt(max(0.0, (self.sum_squares - self.sum * self.sum / self.count) / (self.count - 1)))
+
+    def percentile(self, quantile:float)->Union[float, None]:
+        ''' value (middle of the bucket, within min and max) of the rank ceil(quantile * count) '''
+        if self.count == 0:
+            return None
+        rank = min(self.count, max(1, math.ceil(quantile * self.count)))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                lowest, highest = self._range(index)
+                return min(self.max, max(self.min, (lowest + highest) / 2))
+        return self.max
+
+    def to_dict(self)->dict:
+        '''
+        compact json-serializable form - bucket counts are (index delta, count) varints compressed and base64 encoded
+        '''
+        encoded = bytearray()
+        previous = 0
+        for index in sorted(self.counts):
+            _write_varint(encoded, index - previous)
+            _write_varint(encoded, self.counts[index])
+            previous = index
+        return {
+            "significant_digits": self.significant_digits,
+            "resolution_msec": self.resolution,
+            "count": self.count,
+            "sum": self.sum,
+            "sum_squares": self.sum_squares,
+            "min": self.min if self.count > 0 else None,
+            "max": self.max if self.count > 0 else None,
+            "counts": base64.b64encode(zlib.compress(bytes(encoded))).decode("ascii"),
+        }
+
+    @staticmethod
+    def from_dict(definition:dict)->"LatencyHistogram":
+        ''' '''
+        histogram = LatencyHistogram(definition["significant_digits"], definition["resolution_msec"])
+        encoded = zlib.decompress(base64.b64decode(definition["counts"]))
+        position = 0
+        index = 0
+        while position < len(encoded):
+            delta, position = _read_varint(encoded, position)
+            count, position = _read_varint(encoded, position)
+            index += delta
+            histogram.counts[index] = count
+        histogram.count = int(definition["count"])
+        histogram.sum = float(definition["sum"])
+        histogram.sum_squares = float(definition["sum_squares"])
+        histogram.min = definition["min"] if definition["min"] is not None else math.inf
+        histogram.max = definition["max"] if definition["max"] is not None else -math.inf
+        return histogram
+
+
+def _write_varint(target:bytearray, value:int):
+    while value >= 0x80:
+        target.append((value & 0x7F) | 0x80)
+        value >>= 7
+    target.append(value)
+
+def _read_varint(source:bytes, position:int)->Tuple[int, int]:
+    value = 0
+    shift = 0
+    while True:
+        byte = source[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return (value, position)
+        shift += 7
+
+
+class LatencyHistograms:
+    ''' histograms of the stage per task - fed by the ResultCollector, reported as OTHER records every interval_sec '''
+    def __init__(self, settings:dict):
+        self.settings = settings
+        self.raw_records = bool(settings.get("raw_records", True))
+        self.interval = float(settings.get("interval_sec", DEFAULT_HISTOGRAMS["interval_sec"]))
+        self._histograms:Dict[str, LatencyHistogram] = {}
+        self._interval_start = time.time()
+
+    def record(self, task:str, latency:float):
+        histogram = self._histograms.get(task, None)
+        if histogram is None:
+            histogram = self._histograms[task] = LatencyHistogram(self.settings["significant_digits"], self.settings["resolution_msec"])
+        histogram.record(latency)
+
+    def is_due(self)->bool:
+        return time.time() - self._interval_start >= self.interval
+
+    def take(self)->List[dict]:
+        ''' OTHER records data of the interval (one per task) - histograms are started over '''
+        interval_end = time.time()
+        result = [
+            {"task": task, HISTOGRAM_FIELD: histogram.to_dict(), "interval_start": self._interval_start, "interval_end": interval_end}
+                for task, histogram in self._histograms.items() if histogram.count > 0
+        ]
+        self._histograms = {}
+        self._interval_start = interval_end
+        return result
+
+
+def iter_histograms(source:Reporter, filters:Union[Dict, None]=None)->Iterator[Tuple[LogRecord, LatencyHistogram]]:
+    ''' (OTHER record, its histogram) of all reported histograms - histograms of the same stage and task are to be merged '''
+    for one_rec in source.iter_records(LogRecordType.OTHER, filters):
+        if isinstance(one_rec.data, dict) and HISTOGRAM_FIELD in one_rec.data:
+            try:
+                yield (one_rec, LatencyHistogram.from_dict(one_rec.data[HISTOGRAM_FIELD]))
+            except Exception as e:
+                _top_logger.error(f"Fail to read latency histogram of {one_rec.stage} {one_rec.task} with exception {e}")
@@ -2,8 +2,10 @@
 © 2024 Daniil Sokolov <daniil.sokolov@webcloudai.com>
 MIT License
 '''
-from .task import Task, TaskFactory, TaskType
-from typing import List, Dict, Union
+from .task import Task, TaskFactory, TaskType, TaskWait
+from .repeat import Repeat, RepeatQueue
+from .guardrails import is_stopped
+from typing import List, Dict, Union, Iterator, Tuple
 from dataclasses import dataclass
 from queue import Queue
 from .common import clean_name
@@ -15,12 +17,12 @@ class JobExecuteOptions:
     ''' '''
     results_queue:Queue
     errors_queue:Queue
+    others_queue:Union[Queue, None] = None
 
 class Job:
     ''' '''
     name:str = ""
     definition:dict = {}
-    tasks:Dict[str, Task] = {}
     options:JobExecuteOptions
 
     def __init__(self, job_name:str, job_definition:dict, job_options:JobExecuteOptions):
@@ -28,25 +30,129 @@ class Job:
         self.name = job_name
         self.definition = {clean_name(task_name):v for task_name,v in job_definition.items()}
         self.options:JobExecuteOptions = job_options
-        # we need to create underlying Tasks first
-        task_factory = TaskFactory()
+        self._task_factory = TaskFactory()
 
-        self.tasks = {task_name:task_factory.create(
-                            task_type=task_def.get("TASK_TYPE", task_name) if isinstance(task_def, dict) else task_name,
-                            task_name=task_name, task_definition=task_def, 
-                            result_queue=self.options.results_queue,
-                            error_queue=self.options.errors_queue) 
-                        for task_name,task_def in self.definition.get("tasks", {}).items()}
+    def _create_task(self, task_name:str, task_def, job_options:JobExecuteOptions)->Task:
+        ''' Tasks are created right before the execution and released right after, so memory used by the job doesn't depend on the number of tasks '''
+        return self._task_factory.create(
+                    task_type=task_def.get("TASK_TYPE", task_name) if isinstance(task_def, dict) else task_name,
+                    task_name=task_name, task_definition=task_def, 
+                    result_queue=job_options.results_queue,
+                    error_queue=job_options.errors_queue,
+                    other_queue=job_options.others_queue)
 
-    def execute(self, dry_run:bool=False):
-        ''' '''
-        # we'll just execute Tasks one-by-one
-        for task_name,task in self.tasks.items():
-            _top_logger.debug(f"Executing task {task_name}")
+    def _report_failure(self, task_name:str, e:Exception, job_options:JobExecuteOptions):
+        message = f"FAIL to execute task {self.name} with exception {e}"
+        _top_logger.error(message)
+        job_options.errors_queue.put_nowait({"message": message, "task": task_name})
+
+    @staticmethod
+    def _repeat_task(task_def)->Union[dict, None]:
+        return task_def.get("repeat", None) if isinstance(task_def, dict) else None
+
+    def _iterations(self, repeat:Repeat, dry_run:bool, job_options:JobExecuteOptions, 
+                    options:Union[Dict, None])->Iterator[Tuple[JobExecuteOptions, Union[TaskWait, None], RepeatQueue]]:
+        ''' (iteration options, wait task before the iteration, iteration errors queue) for every repeat iteration till the stage is stopped '''
+        for iteration, wait_seconds in repeat.iterations(dry_run):
+            if is_stopped(options):
+                return
+            results_queue, errors_queue, others_queue = repeat.queues(iteration, wait_seconds, 
+                                                                      job_options.results_queue, job_options.errors_queue, job_options.others_queue)
+            iteration_options = JobExecuteOptions(results_queue=results_queue, errors_queue=errors_queue, others_queue=others_queue)
+            wait_task = None
+            if iteration > 0 and wait_seconds > 0:
+                wait_task = TaskWait(f"{repeat.owner_name}_repeat_wait_msec", wait_seconds*1000, results_queue, errors_queue, others_queue)
+            yield (iteration_options, wait_task, errors_queue)
+
+    def _run_task(self, task_name:str, task_def, job_options:JobExecuteOptions, dry_run:bool, options:Union[Dict, None]):
+        ''' create and execute one task - creation or execution failure is reported as the task error '''
+        if is_stopped(options):
+            return
+        _top_logger.debug(f"Executing task {task_name}")
+        try:
+            self._create_task(task_name, task_def, job_options).execute(dry_run=dry_run, options=options)
+        except Exception as e:
+            self._report_failure(task_name, e, job_options)
+        _top_logger.debug(f"Task {task_name} completed")
+
+    def _run_tasks(self, job_options:JobExecuteOptions, dry_run:bool, options:Union[Dict, None]):
+        ''' execute all tasks one-by-one (tasks with "repeat" are executed till the repeat is over) '''
+        for task_name,task_def in self.definition.get("tasks", {}).items():
+            repeat_def = self._repeat_task(task_def)
+            if repeat_def is None:
+                self._run_task(task_name, task_def, job_options, dry_run, options)
+                continue
             try:
-                task.execute(dry_run=dry_run)
+                repeat = Repeat(task_name, repeat_def)
+                for iteration_options, wait_task, errors_queue in self._iterations(repeat, dry_run, job_options, options):
+                    if wait_task is not None:
+                        wait_task.execute(dry_run=dry_run, options=options)
+                    self._run_task(task_name, task_def, iteration_options, dry_run, options)
+                    if repeat.until_reached(errors_queue):
+                        break
             except Exception as e:
-                message = f"FAIL to execute task {self.name} with exception {e}"
-                _top_logger.error(message)
-                self.options.errors_queue.put_nowait({"message": message, "task": task_name})
-            _top_logger.debug(f"Task {task_name} completed")
+                self._report_failure(task_name, e, job_options)
+
+    def execute(self, dry_run:bool=False, options:Union[Dict, None]=None):
+        ''' options are passed to every task as is '''
+        repeat_def = self.definition.get("repeat", None)
+        if repeat_def is None:
+            # we'll just execute Tasks one-by-one
+            self._run_tasks(self.options, dry_run, options)
+            return
+        try:
+            repeat = Repeat(self.name, repeat_def)
+            for iteration_options, wait_task, errors_queue in self._iterations(repeat, dry_run, self.options, options):
+                if wait_task is not None:
+                    wait_task.execute(dry_run=dry_run, options=options)
+                self._run_tasks(iteration_options, dry_run, options)
+                if repeat.until_reached(errors_queue):
+                    break
+        except Exception as e:
+            self._report_failure("repeat", e, self.options)
+
+    async def _run_task_async(self, task_name:str, task_def, job_options:JobExecuteOptions, dry_run:bool, options:Union[Dict, None]):
+        ''' asyncio engine version of _run_task '''
+        if is_stopped(options):
+            return
+        _top_logger.debug(f"Executing task {task_name}")
+        try:
+            await self._create_task(task_name, task_def, job_options).execute_async(dry_run=dry_run, options=options)
+        except Exception as e:
+            self._report_failure(task_name, e, job_options)
+        _top_logger.debug(f"Task {task_name} completed")
+
+    async def _run_tasks_async(self, job_options:JobExecuteOptions, dry_run:bool, options:Union[Dict, None]):
+        ''' asyncio engine version of _run_tasks '''
+        for task_name,task_def in self.definition.get("tasks", {}).items():
+            repeat_def = self._repeat_task(task_def)
+            if repeat_def is None:
+                await self._run_task_async(task_name, task_def, job_options, dry_run, options)
+                continue
+            try:
+                repeat = Repeat(task_name, repeat_def)
+                for iteration_options, wait_task, errors_queue in self._iterations(repeat, dry_run, job_options, options):
+                    if wait_task is not None:
+                        await wait_task.execute_async(dry_run=dry_run, options=options)
+                    await self._run_task_async(task_name, task_def, iteration_options, dry_run, options)
+                    if repeat.until_reached(errors_queue):
+                        break
+            except Exception as e:
+                self._report_failure(task_name, e, job_options)
+
+    async def execute_async(self, dry_run:bool=False, options:Union[Dict, None]=None):
+        ''' asyncio engine version of execute '''
+        repeat_def = self.definition.get("repeat", None)
+        if repeat_def is None:
+            await self._run_tasks_async(self.options, dry_run, options)
+            return
+        try:
+            repeat = Repeat(self.name, repeat_def)
+            for iteration_options, wait_task, errors_queue in self._iterations(repeat, dry_run, self.options, options):
+                if wait_task is not None:
+                    await wait_task.execute_async(dry_run=dry_run, options=options)
+                await self._run_tasks_async(iteration_options, dry_run, options)
+                if repeat.until_reached(errors_queue):
+                    break
+        except Exception as e:
+            self._report_failure("repeat", e, self.options)
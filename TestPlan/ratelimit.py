@@ -0,0 +1,82 @@
+'''
+© 2024 Daniil Sokolov <daniil.sokolov@webcloudai.com>
+MIT License
+'''
+from typing import List, Dict, Union
+from urllib.parse import urlsplit
+from time import perf_counter
+import threading
+import logging
+_top_logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    '''
+    Token bucket of rps tokens per second with up to burst tokens available at once.
+    Implemented as GCRA (generic cell rate algorithm) - the only state is the theoretical arrival time
+    of the next request, so taking a token is one short critical section without any refill bookkeeping
+    '''
+    def __init__(self, rps:float, burst:int=1):
+        if rps <= 0:
+            raise ValueError(f"Rate limit should be positive but is {rps}")
+        self.rps = rps
+        self.burst = max(1, int(burst))
+        self._interval = 1.0 / rps
+        self._tolerance = self._interval * (self.burst - 1)
+        self._tat:Union[float, None] = None
+        self._lock = threading.Lock()
+
+    def reserve(self)->float:
+        ''' take the token - returns perf_counter() moment when the request can be sent (now or in the future) '''
+        with self._lock:
+            now = perf_counter()
+            tat = now if self._tat is None or self._tat < now else self._tat
+            self._tat = tat + self._interval
+        return max(now, tat - self._tolerance)
+
+
+class RateLimiter:
+    '''
+    "rate_limit" of the Test Plan or stage shared by all request tasks:
+
+        number - max requests per second
+
+        {"rps": .., "burst": .., "hosts": {<host>: <rps> | {"rps": .., "burst": ..}}}
+            rps - max requests per second of all requests (optional if hosts are provided)
+            burst - number of requests which can be sent at once, 1 by default
+            hosts - separate limits for requests to the host (in addition to the rps)
+
+    share - part of the limit used by this process (the "process" engine splits limits across worker processes)
+    '''
+    def __init__(self, owner_name:str, definition:Union[dict, int, float], share:float=1.0):
+        self.owner_name = owner_name
+        self.definition = definition
+        definition = {"rps": definition} if isinstance(definition, (int, float)) else definition
+        if not isinstance(definition, dict):
+            raise ValueError(f"Rate limit of {owner_name} should be a number or a dictionary but is {definition}")
+        self._bucket = self._create_bucket(definition, share) if "rps" in definition else None
+        self._hosts:Dict[str, TokenBucket] = {
+            host: self._create_bucket({"rps": host_limit} if isinstance(host_limit, (int, float)) else host_limit, share)
+                for host, host_limit in definition.get("hosts", {}).items()
+        }
+        if self._bucket is None and len(self._hosts) == 0:
+            raise ValueError(f"Rate limit of {owner_name} should have rps or hosts")
+
+    def _create_bucket(self, definition:dict, share:float)->TokenBucket:
+        return TokenBucket(float(definition["rps"]) * share, round(int(definition.get("burst", 1)) * share))
+
+    def reserve(self, url:str)->float:
+        ''' take tokens for the request to url - returns perf_counter() moment when the request can be sent '''
+        send_at = 0.0
+        if self._bucket is not None:
+            send_at = self._bucket.reserve()
+        if len(self._hosts) > 0:
+            host_bucket = self._hosts.get(urlsplit(url).hostname or "", None)
+            if host_bucket is not None:
+                send_at = max(send_at, host_bucket.reserve())
+        return send_at
+
+
+def reserve_all(rate_limiters:List[RateLimiter], url:str)->float:
+    ''' perf_counter() moment when the request to url is allowed by all limiters (plan and stage) '''
+    return max((limiter.reserve(url) for limiter in rate_limiters), default=0.0)
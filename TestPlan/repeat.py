@@ -0,0 +1,129 @@
+'''
+© 2024 Daniil Sokolov <daniil.sokolov@webcloudai.com>
+MIT License
+'''
+from typing import Union, Generator, Tuple, Any
+from queue import Queue
+from time import perf_counter
+import itertools
+import random
+import logging
+_top_logger = logging.getLogger(__name__)
+
+
+class RepeatQueue:
+    ''' Queue-like wrapper adding repeat iteration fields to every message and counting messages '''
+    def __init__(self, target:Queue, tags:dict):
+        self._target = target
+        self._tags = tags
+        self.count = 0
+
+    def _tagged(self, item:Any)->Any:
+        self.count += 1
+        return {**item, **self._tags} if isinstance(item, dict) else item
+
+    def put(self, item:Any, block:bool=True, timeout:Union[float, None]=None):
+        self._target.put(self._tagged(item), block, timeout)
+
+    def put_nowait(self, item:Any):
+        self._target.put_nowait(self._tagged(item))
+
+
+class Repeat:
+    '''
+    "repeat" construct of the job or task definition - job tasks (or the task) are executed again and again:
+
+        "count" - number of iterations
+
+        "duration_sec" - keep repeating till the duration (from the first iteration start) is over
+
+        "until" - "error" (stop after the iteration with an error) or "success" (stop after the iteration without errors)
+
+        "wait_sec" or "wait_msec" - wait before every iteration except the first one, one of
+            number - the same wait every time
+            list - waits are taken one-by-one (and from the start again when list is over)
+            {"distribution": "uniform", "min": .., "max": ..} | {"distribution": "exponential", "mean": ..} |
+            {"distribution": "normal", "mean": .., "stddev": ..}
+
+        "seed" - random seed for the wait distribution (optional)
+
+    At least one of count, duration_sec or until is required (if several are provided repeat stops at the first reached).
+    Every result is tagged with repeat_iteration and repeat_wait (msec)
+    '''
+    def __init__(self, owner_name:str, definition:dict):
+        ''' owner_name - name of the job or task (used for the wait task and messages) '''
+        if not isinstance(definition, dict):
+            raise ValueError(f"Repeat of {owner_name} should be a dictionary but is {definition}")
+        self.owner_name = owner_name
+        self.count:Union[int, None] = int(definition["count"]) if "count" in definition else None
+        self.duration:Union[float, None] = float(definition["duration_sec"]) if "duration_sec" in definition else None
+        self.until:Union[str, None] = definition.get("until", None)
+        if self.count is None and self.duration is None and self.until is None:
+            raise ValueError(f"Repeat of {owner_name} should have at least one of count, duration_sec or until")
+        if self.until not in (None, "error", "success"):
+            raise ValueError(f"Unknown repeat until '{self.until}' of {owner_name}")
+        self._wait_scale = 1.0 if "wait_sec" in definition else 0.001
+        self._wait = definition.get("wait_sec", definition.get("wait_msec", 0))
+        self._rand = random.Random(definition.get("seed", None))
+
+    def _waits(self)->Generator[float, None, None]:
+        ''' waits (sec) before the second, third, etc. iterations '''
+        if isinstance(self._wait, (int, float)):
+            waits = itertools.repeat(float(self._wait))
+        elif isinstance(self._wait, list) and len(self._wait) > 0:
+            waits = itertools.cycle([float(one_wait) for one_wait in self._wait])
+        elif isinstance(self._wait, dict):
+            waits = self._distribution(self._wait)
+        else:
+            raise ValueError(f"Incorrect repeat wait {self._wait} of {self.owner_name}")
+        for one_wait in waits:
+            yield max(0.0, one_wait) * self._wait_scale
+
+    def _distribution(self, wait:dict)->Generator[float, None, None]:
+        distribution = wait.get("distribution", None)
+        while True:
+            match distribution:
+                case "uniform":
+                    yield self._rand.uniform(float(wait["min"]), float(wait["max"]))
+                case "exponential":
+                    yield self._rand.expovariate(1 / float(wait["mean"]))
+                case "normal":
+                    yield self._rand.gauss(float(wait["mean"]), float(wait["stddev"]))
+                case _:
+                    raise ValueError(f"Unknown repeat wait distribution '{distribution}' of {self.owner_name}")
+
+    def iterations(self, dry_run:bool)->Generator[Tuple[int, float], None, None]:
+        '''
+        (iteration, wait before the iteration in sec) till count or duration is reached
+        dry run has a single iteration unless count is provided
+        '''
+        waits = self._waits()
+        start = perf_counter()
+        for iteration in itertools.count():
+            if self.count is not None and iteration >= self.count:
+                return
+            if dry_run and self.count is None and iteration > 0:
+                return
+            wait_seconds = next(waits) if iteration > 0 else 0.0
+            if self.duration is not None and iteration > 0 and perf_counter() - start + wait_seconds >= self.duration:
+                return
+            yield (iteration, wait_seconds)
+
+    def queues(self, iteration:int, wait_seconds:float,
+               results_queue:Queue, errors_queue:Queue, others_queue:Union[Queue, None])->Tuple[RepeatQueue, RepeatQueue, Union[RepeatQueue, None]]:
+        ''' iteration queues tagging all messages '''
+        tags = {"repeat_iteration": iteration, "repeat_wait": wait_seconds * 1000}
+        return (
+            RepeatQueue(results_queue, tags),
+            RepeatQueue(errors_queue, tags),
+            RepeatQueue(others_queue, tags) if others_queue is not None else None,
+        )
+
+    def until_reached(self, errors_queue:RepeatQueue)->bool:
+        ''' check until condition after the iteration '''
+        match self.until:
+            case "error":
+                return errors_queue.count > 0
+            case "success":
+                return errors_queue.count == 0
+        return False
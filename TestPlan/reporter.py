@@ -5,16 +5,27 @@ MIT License
 from abc import ABC, abstractmethod
 import dataclasses
 from enum import Enum
-from typing import List, Union, Tuple, Sequence
+from typing import List, Dict, Set, Union, Tuple, Iterator, Any
 from pathlib import Path
+from queue import Queue, Empty
+import threading
+import atexit
+import gzip
+import time
 import os
 from uuid import uuid4
+from array import array
 import json
 import datetime
-import openpyxl
+from .xlsx import XlsxSheetWriter, EXCEL_MAX_ROWS
+from .warmup import warmup_settings, warmup_positions, WARMUP_FIELDS
 import logging
 _top_logger = logging.getLogger(__name__)
 
+SEGMENT_SUFFIX = ".jsonl"
+# record id of the segment record is <segment path>#<line number>
+SEGMENT_LINE_SEPARATOR = "#"
+
 class LogRecordType(Enum):
     ERROR = "error"
     LATENCY = "latency"
@@ -37,6 +48,26 @@ class LogRecord:
             "data": self.data
         }
 
+# record filters of iter_records / get_columns (record "timestamp" is "place_timestamp" of the request):
+#   {"stage": <name or list of names>, "job": .., "task": .., "timestamp_from": .., "timestamp_to": ..}
+RECORD_FILTERS = ("stage", "job", "task", "timestamp_from", "timestamp_to")
+
+def record_matches(record:LogRecord, filters:Union[Dict, None])->bool:
+    ''' True if the record matches all filters '''
+    for name, value in (filters or {}).items():
+        if name in ("stage", "job", "task"):
+            if getattr(record, name) not in ([value] if isinstance(value, str) else value):
+                return False
+        elif name in ("timestamp_from", "timestamp_to"):
+            timestamp = record.data.get("place_timestamp", None) if isinstance(record.data, dict) else None
+            if not isinstance(timestamp, (int, float)):
+                return False
+            if (name == "timestamp_from" and timestamp < value) or (name == "timestamp_to" and timestamp >= value):
+                return False
+        else:
+            raise ValueError(f"Unknown records filter '{name}'")
+    return True
+
 class Reporter(ABC):
     ''' '''
     def __init__(self, reporter_options:dict):
@@ -58,13 +89,117 @@ class Reporter(ABC):
     def get_one(self, record_id)->LogRecord:
         ''' '''
 
+    def iter_records(self, record_type:LogRecordType, filters:Union[Dict, None]=None)->Iterator[LogRecord]:
+        ''' 
+        records matching filters (see RECORD_FILTERS) one-by-one.
+        Reporters override it to read records from the storage as they are consumed instead of building the whole list
+        '''
+        for one_rec in self.get_all(record_type):
+            if record_matches(one_rec, filters):
+                yield one_rec
+
+    def get_columns(self, record_type:LogRecordType, columns:List[str], filters:Union[Dict, None]=None)->Dict[str, List[Any]]:
+        ''' 
+        values of the requested fields of records matching filters - "stage", "job", "task" or record data fields (None if missing).
+        Reporters with columnar storage read only requested fields (see TestPlan/columnar.py)
+        '''
+        result:Dict[str, List[Any]] = {name: [] for name in columns}
+        for one_rec in self.iter_records(record_type, filters):
+            data = one_rec.data if isinstance(one_rec.data, dict) else {}
+            for name in columns:
+                result[name].append(getattr(one_rec, name) if name in ("stage", "job", "task") else data.get(name, None))
+        return result
+
+    def drop_records(self, stage:str, job_names:List[str]):
+        ''' 
+        remove stored records of the jobs of the stage - records of the jobs interrupted by the stopped run
+        are dropped before the jobs are executed again on resume (see Stage._drop_interrupted_jobs)
+        '''
+        raise NotImplementedError(f"{type(self).__name__} can't drop stored records")
+
+    def flush(self):
+        ''' store all buffered records (reporter without buffers has nothing to do) '''
+
+    def close(self):
+        ''' flush and release resources - reporter can't be used to add records after close '''
+        self.flush()
+
+
+class _SegmentWriter:
+    '''
+    Append-only JSON-lines segment files of one folder. New segment is started when the current one
+    is larger than max_bytes or older than max_sec
+    '''
+    def __init__(self, folder:Path, compression:Union[str, None], max_bytes:int, max_sec:float):
+        self._folder = folder
+        self._compression = compression
+        self._max_bytes = max_bytes
+        self._max_sec = max_sec
+        self._file = None
+        self._opened = 0.0
+        self._written = 0
+        # segments of several reporters (and runs) in the same folder must not collide
+        self._prefix = f"segment-{datetime.datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid4().hex[:8]}"
+        self._seq = 0
+
+    def _open(self):
+        self._seq += 1
+        path = self._folder / f"{self._prefix}-{self._seq:05}{SEGMENT_SUFFIX}{'.gz' if self._compression == 'gzip' else ''}"
+        self._file = gzip.open(path, "wb") if self._compression == "gzip" else open(path, "wb")
+        self._opened = time.monotonic()
+        self._written = 0
+
+    def write(self, lines:List[bytes]):
+        if self._file is None or self._written >= self._max_bytes or time.monotonic() - self._opened >= self._max_sec:
+            self.close()
+            self._open()
+        data = b"".join(lines)
+        self._file.write(data)
+        self._written += len(data)
+
+    def rotate_if_old(self):
+        if self._file is not None and time.monotonic() - self._opened >= self._max_sec:
+            self.close()
+
+    def flush(self):
+        ''' written lines are visible to readers (gzip stream is sync-flushed so it can be read up to here) '''
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
 
 class ReporterJsonRecords(Reporter):
-    ''' '''
+    '''
+    Records are stored as append-only JSON-lines segment files (one folder per record type).
+    add / add_bunch only put records into the bounded buffer, dedicated flush thread writes them to segments
+    (so add_bunch blocks only when the writer can't keep up with the buffer full).
+    Records are read by scanning segments sequentially (one record per file json of older versions is read as well)
+
+    reporter_options keys in addition to folders:
+
+        compression - "gzip" or None (default)
+
+        segment_max_mb - size of the segment before the new one is started, default 64
+
+        segment_max_sec - age of the segment before the new one is started, default 300
+
+        buffer_batches - max number of add_bunch calls waiting for the flush thread, default 100
+
+        flush_interval - max time (sec) records are kept in the buffer, default 0.5
+    '''
+    # buffer item which makes flush thread write everything and set the event
+    _FLUSH = "flush"
+    _STOP = "stop"
+
     def __init__(self, reporter_options:dict):
         ''' '''
         self._local_logs_folder = Path(reporter_options.get("logs_folder", "log_records"))
         self._local_errs_folder = Path(reporter_options.get("errs_folder", "log_errors"))
+        self._local_others_folder = Path(reporter_options.get("others_folder", self._local_logs_folder.parent / "log_others"))
         self._options = reporter_options
         try:
             os.mkdir(self._local_logs_folder)
@@ -78,15 +213,108 @@ class ReporterJsonRecords(Reporter):
             pass
         except Exception as e:
             _top_logger.error(f"Fail to create log errors folder with exception {e}")
+        try:
+            os.mkdir(self._local_others_folder)
+        except FileExistsError:
+            pass
+        except Exception as e:
+            _top_logger.error(f"Fail to create log others folder with exception {e}")
+        compression = reporter_options.get("compression", None)
+        if compression not in (None, "gzip"):
+            raise ValueError(f"Unknown segment compression '{compression}'")
+        max_bytes = int(float(reporter_options.get("segment_max_mb", 64)) * 1024 * 1024)
+        max_sec = float(reporter_options.get("segment_max_sec", 300))
+        self._writers:Dict[LogRecordType, _SegmentWriter] = {
+            record_type: _SegmentWriter(self._get_source_folder(record_type), compression, max_bytes, max_sec)
+                for record_type in LogRecordType
+        }
+        self._flush_interval = float(reporter_options.get("flush_interval", 0.5))
+        self._buffer:Queue = Queue(maxsize=max(1, int(reporter_options.get("buffer_batches", 100))))
+        self._thread:Union[threading.Thread, None] = None
+        self._thread_lock = threading.Lock()
+
+    def _start(self):
+        ''' flush thread is started with the first record '''
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._flush_loop, name="reporter-flush", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
 
     def add(self, record:LogRecord):
         ''' '''
-        folder = self._local_errs_folder if record.logType == LogRecordType.ERROR else self._local_logs_folder
-        with open(folder / f"{str(uuid4())}.json", "w") as f:
-            json.dump(record.as_dict(), f)
+        self.add_bunch([record])
 
     def add_bunch(self, records:List[LogRecord]):
-        ''' '''
+        ''' records are written by the flush thread (blocks if the buffer is full) '''
+        if len(records) == 0:
+            return
+        if self._thread is None:
+            self._start()
+        self._buffer.put(list(records))
+
+    def _write(self, records:List[LogRecord]):
+        ''' record which can't be serialized is logged and skipped (the rest of the batch is written) '''
+        lines:Dict[LogRecordType, List[bytes]] = {}
+        for one_rec in records:
+            try:
+                record_type = one_rec.logType if isinstance(one_rec.logType, LogRecordType) else LogRecordType(one_rec.logType)
+                line = json.dumps(one_rec.as_dict()).encode("utf-8") + b"\n"
+            except Exception as e:
+                _top_logger.error(f"Fail to serialize record of stage {one_rec.stage} job {one_rec.job} task {one_rec.task} with exception {e}")
+                continue
+            lines.setdefault(record_type, []).append(line)
+        for record_type, type_lines in lines.items():
+            self._writers[record_type].write(type_lines)
+
+    def _flush_loop(self):
+        ''' flush thread body - writes buffered records and makes them visible to readers at least every flush_interval '''
+        flushed = time.monotonic()
+        while True:
+            try:
+                item = self._buffer.get(timeout=max(0.0, flushed + self._flush_interval - time.monotonic()))
+            except Empty:
+                item = None
+            try:
+                if isinstance(item, list):
+                    self._write(item)
+                # files are flushed on time even if the buffer is never empty
+                if not isinstance(item, list) or time.monotonic() - flushed >= self._flush_interval:
+                    for writer in self._writers.values():
+                        writer.flush()
+                        writer.rotate_if_old()
+                    flushed = time.monotonic()
+            except Exception as e:
+                _top_logger.error(f"Fail to write records with exception {e}")
+            if isinstance(item, tuple):
+                command, done = item
+                if command == ReporterJsonRecords._STOP:
+                    for writer in self._writers.values():
+                        writer.close()
+                done.set()
+                if command == ReporterJsonRecords._STOP:
+                    return
+
+    def _command(self, command:str):
+        if self._thread is None:
+            return
+        done = threading.Event()
+        self._buffer.put((command, done))
+        done.wait()
+
+    def flush(self):
+        ''' wait till all already added records are written '''
+        self._command(ReporterJsonRecords._FLUSH)
+
+    def close(self):
+        ''' write all records and close segments (new records will start the new flush thread and segments) '''
+        with self._thread_lock:
+            if self._thread is None:
+                return
+            self._command(ReporterJsonRecords._STOP)
+            self._thread.join()
+            self._thread = None
+            atexit.unregister(self.close)
 
     def _get_source_folder(self, record_type:LogRecordType)->Path:
         source_folder:Union[Path, None] = None
@@ -94,35 +322,119 @@ class ReporterJsonRecords(Reporter):
             case LogRecordType.LATENCY:
                 source_folder = self._local_logs_folder
             case LogRecordType.ERROR:
-                source_folder = self._local_logs_folder
+                source_folder = self._local_errs_folder
+            case LogRecordType.OTHER:
+                source_folder = self._local_others_folder
                         
         if source_folder is None:
-            raise ValueError(f"Only LATENCY and ERROR types supported for now")
+            raise ValueError(f"Only LATENCY, ERROR and OTHER types supported for now")
         return source_folder
 
-    def list_all(self, record_type:LogRecordType)->List[str]:
-        ''' '''
-        return list(str(self._get_source_folder(record_type).glob("*.json")))
+    def _segments(self, record_type:LogRecordType)->List[Path]:
+        ''' segments in the order they were written '''
+        return sorted(self._get_source_folder(record_type).glob(f"segment-*{SEGMENT_SUFFIX}*"))
 
-    def get_all(self, record_type:LogRecordType)->List[LogRecord]:
-        ''' '''
-        result = []
+    @staticmethod
+    def _segment_lines(segment:Path)->Iterator[Tuple[int, bytes]]:
+        ''' (line number, line) of the segment - segment which is still written may end with incomplete line '''
+        try:
+            with (gzip.open(segment, "rb") if segment.suffix == ".gz" else open(segment, "rb")) as f:
+                for line_i, line in enumerate(f):
+                    if line.endswith(b"\n"):
+                        yield (line_i, line)
+        except EOFError:
+            # not closed gzip segment
+            pass
+
+    def _iter_records(self, record_type:LogRecordType)->Iterator[Tuple[str, LogRecord]]:
+        ''' (record id, record) of all records - legacy one record files first, then segments one-by-one '''
+        self.flush()
         for one_rec_path in self._get_source_folder(record_type).glob("*.json"):
-            with open(one_rec_path, "r") as f:
+            try:
+                with open(one_rec_path, "r") as f:
+                    yield (str(one_rec_path), LogRecord(**json.load(f)))
+            except Exception as e:
+                _top_logger.error(f"Fail to read record {one_rec_path} with exception {e}")
+        for segment in self._segments(record_type):
+            for line_i, line in self._segment_lines(segment):
                 try:
-                    rec = json.load(f)
-                    result.append(LogRecord(**rec))
+                    yield (f"{segment}{SEGMENT_LINE_SEPARATOR}{line_i}", LogRecord(**json.loads(line)))
+                except Exception as e:
+                    _top_logger.error(f"Fail to read record {line_i} of {segment} with exception {e}")
+
+    @staticmethod
+    def _drop_segment_records(segment:Path, stage:str, job_names:Set[str])->int:
+        ''' rewrite the segment without records of the jobs of the stage, returns number of dropped records '''
+        kept:List[bytes] = []
+        dropped = 0
+        for _, line in ReporterJsonRecords._segment_lines(segment):
+            try:
+                one_rec = json.loads(line)
+            except Exception:
+                one_rec = {}
+            if one_rec.get("stage", None) == stage and one_rec.get("job", None) in job_names:
+                dropped += 1
+            else:
+                kept.append(line)
+        if dropped > 0:
+            # temp file name doesn't match segments glob
+            tmp_segment = segment.with_name(f"tmp-{segment.name}")
+            with (gzip.open(tmp_segment, "wb") if segment.suffix == ".gz" else open(tmp_segment, "wb")) as f:
+                f.write(b"".join(kept))
+            os.replace(tmp_segment, segment)
+        return dropped
+
+    def drop_records(self, stage:str, job_names:List[str]):
+        ''' segments with records of the jobs are rewritten without them (one record files are removed) '''
+        job_names_set = set(job_names)
+        # segments being written are closed so they are not replaced under the writer
+        self.close()
+        dropped = 0
+        for record_type in LogRecordType:
+            for one_rec_path in self._get_source_folder(record_type).glob("*.json"):
+                try:
+                    with open(one_rec_path, "r") as f:
+                        one_rec = json.load(f)
+                    if one_rec.get("stage", None) == stage and one_rec.get("job", None) in job_names_set:
+                        os.remove(one_rec_path)
+                        dropped += 1
                 except Exception as e:
                     _top_logger.error(f"Fail to read record {one_rec_path} with exception {e}")
-        return result
+            for segment in self._segments(record_type):
+                dropped += ReporterJsonRecords._drop_segment_records(segment, stage, job_names_set)
+        _top_logger.info(f"{dropped} records of {len(job_names)} jobs of stage {stage} are dropped")
 
-    def get_one(self, record_id)->LogRecord:
+    def list_all(self, record_type:LogRecordType)->List[str]:
+        ''' ids of all records - json file path or <segment path>#<line number> '''
+        return [record_id for record_id, _ in self._iter_records(record_type)]
+
+    def get_all(self, record_type:LogRecordType)->List[LogRecord]:
         ''' '''
-        one_rec_path = record_id if isinstance(record_id, Path) else Path(record_id)
-        with open(one_rec_path, "r") as f:
+        return [one_rec for _, one_rec in self._iter_records(record_type)]
+
+    def iter_records(self, record_type:LogRecordType, filters:Union[Dict, None]=None)->Iterator[LogRecord]:
+        ''' records are parsed line by line as segments are read '''
+        for _, one_rec in self._iter_records(record_type):
+            if record_matches(one_rec, filters):
+                yield one_rec
+
+    def get_one(self, record_id)->LogRecord:
+        ''' record id is from list_all '''
+        record_id = str(record_id)
+        if SEGMENT_LINE_SEPARATOR in record_id:
+            segment, line_number = record_id.rsplit(SEGMENT_LINE_SEPARATOR, 1)
+            self.flush()
+            for line_i, line in self._segment_lines(Path(segment)):
+                if line_i == int(line_number):
+                    return LogRecord(**json.loads(line))
+            raise ValueError(f"Record {record_id} is not found")
+        with open(Path(record_id), "r") as f:
             res_record = LogRecord(**json.load(f))
         return res_record
 
+# columns of the task name parts (task name is split by "split_task_value" option)
+TASK_SPLIT_COLUMNS = ["task_auth", "task_lang", "task_func", "task_size"]
+
 class ReportAggregator(ABC):
     ''' will use previously created atomic records to create large aggregated report file '''
     @abstractmethod
@@ -134,38 +446,166 @@ class ReportAggregator(ABC):
         ''' '''
     # we're adding some methods to our Abstract class
     # this makes class not 100% pure but more convenient for usage
+    # Report is built in two passes over the records stream (records are never held in memory all at once):
+    #   _scan - columns of the report, warm-up records and min values of timestamp columns
+    #   _iter_report_records - records to be written as rows (see _row_values)
     @staticmethod
-    def _collect_column_names(source:Reporter, record_type:LogRecordType, options:dict={})->Tuple[List[str], List[LogRecord]]:
+    def _scan(source:Reporter, record_type:LogRecordType, options:dict={})->Tuple[List[str], Set[int], Dict[str, float]]:
         ''' 
+        first pass - returns report columns, positions of warm-up records in the stream and min numeric values of "timestamp" columns.
+        Warm-up detection keeps only timestamps and latencies (as arrays) of every series
+
         supported options keys:
 
             level_key_separator - default "||=>"
 
             split_task_value - default '-'
+
+            warmup_detection - tag latency records with "phase" ("warmup" or "steady") per request task "warmup" settings, default is exclude_warmup
+
+            exclude_warmup - drop latency records tagged as warm-up (warm-up is detected even without warmup_detection), default False
+
+            columns - record data fields to be included into the report (all by default)
+
+            filters - only records matching these filters are reported (see RECORD_FILTERS)
         '''
         _separator = options.get("level_key_separator", "||=>")
         split_task_value = options.get("split_task_value", '-')
+        warmup_detection = ReportAggregator._warmup_detection(record_type, options)
+        hidden_fields = ReportAggregator._hidden_fields(options)
 
-        all_records = source.get_all(record_type)
         # we'll collect only fields with basic values and second level field values
-        columns = set()
+        columns:Dict[str, None] = {}
+        timestamp_min:Dict[str, float] = {}
+        # series key (stage, request url) -> timestamps, latencies and stream positions of requests
+        series:Dict[Tuple, Tuple[array, array, array]] = {}
+        # series key -> (timestamp, "warmup_detection" definition) of the first request of the series
+        series_settings:Dict[Tuple, Tuple[float, Any]] = {}
+        for position, one_rec in enumerate(ReportAggregator._iter_source(source, record_type, options)):
+            if not isinstance(one_rec.data, dict):
+                continue
+            for k,v in one_rec.data.items():
+                if k in hidden_fields:
+                    continue
+                if isinstance(v, dict):
+                    for sk,sv in v.items():
+                        if not isinstance(sv,(list,dict,tuple,set)):
+                            ReportAggregator._add_column(columns, timestamp_min, f"{k}{_separator}{sk}", sv)
+                elif not isinstance(v,(list,tuple,set)):
+                    ReportAggregator._add_column(columns, timestamp_min, k, v)
+            latency = one_rec.data.get("latency", None)
+            if warmup_detection and isinstance(latency, (int, float)):
+                timestamp = one_rec.data.get("place_timestamp", 0.0)
+                timestamp = float(timestamp) if isinstance(timestamp, (int, float)) else 0.0
+                series_key = (one_rec.stage, one_rec.data.get("request_url", one_rec.task))
+                if series_key not in series:
+                    series[series_key] = (array("d"), array("d"), array("q"))
+                timestamps, latencies, positions = series[series_key]
+                timestamps.append(timestamp)
+                latencies.append(float(latency))
+                positions.append(position)
+                if series_key not in series_settings or timestamp < series_settings[series_key][0]:
+                    series_settings[series_key] = (timestamp, one_rec.data.get("warmup_detection", None))
+
+        warmup:Set[int] = set()
+        for series_key, (timestamps, latencies, positions) in series.items():
+            series_warmup = warmup_positions(timestamps, latencies, warmup_settings(series_settings[series_key][1]))
+            warmup.update(positions[sample_i] for sample_i in series_warmup)
+            _top_logger.debug(f"{series_key} reached steady state after {len(series_warmup)} of {len(positions)} requests")
+        if len(series) > 0:
+            _top_logger.info(f"{len(warmup)} of {sum(len(positions) for _, _, positions in series.values())} records are tagged as warm-up")
+            columns["phase"] = None
+
         base_columns:List[str] = ["stage", "job", "task"]
         if isinstance(split_task_value,str):
-            base_columns.extend(["task_auth", "task_lang", "task_func", "task_size"])
-        for one_rec in all_records:
-            if isinstance(one_rec.data, dict) and len(one_rec.data)>0:
-                top_keys = set([f"{k}" for k,v in one_rec.data.items() if not isinstance(v,(list,dict,tuple,set))])
-                sec_level_keys = set([
-                    f"{k}{_separator}{sk}" 
-                    for k,v in one_rec.data.items() if isinstance(v,dict)
-                        for sk,sv in v.items() if not isinstance(sv,(list,dict,tuple,set))
-                ])  
-                columns = columns.union(top_keys).union(sec_level_keys)
-        columns = columns.difference(base_columns)
-        base_columns.extend(list(columns) if len(columns)>0 else [])
-
-        return (base_columns, all_records)
-    
+            base_columns.extend(TASK_SPLIT_COLUMNS)
+        base_columns.extend([k for k in columns if k not in base_columns])
+        return (base_columns, warmup, timestamp_min)
+
+    @staticmethod
+    def _add_column(columns:Dict[str, None], timestamp_min:Dict[str, float], column_key:str, value:Any):
+        columns[column_key] = None
+        if "timestamp" in column_key and isinstance(value, (int, float)) and not isinstance(value, bool):
+            timestamp_min[column_key] = min(timestamp_min.get(column_key, value), value)
+
+    @staticmethod
+    def _warmup_detection(record_type:LogRecordType, options:dict)->bool:
+        ''' warm-up is detected only if requested - detection keeps timestamps and latencies of all requests in memory '''
+        return record_type == LogRecordType.LATENCY and bool(options.get("warmup_detection", options.get("exclude_warmup", False)))
+
+    @staticmethod
+    def _hidden_fields(options:dict)->List[str]:
+        ''' record data fields which are not reported - used by the warm-up detection only '''
+        if options.get("columns", None):
+            return [name for name in WARMUP_FIELDS if name not in options["columns"]]
+        return ["warmup_detection"]
+
+    @staticmethod
+    def _iter_source(source:Reporter, record_type:LogRecordType, options:dict)->Iterator[LogRecord]:
+        ''' records of the report - with requested data fields only (and fields required for the warm-up detection) if "columns" option is provided '''
+        filters = options.get("filters", None)
+        if not options.get("columns", None):
+            yield from source.iter_records(record_type, filters)
+            return
+        record_fields = ["stage", "job", "task"]
+        data_fields = [name for name in options["columns"] if name not in record_fields]
+        if ReportAggregator._warmup_detection(record_type, options):
+            data_fields.extend(name for name in WARMUP_FIELDS if name not in data_fields)
+        values = source.get_columns(record_type, record_fields + data_fields, filters)
+        for row_i in range(len(values["stage"])):
+            yield LogRecord(
+                stage=values["stage"][row_i], job=values["job"][row_i], task=values["task"][row_i], logType=record_type,
+                data={name: values[name][row_i] for name in data_fields if values[name][row_i] is not None}
+            )
+
+    @staticmethod
+    def _iter_report_records(source:Reporter, record_type:LogRecordType, options:dict, warmup:Set[int])->Iterator[LogRecord]:
+        ''' second pass - records tagged with "phase" (warm-up ones are skipped with "exclude_warmup") without hidden fields '''
+        warmup_detection = ReportAggregator._warmup_detection(record_type, options)
+        exclude_warmup = options.get("exclude_warmup", False)
+        hidden_fields = ReportAggregator._hidden_fields(options)
+        for position, one_rec in enumerate(ReportAggregator._iter_source(source, record_type, options)):
+            if isinstance(one_rec.data, dict):
+                if warmup_detection and isinstance(one_rec.data.get("latency", None), (int, float)):
+                    if position in warmup and exclude_warmup:
+                        continue
+                    one_rec.data["phase"] = "warmup" if position in warmup else "steady"
+                for name in hidden_fields:
+                    one_rec.data.pop(name, None)
+            yield one_rec
+
+    @staticmethod
+    def _row_values(one_rec:LogRecord, base_columns:List[str], separator:str, split_task_value:Union[str, None])->List[Any]:
+        ''' values of the record for base_columns - data fields by multi-level key, task name parts for TASK_SPLIT_COLUMNS '''
+        task_parts:List[str] = []
+        if isinstance(split_task_value,str):
+            sub_values = f"{one_rec.task}".split(split_task_value)
+            _rec_value = "N/A"
+            for i in range(len(TASK_SPLIT_COLUMNS)):
+                # missing parts repeat the last one
+                _rec_value = sub_values[i] if i<len(sub_values) else _rec_value
+                task_parts.append(_rec_value)
+        values:List[Any] = []
+        for column_key in base_columns:
+            if column_key in ("stage", "job", "task"):
+                values.append(getattr(one_rec, column_key))
+            elif len(task_parts)>0 and column_key in TASK_SPLIT_COLUMNS:
+                values.append(task_parts[TASK_SPLIT_COLUMNS.index(column_key)])
+            else:
+                # lookup in data using multi-level key
+                rec_value = one_rec.data if isinstance(one_rec.data, dict) else None
+                for key_part in column_key.split(separator):
+                    rec_value = rec_value.get(key_part, None) if isinstance(rec_value, dict) else None
+                values.append(None if isinstance(rec_value, (list,dict,tuple,set)) else rec_value)
+        return values
+
+    @staticmethod
+    def _raw_columns(base_columns:List[str], split_task_value:Union[str, None])->Set[int]:
+        ''' indexes of task name and its parts columns - reported as is when task name is split '''
+        if not isinstance(split_task_value,str):
+            return set()
+        return {column_i for column_i, column_key in enumerate(base_columns) if column_key == "task" or column_key in TASK_SPLIT_COLUMNS}
+
 class ReportAggregatorCsv(ReportAggregator):
     ''' '''
 
@@ -176,7 +616,7 @@ class ReportAggregatorCsv(ReportAggregator):
     
     def aggregate(self, source:Reporter, record_type:LogRecordType, destination:Path, options:dict={}):
         ''' 
-        supported options keys:
+        supported options keys (and ReportAggregator._scan options):
 
             level_key_separator - default "||=>"
 
@@ -192,70 +632,20 @@ class ReportAggregatorCsv(ReportAggregator):
         comma_replacement = options.get("comma_replacement", ";")
         max_value_length = int(options.get("max_value_length", 40))
         split_task_value = options.get("split_task_value", '-')
-        timestamp_delta_suffix = options.get("timestamp_delta_suffix", '-')
-
-        # collect column names and log records
-        base_columns, all_records = ReportAggregator._collect_column_names(source, record_type, options)
-        timestamp_columns = [v for v in base_columns if "timestamp" in v] if isinstance(timestamp_delta_suffix, str) else None
-        timestamp_columns = None if timestamp_columns is None or (isinstance(timestamp_columns, list) and len(timestamp_columns)==0) else timestamp_columns
-        timestamp_values = { k:[] for k in timestamp_columns} if isinstance(timestamp_columns, list) else None
-
-        # all_records = source.get_all(record_type)
-        # # we'll collect only fields with basic values and second level field values
-        # columns = set()
-        # base_columns:List[str] = ["stage", "job", "task"]
-        # if isinstance(split_task_value,str):
-        #     base_columns.extend(["task_auth", "task_lang", "task_func", "task_size"])
-        # for one_rec in all_records:
-        #     if isinstance(one_rec.data, dict) and len(one_rec.data)>0:
-        #         top_keys = set([f"{k}" for k,v in one_rec.data.items() if not isinstance(v,(list,dict,tuple,set))])
-        #         sec_level_keys = set([
-        #             f"{k}{self._separator}{sk}" 
-        #             for k,v in one_rec.data.items() if isinstance(v,dict)
-        #                 for sk,sv in v.items() if not isinstance(sv,(list,dict,tuple,set))
-        #         ])  
-        #         columns = columns.union(top_keys).union(sec_level_keys)
-        # columns = columns.difference(base_columns)
-        # base_columns.extend(list(columns) if len(columns)>0 else [])
-        # we have full columns list and can build csv in memory now
-
-        csv_list = [ ','.join(base_columns) ]
-        # fill up csv_list using base_columns
-        for one_rec in all_records:
-            csv_line:List[str] = []
-            rec_all_dict = one_rec.as_dict()
-            for column_key in base_columns:
-                rec_value = rec_all_dict.get(column_key, None)
-                if rec_value is None:
-                    if column_key.lower().startswith("task_"):
-                        # filled already!
-                        continue
-                    # lookup in data using multi-level key
-                    column_key_parts = column_key.split(self._separator)
-                    rec_value = one_rec.data if isinstance(one_rec.data, dict) else None
-                    for key_part in column_key_parts:
-                        rec_value = (rec_value or {}).get(key_part, None)
-                    rec_value = None if isinstance(rec_value, (list,dict,tuple,set)) else rec_value
-                elif isinstance(split_task_value,str):
-                    if column_key.lower()=="task":
-                        sub_values = rec_value.split(split_task_value)
-                        rec_value = [rec_value]
-                        _rec_value = "N/A"
-                        for i in range(4):
-                            _rec_value = sub_values[i] if i<len(sub_values) else _rec_value
-                            rec_value.append(_rec_value)
-                if isinstance(rec_value, list):
-                    csv_line.extend(rec_value)
-                else:
-                    if isinstance(timestamp_columns, list) and column_key in timestamp_columns and isinstance(timestamp_values, list):
-                        timestamp_values[column_key].append(rec_value)
-                    csv_line.append(f"{rec_value or 'N/A'}".replace(",",comma_replacement)[:max_value_length])
-            csv_list.append(",".join(csv_line))
-        
-        
-        # save collected report
+
+        # collect column names
+        base_columns, warmup, _ = ReportAggregator._scan(source, record_type, options)
+        raw_columns = ReportAggregator._raw_columns(base_columns, split_task_value)
+
+        # we have full columns list and can write csv lines as records are read
         with open(destination, "w") as f:
-            f.write('\n'.join(csv_list))
+            f.write(','.join(base_columns))
+            for one_rec in ReportAggregator._iter_report_records(source, record_type, options, warmup):
+                csv_line:List[str] = [
+                    f"{rec_value}" if column_i in raw_columns else f"{rec_value or 'N/A'}".replace(",",comma_replacement)[:max_value_length]
+                        for column_i, rec_value in enumerate(ReportAggregator._row_values(one_rec, base_columns, self._separator, split_task_value))
+                ]
+                f.write("\n" + ",".join(csv_line))
 
 class ReportAggregatorXlsx(ReportAggregator):
     ''' '''
@@ -267,7 +657,7 @@ class ReportAggregatorXlsx(ReportAggregator):
     
     def aggregate(self, source:Reporter, record_type:LogRecordType, destination:Path, options:dict={}):
         ''' 
-        supported options keys:
+        supported options keys (and ReportAggregator._scan options):
 
             level_key_separator - default "||=>"
 
@@ -276,83 +666,34 @@ class ReportAggregatorXlsx(ReportAggregator):
             split_task_value - default '-'
 
             timestamp_delta_suffix - default '_delta'
+
+            max_sheet_rows - rows of one sheet (including header), next rows go to "<sheet name>_2" and so on, default is Excel limit 1048576
         '''
         self._separator = options.get("level_key_separator", "||=>")
         max_value_length = int(options.get("max_value_length", 40))
+        max_rows = int(options.get("max_sheet_rows", EXCEL_MAX_ROWS))
         split_task_value = options.get("split_task_value", '-')
         timestamp_delta_suffix = options.get("timestamp_delta_suffix", '_delta')
 
-        # collect column names and log records
-        base_columns, all_records = ReportAggregator._collect_column_names(source, record_type, options)
-        timestamp_columns = [v for v in base_columns if "timestamp" in v] if isinstance(timestamp_delta_suffix, str) else None
-        timestamp_columns = None if timestamp_columns is None or (isinstance(timestamp_columns, list) and len(timestamp_columns)==0) else timestamp_columns
-        timestamp_values = { k:{} for k in timestamp_columns} if isinstance(timestamp_columns, list) else None
-        # we have full columns list and can build table rows in memory now
-        rows_list:Sequence[ Sequence[ Union[str, int, float] ] ] = [ base_columns ]
-        # fill up rows_list using base_columns
-        for rec_i,one_rec in enumerate(all_records):
-            one_row:list = []
-            rec_all_dict = one_rec.as_dict()
-            for column_key in base_columns:
-                rec_value = rec_all_dict.get(column_key, None)
-                if rec_value is None:
-                    if column_key.lower().startswith("task_"):
-                        # filled already!
-                        continue
-                    # lookup in data using multi-level key
-                    column_key_parts = column_key.split(self._separator)
-                    rec_value = one_rec.data if isinstance(one_rec.data, dict) else None
-                    for key_part in column_key_parts:
-                        rec_value = (rec_value or {}).get(key_part, None)
-                    rec_value = None if isinstance(rec_value, (list,dict,tuple,set)) else rec_value
-                elif isinstance(split_task_value,str):
-                    if column_key.lower()=="task":
-                        sub_values = rec_value.split(split_task_value)
-                        rec_value = [rec_value]
-                        _rec_value = "N/A"
-                        for i in range(4):
-                            _rec_value = sub_values[i] if i<len(sub_values) else _rec_value
-                            rec_value.append(_rec_value)
-                if isinstance(rec_value, list):
-                    one_row.extend(rec_value)
-                elif isinstance(rec_value, str) or rec_value is None:
-                    one_row.append(f"{rec_value or 'N/A'}"[:max_value_length])
-                else:
-                    if isinstance(timestamp_columns, list) and column_key in timestamp_columns and isinstance(timestamp_values, dict):
-                        timestamp_values[column_key].setdefault(rec_i, rec_value)
-                    one_row.append(rec_value)
-            rows_list.append(one_row)
-        if isinstance(timestamp_columns, list) and isinstance(timestamp_values, dict):
-            # we need to add columns for every row
-            rows_list[0].extend([f"{v}{timestamp_delta_suffix}" for v in timestamp_columns])
-            timestamp_values_min = { k:min(v.values()) for k,v in timestamp_values.items() }
-            for i,row in enumerate(rows_list):
-                if i==0:
-                    continue
-                for ts_column in timestamp_columns:
-                    # note i-1 for timestamp_values[ts_column] - that's because of title row
-                    delta_v = timestamp_values[ts_column][i-1]-timestamp_values_min[ts_column] if i in timestamp_values[ts_column] else ''
-                    row.append(delta_v)
-        # save collected report as a separate list in the Excel workbook
-        # open or create a workbook
-        if destination.is_file():
-            # load workbook
-            wb = openpyxl.load_workbook(
-                destination, read_only=False,
-                # keep_vba=True, data_only=False,
-                # keep_links=True,rich_text=True
-            )
-        else:
-            # create workbook
-            wb = openpyxl.Workbook()
+        # collect column names
+        base_columns, warmup, timestamp_min = ReportAggregator._scan(source, record_type, options)
+        raw_columns = ReportAggregator._raw_columns(base_columns, split_task_value)
+        timestamp_columns = [column_i for column_i, v in enumerate(base_columns) if "timestamp" in v] if isinstance(timestamp_delta_suffix, str) else []
+        header = list(base_columns) + [f"{base_columns[column_i]}{timestamp_delta_suffix}" for column_i in timestamp_columns]
 
-        # create a sheet for collected data
+        # save collected report as a separate list in the Excel workbook
+        # (rows are streamed into the new sheet which is added without loading existing sheets)
         sheet_name = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        wb.create_sheet(title=sheet_name)
-        ws = wb.get_sheet_by_name(sheet_name)
-        # write down rows
-        for row in rows_list:
-            ws.append(row)
-
-        # save resulting workbook
-        wb.save(destination)
\ No newline at end of file
+        with XlsxSheetWriter(destination, sheet_name, header, max_rows) as writer:
+            for one_rec in ReportAggregator._iter_report_records(source, record_type, options, warmup):
+                values = ReportAggregator._row_values(one_rec, base_columns, self._separator, split_task_value)
+                one_row:list = [
+                    rec_value if column_i in raw_columns or not (isinstance(rec_value, str) or rec_value is None) else f"{rec_value or 'N/A'}"[:max_value_length]
+                        for column_i, rec_value in enumerate(values)
+                ]
+                # delta from the earliest value of every timestamp column
+                for column_i in timestamp_columns:
+                    rec_value = values[column_i]
+                    is_number = isinstance(rec_value, (int, float)) and not isinstance(rec_value, bool)
+                    one_row.append(rec_value - timestamp_min[base_columns[column_i]] if is_number and base_columns[column_i] in timestamp_min else '')
+                writer.append(one_row)
@@ -5,7 +5,7 @@ MIT License
 import requests
 from urllib3.util.retry import Retry
 from urllib.parse import urlsplit
-from requests.adapters import HTTPAdapter
+from .transport import TimedHTTPAdapter, start_phase_timing, stop_phase_timing
 import json
 import uuid
 from enum import Enum
@@ -16,6 +16,8 @@ import jwt
 import logging
 _top_logger = logging.getLogger(__name__)
 
+DEFAULT_POOLSIZE = 10
+
 class TestRequestAuthType(Enum):
     ''' available authentication types (value identifies the list of dict keys) '''
     AWS_ASSUME = ("access_key_id","secret_access_key","session_token")
@@ -61,21 +63,38 @@ def create_bearer(jwt_options_and_claims:dict)->str:
     )
     return signed_jwt
 
+def create_session(pool_maxsize:int=DEFAULT_POOLSIZE, max_retries:Union[Retry, None]=None)->requests.Session:
+    ''' create requests session with the same adapter for http and https '''
+    session = requests.Session()
+    adapter = TimedHTTPAdapter(max_retries=max_retries, pool_connections=1, pool_maxsize=pool_maxsize)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
 class TestRequest():
 
     def __init__(self, *,
                 region="us-east-1",
                 retries=0,
                 backoff_factor=0.3,
-                force_list = None ): # [500, 502, 503, 504] ):
-        ''' creates request session with common parameters '''
+                force_list = None, # [500, 502, 503, 504] ):
+                session=None,
+                overhead_timers:bool=False ):
+        ''' creates request session with common parameters 
+            if session provided it'll be used as is (retry parameters are ignored) and will not be closed by this request
+            overhead_timers - add harness overhead timings (msec) to the response dict (see overhead_timing) '''
         self._logger = logging.getLogger(__name__)
+        self.overhead_timers = overhead_timers
+        self._overhead:dict = {}
         self._region = region
         self._request_id = None
         self._request:Union[requests.Request,None] = None
         self._response:Union[requests.Response,None] = None
         self._auth = None
-        self._session = requests.Session()
+        self._own_session = session is None
+        if session is not None:
+            self._session = session
+            return
         if isinstance(force_list, list):
             retry = Retry(
                 total=retries,
@@ -85,9 +104,12 @@ class TestRequest():
                 status_forcelist=force_list)
         else:
             retry = None
-        adapter = HTTPAdapter(max_retries=retry)
-        self._session.mount('http://', adapter)
-        self._session.mount('https://', adapter)
+        self._session = create_session(max_retries=retry)
+
+    def close(self):
+        ''' release connections of the session owned by this request '''
+        if self._own_session:
+            self._session.close()
 
     @property
     def auth_creds(self):
@@ -213,6 +235,45 @@ class TestRequest():
             self._logger.error(f"Auth type {self._auth['auth_type']} not supported")
             raise ValueError
 
+    def _prepare(self, *, url:str, method:str, body, headers:dict):
+        ''' fill in url, body, method and headers (with default ones) and sign the request '''
+        self._url = urlsplit(url)
+        self._body = json.dumps(body) if body and len(body)>0 else ""
+        self._method = method.upper()
+        self._headers = {k.lower():v for k,v in headers.items()}
+
+        # add default headers
+        self._request_id = str(uuid.uuid4())
+        self._headers.setdefault("X-Correlation-ID", self._request_id)
+        self._headers.setdefault("Accept", "application/json")#,charset=UTF-8")
+        self._headers.setdefault("Content-Type", "application/json,charset=UTF-8")
+        
+        # sign the request if self._auth provided
+        self._overhead["overhead_sign"] = 0.0
+        if self._auth:
+            sign_start = perf_counter()
+            self._sign()
+            self._overhead["overhead_sign"] = (perf_counter() - sign_start) * 1000
+
+    def _timed_prepare(self, **kwargs):
+        ''' _prepare with preparation time (excluding signing) recorded '''
+        prepare_start = perf_counter()
+        self._prepare(**kwargs)
+        self._overhead["overhead_prepare"] = (perf_counter() - prepare_start) * 1000 - self._overhead["overhead_sign"]
+
+    def overhead_timing(self)->dict:
+        ''' harness overhead timings (msec) of the last placed request - empty if overhead_timers are not enabled '''
+        return dict(self._overhead) if self.overhead_timers else {}
+
+    def _parse_body(self, text:str)->Union[dict, list, str]:
+        ''' try to json-parse response body '''
+        try:
+            return json.loads(text)
+        except Exception as e:
+            logging.error(f"TestRequest-place: Fail to json-parse response body. Will return as is.")
+            logging.debug(e)
+            return text
+
     def place(self, *,
               url: str,
               method: str,
@@ -227,71 +288,69 @@ class TestRequest():
             "Content-Type" = "application/json,charset=UTF-8"
             returns the full response dict '''
         
-        self._url = urlsplit(url)
-        self._body = json.dumps(body) if body and len(body)>0 else ""
-        self._method = method.upper()
-        self._headers = {k.lower():v for k,v in headers.items()}
-
-        req_method = getattr(self._session, method.lower())
+        req_method = getattr(self._session, method.lower(), None)
         if req_method is None:
             self._response = None
             logging.error(f"Incorrect http method {method}")
             raise ValueError
-
-        # add default headers
-        self._request_id = str(uuid.uuid4())
-        self._headers.setdefault("X-Correlation-ID", self._request_id)
-        self._headers.setdefault("Accept", "application/json")#,charset=UTF-8")
-        self._headers.setdefault("Content-Type", "application/json,charset=UTF-8")
-        
-        # sign the request if self._auth provided
-        if self._auth:
-            self._sign()
+        self._timed_prepare(url=url, method=method, body=body, headers=headers)
 
         # place http request
         place_timestamp = datetime.datetime.now().timestamp()
-        if dry_run:
-            start_req = perf_counter()
-            req = requests.Request(
-                method="GET",
-                url=url,
-                data=self._body,
-                headers=self._headers
-            )
-            self._response = requests.Response()
-            self._response.request = req.prepare()
-            self._response.status_code = 200
-            # store http request as a separate property
-            self._request = self._response.request
-            latency = (perf_counter() - start_req) * 1000
-        else:
-            start_req = perf_counter()
-            self._response = req_method(
-                url=url,
-                data=self._body,
-                headers=self._headers)
+        phase_timing = start_phase_timing()
+        try:
+            if dry_run:
+                start_req = perf_counter()
+                req = requests.Request(
+                    method="GET",
+                    url=url,
+                    data=self._body,
+                    headers=self._headers
+                )
+                self._response = requests.Response()
+                self._response.request = req.prepare()
+                self._response.status_code = 200
+                self._response._content = b""
+                headers_received = perf_counter()
+            else:
+                start_req = perf_counter()
+                # we're streaming to separate time-to-first-byte from the body download
+                self._response = req_method(
+                    url=url,
+                    data=self._body,
+                    headers=self._headers,
+                    stream=True)
+                headers_received = perf_counter()
+            response_content = self._response.content
             latency = (perf_counter() - start_req) * 1000
-            # store http request as a separate property
-            self._request = self._response.request
+        finally:
+            stop_phase_timing()
+        # store http request as a separate property
+        self._request = self._response.request
+        # time-to-first-byte is counted after the connection is ready
+        phase_timing["latency_ttfb"] = max(0.0, (headers_received - start_req) * 1000 
+                                            - phase_timing["latency_dns"] - phase_timing["latency_connect"] - phase_timing["latency_tls"])
+        phase_timing["latency_download"] = latency - (headers_received - start_req) * 1000
+        phase_timing["response_bytes"] = len(response_content or b"")
         # try to parse response
-        try:
-            response_body = json.loads(self._response.text)
-        except Exception as e:
-            logging.error(f"TestRequest-place: Fail to json-parse response body. Will return as is.")
-            logging.debug(e)
-            response_body = self._response.text
-        
+        parse_start = perf_counter()
+        response_body = self._parse_body(self._response.text)
+        response_headers = {k:v for k,v in self._response.headers.items()}
+        self._overhead["overhead_parse"] = (perf_counter() - parse_start) * 1000
+
         return {
             "place_timestamp": place_timestamp,
             "statusCode": self._response.status_code,
             "latency": latency,
+            **phase_timing,
             "request_url": url,
             "request_method": method,
             "request_headers": self._headers,
             # "request_bearer": self._auth.get("BEARER", None) if isinstance(self._auth, dict) else None,
             "body": response_body,
-            "headers": {k:v for k,v in self._response.headers.items()},
+            "headers": response_headers,
             # "raw_content": self._response.content
+            **self.overhead_timing(),
         }
 
     @property
@@ -0,0 +1,83 @@
+'''
+© 2024 Daniil Sokolov <daniil.sokolov@webcloudai.com>
+MIT License
+'''
+from __future__ import annotations
+from typing import Union, Callable
+from time import perf_counter
+import threading
+import asyncio
+import time
+import logging
+_top_logger = logging.getLogger(__name__)
+
+# last part of the wait (sec) which is spun instead of slept - OS sleep usually overshoots by 0.05-1 msec
+SPIN_SEC = 0.002
+# max sleep (sec) between checks of the stop condition for interruptible waits
+STOP_CHECK_SEC = 0.25
+
+
+def sleep_until(deadline:float, spin:float=SPIN_SEC, stopped:Union[Callable[[], bool], None]=None)->float:
+    '''
+    block till the absolute perf_counter() deadline using hybrid sleep/spin
+    stopped - wait is interrupted as soon as it returns True (checked every STOP_CHECK_SEC)
+    returns perf_counter() value at wake up
+    '''
+    while True:
+        now = perf_counter()
+        remaining = deadline - now
+        if remaining <= 0 or (stopped is not None and stopped()):
+            return now
+        if remaining > spin:
+            time.sleep(min(remaining - spin, STOP_CHECK_SEC) if stopped is not None else remaining - spin)
+        else:
+            # let other threads run while spinning
+            time.sleep(0)
+
+async def sleep_until_async(deadline:float, spin:float=SPIN_SEC, stopped:Union[Callable[[], bool], None]=None)->float:
+    ''' asyncio version of sleep_until (spinning yields to other coroutines) '''
+    while True:
+        now = perf_counter()
+        remaining = deadline - now
+        if remaining <= 0 or (stopped is not None and stopped()):
+            return now
+        if remaining > spin:
+            await asyncio.sleep(min(remaining - spin, STOP_CHECK_SEC) if stopped is not None else remaining - spin)
+        else:
+            await asyncio.sleep(0)
+
+
+class Timeline:
+    '''
+    Absolute time anchor of the tasks - requests mark their completion and wait tasks count their deadlines
+    from the latest mark, so the idle gap between the last response and the next request is exactly the planned wait
+    and no errors accumulate over many consecutive wait stages.
+    Every job gets its own timeline started at the stage anchor (see Stage._job_timeline) and marks of the job
+    are passed on to the parent (stage chain) timeline the next stage is anchored to
+    '''
+    def __init__(self, start:Union[float, None]=None, parent:Union[Timeline, None]=None):
+        self._last_mark:Union[float, None] = None
+        self._start = start
+        self._parent = parent
+        self._lock = threading.Lock()
+
+    @property
+    def last_mark(self)->Union[float, None]:
+        with self._lock:
+            return self._last_mark
+
+    def mark(self, moment:Union[float, None]=None):
+        ''' register activity (request completion or wait end) at perf_counter() moment (now by default) '''
+        moment = perf_counter() if moment is None else moment
+        with self._lock:
+            if self._last_mark is None or moment > self._last_mark:
+                self._last_mark = moment
+        if self._parent is not None:
+            self._parent.mark(moment)
+
+    def anchor(self)->float:
+        ''' moment the next wait is counted from - latest mark, start or now if nothing was marked yet '''
+        with self._lock:
+            if self._last_mark is not None:
+                return self._last_mark
+            return self._start if self._start is not None else perf_counter()
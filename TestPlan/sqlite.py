@@ -0,0 +1,178 @@
+'''
+© 2024 Daniil Sokolov <daniil.sokolov@webcloudai.com>
+MIT License
+'''
+from typing import List, Dict, Union, Tuple, Iterator, Any
+from pathlib import Path
+import sqlite3
+import threading
+import json
+from .reporter import Reporter, LogRecord, LogRecordType
+import logging
+_top_logger = logging.getLogger(__name__)
+
+_SCHEMA = (
+    '''CREATE TABLE IF NOT EXISTS records (
+        id INTEGER PRIMARY KEY,
+        stage TEXT,
+        job TEXT,
+        task TEXT,
+        logType TEXT NOT NULL,
+        timestamp REAL,
+        data TEXT
+    )''',
+    "CREATE INDEX IF NOT EXISTS records_stage_job_task ON records (logType, stage, job, task)",
+    "CREATE INDEX IF NOT EXISTS records_task ON records (logType, task)",
+    "CREATE INDEX IF NOT EXISTS records_timestamp ON records (logType, timestamp)",
+)
+
+
+class ReporterSqlite(Reporter):
+    '''
+    Records are stored in the embedded SQLite database (WAL mode) - one row per record with indexed
+    stage, job, task, logType and timestamp (place_timestamp of the request) and json data.
+    Every add_bunch is one transaction so collector batches are inserted at once.
+
+    iter_records / get_columns accept filters (see RECORD_FILTERS) which are executed by SQLite:
+
+        {"stage": <name or list of names>, "job": .., "task": .., "timestamp_from": .., "timestamp_to": ..}
+
+    reporter_options keys:
+
+        database - location of the database file, default "log_records.sqlite"
+    '''
+    FILTER_COLUMNS = ("stage", "job", "task")
+    # rows fetched at once by iter_records
+    FETCH_ROWS = 1000
+
+    def __init__(self, reporter_options:dict):
+        ''' '''
+        self._database = Path(reporter_options.get("database", "log_records.sqlite"))
+        self._database.parent.mkdir(parents=True, exist_ok=True)
+        # collectors of parallel stages share the connection
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self._database, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        with self._connection:
+            for statement in _SCHEMA:
+                self._connection.execute(statement)
+
+    def add(self, record:LogRecord):
+        ''' '''
+        self.add_bunch([record])
+
+    def add_bunch(self, records:List[LogRecord]):
+        ''' all records are inserted in one transaction '''
+        rows = [
+            (
+                one_rec.stage, one_rec.job, one_rec.task,
+                one_rec.logType.value if isinstance(one_rec.logType, LogRecordType) else one_rec.logType,
+                one_rec.data.get("place_timestamp", None) if isinstance(one_rec.data, dict) else None,
+                json.dumps(one_rec.data),
+            )
+            for one_rec in records
+        ]
+        with self._lock, self._connection:
+            self._connection.executemany("INSERT INTO records (stage, job, task, logType, timestamp, data) VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+    def drop_records(self, stage:str, job_names:List[str]):
+        ''' '''
+        with self._lock, self._connection:
+            # number of query parameters is limited
+            for chunk_start in range(0, len(job_names), ReporterSqlite.FETCH_ROWS):
+                chunk = job_names[chunk_start:chunk_start + ReporterSqlite.FETCH_ROWS]
+                self._connection.execute(f"DELETE FROM records WHERE stage = ? AND job IN ({', '.join('?' * len(chunk))})", [stage, *chunk])
+
+    def close(self):
+        ''' '''
+        with self._lock:
+            self._connection.close()
+
+    @staticmethod
+    def _where(record_type:LogRecordType, filters:Union[Dict, None])->Tuple[str, List[Any]]:
+        ''' WHERE clause and its parameters for the record type and filters '''
+        conditions = ["logType = ?"]
+        parameters:List[Any] = [record_type.value]
+        for name, value in (filters or {}).items():
+            if name in ReporterSqlite.FILTER_COLUMNS:
+                values = [value] if isinstance(value, str) else list(value)
+                conditions.append(f"{name} IN ({', '.join('?' * len(values))})")
+                parameters.extend(values)
+            elif name == "timestamp_from":
+                conditions.append("timestamp >= ?")
+                parameters.append(value)
+            elif name == "timestamp_to":
+                conditions.append("timestamp < ?")
+                parameters.append(value)
+            else:
+                raise ValueError(f"Unknown records filter '{name}'")
+        return (" AND ".join(conditions), parameters)
+
+    def _select(self, columns:str, record_type:LogRecordType)->List[tuple]:
+        where, parameters = ReporterSqlite._where(record_type, None)
+        with self._lock:
+            return self._connection.execute(f"SELECT {columns} FROM records WHERE {where} ORDER BY id", parameters).fetchall()
+
+    @staticmethod
+    def _to_record(row:tuple)->LogRecord:
+        stage, job, task, log_type, data = row
+        return LogRecord(stage=stage, job=job, task=task, logType=log_type, data=json.loads(data))
+
+    def list_all(self, record_type:LogRecordType)->List[str]:
+        ''' ids of the records '''
+        return [str(row[0]) for row in self._select("id", record_type)]
+
+    def get_all(self, record_type:LogRecordType)->List[LogRecord]:
+        ''' records are read at once (use iter_records with filters to read a part of the run) '''
+        return [ReporterSqlite._to_record(row) for row in self._select("stage, job, task, logType, data", record_type)]
+
+    def iter_records(self, record_type:LogRecordType, filters:Union[Dict, None]=None)->Iterator[LogRecord]:
+        ''' records are fetched in batches by the separate connection (so writers are not blocked while records are consumed) '''
+        where, parameters = ReporterSqlite._where(record_type, filters)
+        connection = sqlite3.connect(self._database)
+        try:
+            cursor = connection.execute(f"SELECT stage, job, task, logType, data FROM records WHERE {where} ORDER BY id", parameters)
+            while True:
+                rows = cursor.fetchmany(ReporterSqlite.FETCH_ROWS)
+                if len(rows) == 0:
+                    return
+                for row in rows:
+                    yield ReporterSqlite._to_record(row)
+        finally:
+            connection.close()
+
+    def get_one(self, record_id)->LogRecord:
+        ''' '''
+        with self._lock:
+            row = self._connection.execute("SELECT stage, job, task, logType, data FROM records WHERE id = ?", (int(record_id),)).fetchone()
+        if row is None:
+            raise ValueError(f"Record {record_id} is not found")
+        return ReporterSqlite._to_record(row)
+
+    def get_columns(self, record_type:LogRecordType, columns:List[str], filters:Union[Dict, None]=None)->Dict[str, List[Any]]:
+        ''' 
+        requested data fields are extracted by SQLite so only these values are sent to Python
+        (with their json type, so nested values and booleans are returned as they were added)
+        '''
+        selected = []
+        parameters = []
+        for name in columns:
+            if name in ReporterSqlite.FILTER_COLUMNS:
+                selected.append(f"{name}, NULL")
+            else:
+                selected.append("json_extract(data, ?), json_type(data, ?)")
+                parameters.extend([f'$."{name}"'] * 2)
+        where, where_parameters = ReporterSqlite._where(record_type, filters)
+        with self._lock:
+            rows = self._connection.execute(f"SELECT {', '.join(selected)} FROM records WHERE {where} ORDER BY id", parameters + where_parameters).fetchall()
+        result:Dict[str, List[Any]] = {name: [] for name in columns}
+        for row in rows:
+            for column_i, name in enumerate(columns):
+                value, value_type = row[2 * column_i], row[2 * column_i + 1]
+                if value_type in ("object", "array"):
+                    value = json.loads(value)
+                elif value_type in ("true", "false"):
+                    value = value_type == "true"
+                result[name].append(value)
+        return result
@@ -4,106 +4,248 @@ MIT License
 '''
 from .reporter import Reporter, LogRecord, LogRecordType
 from .job import Job, JobExecuteOptions
-from queue import Queue
-from typing import List, Dict, Union
-from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Union, Callable, Iterable, Iterator, Tuple, Set, Any
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Future, wait, FIRST_COMPLETED
+from .engine import EngineType, execute_job_in_process
+from .collector import ResultCollector
+from .checkpoint import Checkpoint
+from .ratelimit import RateLimiter
+from .guardrails import Guardrails, GuardrailMonitor, is_stopped
+from .histogram import LatencyHistograms
+from .scheduler import Timeline
 from .common import clean_name
+import threading
+import asyncio
 import logging
-import time
 _top_logger = logging.getLogger(__name__)
 
 class Stage:
     ''' '''
-    jobs:Dict[str, Job] = {}    # key - job name
-    result_queues:Dict[str, Queue] = {} # key - job name
-    error_queues:Dict[str, Queue] = {}  #key - job name
     pool_size:int = 10
     name:str = ""
     definition:dict = {}
 
     def __init__(self, stage_name:str, stage_definition:dict, reporter:Reporter, max_concurrency:int=3):
-        ''' '''
+        ''' Jobs are not created here - every Job is created from the definition right before it's started '''
         self.reporter:Reporter = reporter
         self.name = stage_name
         self.definition = {clean_name(k):v for k,v in stage_definition.items()}
-        # we need to create underlying Queues and Jobs first
-        self.result_queues = {job_name:Queue() for job_name in self.definition.get("jobs",{}).keys()}
-        self.error_queues = {job_name:Queue() for job_name in self.definition.get("jobs",{}).keys()}
-        self.jobs = {job_name:Job(job_name, job_def, JobExecuteOptions(
-                                    results_queue=self.result_queues[job_name],
-                                    errors_queue=self.error_queues[job_name]
-                                )) 
-                    for job_name,job_def in self.definition.get("jobs",{}).items()}
+        # all jobs are reporting into the single collector queue
+        self.collector = ResultCollector(self.name, self.reporter)
         # we'll run start all jobs in parallel Threads with Pool size of max_concurrency at max
-        self.pool_size = min(max_concurrency, len(self.jobs))
+        self.pool_size = max(1, min(max_concurrency, len(self.definition.get("jobs",{}))))
+        # optional "rate_limit" shared by all requests of the stage (in addition to the plan one)
+        self.rate_limiter:Union[RateLimiter, None] = RateLimiter(self.name, self.definition["rate_limit"]) if "rate_limit" in self.definition else None
+
+    def _with_rate_limit(self, options:dict)->dict:
+        ''' options with the stage rate limiter added to the plan ones '''
+        if self.rate_limiter is None:
+            return options
+        return {**options, "rate_limiters": [*options.get("rate_limiters", []), self.rate_limiter]}
+
+    def _start_collector(self, options:dict)->dict:
+        ''' 
+        start the collector watching stage guardrails (stage "guardrails" or plan ones) if any,
+        recording latency histograms if enabled and checkpointing completed jobs when their records are stored
+        returns options with the stage stop event added
+        '''
+        if options.get("latency_histograms", None) is not None:
+            self.collector.histograms = LatencyHistograms(options["latency_histograms"])
+        checkpoint:Union[Checkpoint, None] = options.get("checkpoint", None)
+        if checkpoint is not None:
+            self._drop_interrupted_jobs(checkpoint)
+            checkpoint.stage_started(self.name)
+            self.collector.on_jobs_stored = lambda job_names: checkpoint.jobs_done(self.name, job_names)
+        guardrails = Guardrails(self.name, self.definition["guardrails"]) if "guardrails" in self.definition else options.get("guardrails", None)
+        if guardrails is None:
+            self.collector.start()
+            return options
+        # jobs of the "process" engine are checking the stop event from worker processes
+        stage_stop = options["process_manager"].Event() if options.get("engine", None) == EngineType.PROCESS else threading.Event()
+        self.collector.monitor = GuardrailMonitor(guardrails, stage_stop, options.get("plan_stop", stage_stop))
+        if options.get("on_guardrail_breach", None) is not None:
+            # e.g. distributed worker passes the breach to the coordinator (see WorkerTestPlan)
+            self.collector.monitor.on_breach = lambda breach: options["on_guardrail_breach"](self.name, breach)
+        self.collector.start()
+        return {**options, "stop_events": [*options.get("stop_events", []), stage_stop]}
+
+    def _drop_interrupted_jobs(self, checkpoint:Checkpoint):
+        ''' records of the jobs interrupted by the stopped run are dropped so they are not stored twice when jobs are executed again '''
+        if not checkpoint.is_stage_interrupted(self.name):
+            return
+        job_names = [job_name for job_name in self.definition.get("jobs",{}) if not checkpoint.is_job_done(self.name, job_name)]
+        try:
+            self.reporter.drop_records(self.name, job_names)
+        except NotImplementedError as e:
+            _top_logger.warning(f"Records of the interrupted jobs of stage {self.name} are kept ({e}) and can be stored twice")
+
+    def _create_job(self, job_name:str, job_definition:dict)->Job:
+        ''' Job reporting into the stage collector '''
+        return Job(job_name, job_definition, JobExecuteOptions(
+                        results_queue=self.collector.queue_for(job_name, LogRecordType.LATENCY),
+                        errors_queue=self.collector.queue_for(job_name, LogRecordType.ERROR),
+                        others_queue=self.collector.queue_for(job_name, LogRecordType.OTHER)
+                    ))
+
+    @staticmethod
+    def _stage_anchor(options:dict)->Union[float, None]:
+        ''' moment the waits of the stage jobs are counted from till the job marks its own activity (None - no timeline) '''
+        timeline:Union[Timeline, None] = options.get("timeline", None)
+        return timeline.anchor() if timeline is not None else None
+
+    @staticmethod
+    def _job_options(options:dict, stage_anchor:Union[float, None])->dict:
+        ''' 
+        options of one job - the job gets its own timeline started at the stage anchor so waits of the job
+        are not counted from requests of other jobs. Job marks are passed on to the stage chain timeline
+        '''
+        if stage_anchor is None:
+            return options
+        return {**options, "timeline": Timeline(stage_anchor, parent=options["timeline"])}
+
+    def _jobs_to_run(self, options:dict)->Iterator[Tuple[str, dict]]:
+        ''' (job name, job definition) of all jobs except already completed per checkpoint '''
+        checkpoint:Union[Checkpoint, None] = options.get("checkpoint", None)
+        for job_name, job_def in self.definition.get("jobs",{}).items():
+            if checkpoint is not None and checkpoint.is_job_done(self.name, job_name):
+                _top_logger.info(f"Job {job_name} of stage {self.name} is already completed per checkpoint")
+                continue
+            yield (job_name, job_def)
+
+    def _job_done(self, job_name:str, options:dict):
+        ''' job is checkpointed by the collector when all its records are stored '''
+        if options.get("checkpoint", None) is not None:
+            self.collector.job_done(job_name)
+
+    def _run_bounded(self, submit:Callable[[str, dict], Future], options:dict, 
+                     on_result:Union[Callable[[str, Any], None], None]=None)->int:
+        ''' 
+        submit jobs one-by-one keeping at most pool_size of them in flight 
+        (so only running jobs are kept in memory and completed ones are released)
+        returns the number of submitted jobs
+        '''
+        running:Dict[Future, str] = {}
+        jobs_count = 0
+
+        def jobs_done(done:Iterable[Future]):
+            for job in done:
+                job_name = running.pop(job)
+                if job.exception() is not None:
+                    _top_logger.error(f"Job {job_name} of stage {self.name} failed with exception {job.exception()}")
+                    continue
+                if on_result is not None:
+                    on_result(job_name, job.result())
+                # stopped job is not completed
+                if not is_stopped(options):
+                    self._job_done(job_name, options)
+
+        for job_name, job_def in self._jobs_to_run(options):
+            if len(running) >= self.pool_size:
+                done, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+                jobs_done(done)
+            if is_stopped(options):
+                break
+            running[submit(job_name, job_def)] = job_name
+            jobs_count += 1
+        done, _ = wait(running.keys())
+        jobs_done(done)
+        return jobs_count
 
     def execute(self, dry_run:bool=False, options:Union[Dict, None]=None):
-        ''' execute all underlying jobs in parallel '''
+        ''' execute all underlying jobs in parallel (options are passed to every job as is) '''
        
-        # we'll listen for messages in all queues
+        options = self._with_rate_limit(options or {})
+        if options.get("engine", None) == EngineType.PROCESS:
+            self._execute_in_processes(dry_run=dry_run, options=options)
+            return
+        # collector will stream messages from all queues to the reporter while jobs are running
+        options = self._start_collector(options)
+        stage_anchor = self._stage_anchor(options)
         # we'll start all jobs in parallel Threads with Pool size of self.pool_size at max
-        thread_pool = ThreadPoolExecutor(max_workers=self.pool_size)
-        jobs_submitted = {
-            job_name: thread_pool.submit(job.execute, dry_run=dry_run)
-            for job_name, job in self.jobs.items()
-        }
-        # now we'll listen for messages in all result and error queues
-        jobs_running = True
-        have_message = False
-        while jobs_running or have_message:
-            jobs_running = False
-            have_message = False
-            time.sleep(0.5)
-            for job_name, job in jobs_submitted.items():
-                jobs_running = jobs_running or not job.done()
-                try:
-                    result_message = self.result_queues[job_name].get_nowait()
-                    have_message = True
-                    # we have a result available in this Queue
-                    # we'll assemble a record and send it to the Reporter
-                    _top_logger.info(f"Got a message in the results queue {result_message}")
-                    self.reporter.add(
-                        LogRecord(
-                            stage=self.name,
-                            job=job_name,
-                            task=result_message.get("task","NA") if isinstance(result_message, dict) else "NIM",
-                            logType=LogRecordType.LATENCY,
-                            data=result_message
-                        )
-                    )
-                except Exception as e:
-                    # no result available in this Queue
-                    pass
-
-                try:
-                    err_message = self.error_queues[job_name].get_nowait()
-                    have_message = True
-                    _top_logger.info(f"Got a message in the errors queue {err_message}")
-                    self.reporter.add(
-                        LogRecord(
-                            stage=self.name,
-                            job=job_name,
-                            task=err_message.get("task","NA") if isinstance(err_message, dict) else "NIM",
-                            logType=LogRecordType.ERROR,
-                            data=err_message
-                        )
-                    )
-                except Exception as e:
-                    # no errors available in this Queue
-                    # we have an error available in this Queue
-                    # we'll assemble a record and send it to the Reporter
-                    pass
-                
-        if not jobs_running and not have_message:
-            _top_logger.info(f"No messages in any of the queues for stage {self.name}")
-
-        # # we'll wait for all jobs to finish
-        # print(f"Waiting for all jobs to finish", end="")
-        # for job in jobs_submitted.values():
-        #     while not job.done():
-        #         print(".", end="")
-        #         time.sleep(0.5)
-        print(f"All {len(jobs_submitted)} jobs of stage {self.name} COMPLETED")
+        with ThreadPoolExecutor(max_workers=self.pool_size) as thread_pool:
+            jobs_count = self._run_bounded(
+                lambda job_name, job_def: thread_pool.submit(self._create_job(job_name, job_def).execute, dry_run=dry_run, 
+                                                             options=self._job_options(options, stage_anchor)),
+                options
+            )
+        self._complete(jobs_count)
+
+    async def execute_async(self, dry_run:bool=False, options:Union[Dict, None]=None):
+        ''' asyncio engine version of execute - all jobs are coroutines with max pool_size running at the same time '''
+        options = self._start_collector(self._with_rate_limit(options or {}))
+        stage_anchor = self._stage_anchor(options)
+        jobs_limit = asyncio.Semaphore(self.pool_size)
+        running:Set[asyncio.Task] = set()
+        jobs_count = 0
+
+        async def run_job(job:Job):
+            try:
+                await job.execute_async(dry_run=dry_run, options=self._job_options(options, stage_anchor))
+                if not is_stopped(options):
+                    self._job_done(job.name, options)
+            except Exception as e:
+                _top_logger.error(f"Job {job.name} of stage {self.name} failed with exception {e}")
+            finally:
+                jobs_limit.release()
+
+        for job_name, job_def in self._jobs_to_run(options):
+            # job is created only when there is a free slot to run it
+            await jobs_limit.acquire()
+            if is_stopped(options):
+                jobs_limit.release()
+                break
+            job_task = asyncio.create_task(run_job(self._create_job(job_name, job_def)))
+            running.add(job_task)
+            job_task.add_done_callback(running.discard)
+            jobs_count += 1
+        if len(running) > 0:
+            await asyncio.gather(*running)
+        self._complete(jobs_count)
+
+    def _execute_in_processes(self, dry_run:bool, options:dict):
+        ''' 
+        "process" engine version of execute - jobs are spread across worker processes of the plan
+        workers send results in batches into the queue provided by the process manager of the plan
+        '''
+        self.collector = ResultCollector(self.name, self.reporter, queue=options["process_manager"].Queue())
+        options = self._start_collector(options)
+        # only options which can be sent to another process (worker has its own connection pool and rate limiters)
+        worker_options = {k:v for k,v in options.items() if k in ("connection", "engine", "overhead_timers", "stop_events")}
+        worker_options["heavy_fields"] = options.get("process_heavy_fields", False)
+        # every job gets the timeline started at the stage anchor (perf_counter is system-wide so it's valid in the worker)
+        worker_options["timeline_anchor"] = self._stage_anchor(options)
+        # at most pool_size jobs (so worker processes) of the stage are running at the same time,
+        # plan limits are split across all worker processes of the plan when stages of other chains can run at the same time
+        plan_share = options.get("process_plan_share", None) or 1.0 / self.pool_size
+        worker_options["rate_limits"] = [
+            (limiter.owner_name, limiter.definition, 1.0 / self.pool_size if limiter is self.rate_limiter else plan_share)
+                for limiter in options.get("rate_limiters", [])
+        ]
+        process_pool:ProcessPoolExecutor = options["process_pool"]
 
+        def job_completed(job_name:str, result:Tuple[dict, Union[float, None]]):
+            cpu_usage, last_mark = result
+            _top_logger.info(f"Job {job_name} of stage {self.name} used {cpu_usage['cpu_utilization']:.0%} CPU of the worker process {cpu_usage['pid']}")
+            # next stage of the chain is anchored to the latest activity of the worker jobs
+            if last_mark is not None and options.get("timeline", None) is not None:
+                options["timeline"].mark(last_mark)
 
+        jobs_count = self._run_bounded(
+            lambda job_name, job_def: process_pool.submit(execute_job_in_process, job_name, job_def, dry_run, worker_options, self.collector.queue),
+            options,
+            on_result=job_completed
+        )
+        self._complete(jobs_count)
 
+    def _complete(self, jobs_count:int):
+        ''' all jobs are done so we just need to report what is left in the queue and store records buffered by the reporter '''
+        self.collector.close()
+        try:
+            self.reporter.flush()
+        except Exception as e:
+            _top_logger.error(f"Fail to flush records of stage {self.name} with exception {e}")
+        _top_logger.info(f"Stage {self.name} collected {self.collector.records_count[LogRecordType.LATENCY]} results and {self.collector.records_count[LogRecordType.ERROR]} errors")
+        if self.collector.monitor is not None and self.collector.monitor.breach is not None:
+            print(f"Stage {self.name} STOPPED by guardrail {self.collector.monitor.breach['rule']} after {jobs_count} jobs")
+            return
+        print(f"All {jobs_count} jobs of stage {self.name} COMPLETED")
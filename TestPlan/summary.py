@@ -0,0 +1,192 @@
+'''
+© 2024 Daniil Sokolov <daniil.sokolov@webcloudai.com>
+MIT License
+'''
+from typing import List, Dict, Tuple, Any
+from pathlib import Path
+from array import array
+import datetime
+import json
+import numpy as np
+from .reporter import Reporter, ReportAggregator, LogRecordType, TASK_SPLIT_COLUMNS
+from .xlsx import XlsxSheetWriter
+from .histogram import LatencyHistogram, iter_histograms
+import logging
+_top_logger = logging.getLogger(__name__)
+
+# percentiles of the summary (column name -> quantile)
+SUMMARY_PERCENTILES = {"p50": 0.5, "p90": 0.9, "p95": 0.95, "p99": 0.99, "p99.9": 0.999}
+
+
+class ReportAggregatorSummary(ReportAggregator):
+    '''
+    Latency summary table - one row per group (by default per stage and task auth / lang / func / size)
+    with count, mean, stddev, p50, p90, p95, p99, p99.9, max of the latency and bootstrap confidence interval of every percentile.
+    Only group and latency fields are read (see Reporter.get_columns), statistics of all groups are calculated
+    by NumPy on the sorted latencies at once. Warm-up requests are excluded by default.
+
+    Destination suffix defines the format - ".csv", ".xlsx" (new sheet "summary_<time>" is added to the workbook) or ".json"
+
+    With "histograms" option summary is built from the latency histograms recorded by collectors ("latency_histograms" plan option)
+    in constant memory - percentiles are within the histogram relative error, there are no confidence intervals and warm-up requests are included
+    '''
+
+    def __init__(self, report_aggregator_options:dict={}):
+        ''' '''
+        self._report_aggregator_options = report_aggregator_options
+
+    def aggregate(self, source:Reporter, record_type:LogRecordType, destination:Path, options:dict={}):
+        '''
+        supported options keys (and ReportAggregator._scan options except "columns"):
+
+            group_by - record fields, task name parts (task_auth, task_lang, task_func, task_size) or data fields to group by,
+                       default ["stage", "task_auth", "task_lang", "task_func", "task_size"] (["stage", "task"] if task is not split)
+
+            exclude_warmup - default True
+
+            bootstrap - number of bootstrap resamples for confidence intervals, default 1000 (0 - no confidence intervals)
+
+            confidence - confidence level of the intervals, default 0.95
+
+            seed - random seed of the bootstrap, default 0 (summary of the same records is always the same)
+
+            comma_replacement - default ';' (csv only)
+
+            histograms - summary of latency histograms (group_by can have stage, task and task name parts only), default False
+        '''
+        split_task_value = options.get("split_task_value", '-')
+        default_group_by = ["stage", *TASK_SPLIT_COLUMNS] if isinstance(split_task_value, str) else ["stage", "task"]
+        group_by = list(options.get("group_by", None) or default_group_by)
+        bootstrap = int(options.get("bootstrap", 1000))
+        confidence = float(options.get("confidence", 0.95))
+
+        if options.get("histograms", False):
+            group_names, stats = self._histogram_summary(source, group_by, options)
+            bootstrap = 0
+        else:
+            group_names, codes, latencies = self._load(source, record_type, group_by, options)
+            stats = ReportAggregatorSummary.summary(codes, latencies, len(group_names), bootstrap, confidence, int(options.get("seed", 0)))
+        if len(group_names) == 0:
+            _top_logger.warning(f"No {record_type.value} records with numeric latency for the summary")
+        header = list(group_by) + list(stats.keys())
+        rows = [
+            list(group_key) + [stats[name][group_i] for name in stats]
+                for group_i, group_key in enumerate(group_names)
+        ]
+        match Path(destination).suffix:
+            case ".csv":
+                comma_replacement = options.get("comma_replacement", ";")
+                with open(destination, "w") as f:
+                    f.write(",".join(header))
+                    for row in rows:
+                        f.write("\n" + ",".join(f"{'N/A' if v is None else v}".replace(",", comma_replacement) for v in row))
+            case ".xlsx":
+                with XlsxSheetWriter(destination, f"summary_{datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}", header) as writer:
+                    for row in rows:
+                        writer.append(['N/A' if v is None else v for v in row])
+            case ".json":
+                with open(destination, "w") as f:
+                    json.dump({
+                        "created": datetime.datetime.now().isoformat(),
+                        "record_type": record_type.value,
+                        "group_by": group_by,
+                        "bootstrap": bootstrap,
+                        "confidence": confidence,
+                        "groups": [dict(zip(header, row)) for row in rows],
+                    }, f, indent=2)
+            case _:
+                raise ValueError(f"Summary can't be saved as {Path(destination).suffix}")
+
+    def _load(self, source:Reporter, record_type:LogRecordType, group_by:List[str], options:dict)->Tuple[List[Tuple], np.ndarray, np.ndarray]:
+        ''' group keys, group index and latency of every record (records without numeric latency are skipped) '''
+        separator = options.get("level_key_separator", "||=>")
+        split_task_value = options.get("split_task_value", '-')
+        # only group and latency fields are read
+        read_options = {
+            **options,
+            "columns": ["latency", *[name for name in group_by if name not in TASK_SPLIT_COLUMNS]],
+            "exclude_warmup": options.get("exclude_warmup", True),
+        }
+        warmup = set()
+        if ReportAggregator._warmup_detection(record_type, read_options):
+            _, warmup, _ = ReportAggregator._scan(source, record_type, read_options)
+        groups:Dict[Tuple, int] = {}
+        codes = array("q")
+        latencies = array("d")
+        for one_rec in ReportAggregator._iter_report_records(source, record_type, read_options, warmup):
+            latency = one_rec.data.get("latency", None) if isinstance(one_rec.data, dict) else None
+            if not isinstance(latency, (int, float)) or isinstance(latency, bool):
+                continue
+            group_key = tuple(ReportAggregator._row_values(one_rec, group_by, separator, split_task_value))
+            codes.append(groups.setdefault(group_key, len(groups)))
+            latencies.append(latency)
+        return (list(groups.keys()), np.frombuffer(codes, dtype=np.int64), np.frombuffer(latencies, dtype=np.float64))
+
+    def _histogram_summary(self, source:Reporter, group_by:List[str], options:dict)->Tuple[List[Tuple], Dict[str, List[Any]]]:
+        ''' group keys and statistics of histograms merged by group (histograms of intervals, jobs, workers and runs) '''
+        unknown = [name for name in group_by if name not in ("stage", "task", *TASK_SPLIT_COLUMNS)]
+        if len(unknown) > 0:
+            raise ValueError(f"Histograms are recorded per stage and task so summary can't be grouped by {unknown}")
+        separator = options.get("level_key_separator", "||=>")
+        split_task_value = options.get("split_task_value", '-')
+        groups:Dict[Tuple, LatencyHistogram] = {}
+        for one_rec, histogram in iter_histograms(source, options.get("filters", None)):
+            group_key = tuple(ReportAggregator._row_values(one_rec, group_by, separator, split_task_value))
+            if group_key in groups:
+                groups[group_key].merge(histogram)
+            else:
+                groups[group_key] = histogram
+        stats:Dict[str, List[Any]] = {"count": [], "mean": [], "stddev": []}
+        stats.update({name: [] for name in SUMMARY_PERCENTILES})
+        stats["max"] = []
+        for histogram in groups.values():
+            stats["count"].append(histogram.count)
+            stats["mean"].append(histogram.mean())
+            stats["stddev"].append(histogram.stddev())
+            for name, quantile in SUMMARY_PERCENTILES.items():
+                stats[name].append(histogram.percentile(quantile))
+            stats["max"].append(histogram.max if histogram.count > 0 else None)
+        return (list(groups.keys()), stats)
+
+    @staticmethod
+    def summary(codes:np.ndarray, latencies:np.ndarray, groups:int, bootstrap:int=1000, confidence:float=0.95, seed:int=0)->Dict[str, List[Any]]:
+        '''
+        statistics of every group (group index is codes value) - column name -> values of groups.
+        Latencies are sorted by group once and percentiles of all groups are taken by index (linear interpolation).
+        Bootstrap percentile of the group is the order statistic of the resample which is sampled directly -
+        k-th of n resampled values is x[ceil(n * U)] where U ~ Beta(k, n - k + 1) - so every resample costs O(1) per group
+        '''
+        counts = np.bincount(codes, minlength=groups)
+        order = np.lexsort((latencies, codes))
+        ordered = latencies[order]
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1])).astype(np.int64)
+        safe_counts = np.maximum(counts, 1)
+        mean = np.bincount(codes, weights=latencies, minlength=groups) / safe_counts
+        squares = np.bincount(codes, weights=(latencies - mean[codes]) ** 2, minlength=groups)
+        stddev = np.sqrt(squares / np.maximum(counts - 1, 1))
+        last = starts + safe_counts - 1
+        result:Dict[str, np.ndarray] = {
+            "count": counts,
+            "mean": mean,
+            "stddev": stddev,
+        }
+        for name, quantile in SUMMARY_PERCENTILES.items():
+            position = quantile * (safe_counts - 1)
+            low = np.floor(position).astype(np.int64)
+            fraction = position - low
+            lower = ordered[np.minimum(starts + low, last)] if len(ordered) > 0 else np.zeros(groups)
+            upper = ordered[np.minimum(starts + low + 1, last)] if len(ordered) > 0 else np.zeros(groups)
+            result[name] = lower + fraction * (upper - lower)
+        result["max"] = ordered[last] if len(ordered) > 0 else np.zeros(groups)
+        if bootstrap > 0 and len(ordered) > 0:
+            rng = np.random.default_rng(seed)
+            tails = ((1.0 - confidence) / 2.0, (1.0 + confidence) / 2.0)
+            for name, quantile in SUMMARY_PERCENTILES.items():
+                rank = np.clip(np.ceil(quantile * safe_counts), 1, safe_counts)
+                uniform = rng.beta(rank, safe_counts - rank + 1, size=(bootstrap, groups))
+                index = np.clip(np.ceil(uniform * safe_counts).astype(np.int64), 1, safe_counts) - 1
+                resampled = ordered[starts + index]
+                ci_low, ci_high = np.quantile(resampled, tails, axis=0)
+                result[f"{name}_ci_low"] = ci_low
+                result[f"{name}_ci_high"] = ci_high
+        return {name: [int(v) if name == "count" else float(v) for v in values.tolist()] for name, values in result.items()}
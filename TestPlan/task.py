@@ -3,13 +3,22 @@
 MIT License
 '''
 from __future__ import annotations
-from typing import List, Dict, Union
+from typing import List, Dict, Union, Generator, Tuple, Iterable, Callable
 from queue import Queue
 from enum import Enum
 from .common import clean_name
 from .request import TestRequest, TestRequestAuthType
+from .connection import ConnectionMode, ConnectionPool
+from .scheduler import Timeline, sleep_until, sleep_until_async
+from .ratelimit import RateLimiter, reserve_all
+from .guardrails import is_stopped
 import boto3
-import time
+import asyncio
+import threading
+import random
+import math
+from time import perf_counter
+from concurrent.futures import ThreadPoolExecutor
 from uuid import uuid4
 import json
 import logging
@@ -22,6 +31,8 @@ class TaskType(Enum):
     WAIT_MIN = "wait_min"
     WAIT_SEC = "wait_sec"
     WAIT_MSEC = "wait_msec"
+    RATE = "rate"
+    PROFILE = "profile"
 
     @staticmethod
     def byValue(value:str) -> TaskType:
@@ -36,102 +47,545 @@ class Task:
     definition:Union[Dict, List, str, int, float]
     result_queue:Queue
     error_queue:Queue
+    other_queue:Union[Queue, None]
 
     def __init__(self, 
                  task_name:str, task_definition:dict, 
-                 result_queue:Queue, error_queue:Queue):
-        ''' '''
+                 result_queue:Queue, error_queue:Queue,
+                 other_queue:Union[Queue, None]=None):
+        ''' other_queue - for task measurements which are not request results (optional) '''
         self.name = task_name
         self.definition = task_definition
         self.result_queue = result_queue
         self.error_queue = error_queue
+        self.other_queue = other_queue
+
+    def _report_other(self, message:dict):
+        ''' send non-result measurement to the other queue (if provided) '''
+        if self.other_queue is not None:
+            self.other_queue.put_nowait({**message, **{"task": self.name}})
+
+    @staticmethod
+    def _stop_condition(options:dict)->Union[Callable[[], bool], None]:
+        ''' long waits are interrupted when the stage or the plan is stopped by the guardrail '''
+        return (lambda: is_stopped(options)) if len(options.get("stop_events", [])) > 0 else None
 
     def execute(self, dry_run:bool, options:Union[Dict, None]=None):
         ''' '''
 
+    async def execute_async(self, dry_run:bool, options:Union[Dict, None]=None):
+        ''' asyncio engine version of execute. By default sync execute is run in a separate thread '''
+        await asyncio.to_thread(self.execute, dry_run, options)
+
 class TaskWait(Task):
     ''' '''
-    def execute(self, dry_run:bool, options:Union[Dict, None]=None):
-        ''' '''
-        if dry_run:
-            return
+    def _wait_seconds(self)->Union[float, None]:
+        ''' wait duration in seconds or None if definition is incorrect (error will be reported) '''
         if isinstance(self.definition, (int, float)):
             if self.name.endswith("msec"):
-                time.sleep(self.definition/1000)
+                return self.definition/1000
             elif self.name.endswith("sec"):
-                time.sleep(self.definition)
+                return self.definition
             elif self.name.endswith("min"):
-                time.sleep(self.definition*60)
+                return self.definition*60
             else:
                 self.error_queue.put(f"Unknown wait type {self.name}")
         else:
             self.error_queue.put(f"Wait Task should have just a numeric value but has {self.definition}")
+        return None
+
+    def _deadline(self, wait_seconds:float, options:dict)->Tuple[float, float]:
+        ''' (anchor, deadline) - wait is counted from the latest activity on the plan timeline (or from now) '''
+        timeline:Union[Timeline, None] = options.get("timeline", None)
+        anchor = timeline.anchor() if timeline is not None else perf_counter()
+        return (anchor, anchor + wait_seconds)
+
+    def _complete_wait(self, wait_seconds:float, anchor:float, deadline:float, woke:float, options:dict):
+        ''' next wait (if any) is counted from the deadline and planned vs actual wait is reported '''
+        timeline:Union[Timeline, None] = options.get("timeline", None)
+        if timeline is not None:
+            timeline.mark(deadline)
+        self._report_other({
+            "wait_planned": wait_seconds * 1000,
+            "wait_actual": (woke - anchor) * 1000,
+            "wait_drift": (woke - deadline) * 1000,
+        })
+
+    def execute(self, dry_run:bool, options:Union[Dict, None]=None):
+        ''' wait till the absolute deadline '''
+        if dry_run:
+            return
+        options = options or {}
+        wait_seconds = self._wait_seconds()
+        if wait_seconds is not None:
+            anchor, deadline = self._deadline(wait_seconds, options)
+            woke = sleep_until(deadline, stopped=self._stop_condition(options))
+            if not is_stopped(options):
+                self._complete_wait(wait_seconds, anchor, deadline, woke, options)
+
+    async def execute_async(self, dry_run:bool, options:Union[Dict, None]=None):
+        ''' '''
+        if dry_run:
+            return
+        options = options or {}
+        wait_seconds = self._wait_seconds()
+        if wait_seconds is not None:
+            anchor, deadline = self._deadline(wait_seconds, options)
+            woke = await sleep_until_async(deadline, stopped=self._stop_condition(options))
+            if not is_stopped(options):
+                self._complete_wait(wait_seconds, anchor, deadline, woke, options)
 
 class TaskRequest(Task):
     ''' '''
     aws_credentials:Union[Dict[str, Union[str, None]],None] = None
+    _aws_credentials_lock = threading.Lock()
+
+    def _connection_mode(self, options:dict)->ConnectionMode:
+        ''' connection mode requested by the task or by the plan '''
+        if "connection" in self.definition:
+            return ConnectionMode.byValue(self.definition["connection"])
+        return options.get("connection", ConnectionMode.REUSE)
+
+    @staticmethod
+    def _assume_role()->Dict[str, Union[str, None]]:
+        ''' credentials of the predefined role - the role is assumed once per process (blocking boto3 call) '''
+        if TaskRequest.aws_credentials is None:
+            with TaskRequest._aws_credentials_lock:
+                if TaskRequest.aws_credentials is None:
+                    with open("cloud_config.json", "r") as f:
+                        cloud_config = json.load(f)
+                    # we'll assume predefined role
+                    sts_client = boto3.client('sts')
+                    assume_role_resp = sts_client.assume_role(
+                        RoleArn=cloud_config["ApiTestRoleStack"]["ApiInvocationRoleArn"],
+                        RoleSessionName=str(uuid4()),
+                        DurationSeconds=10*60*60 # 10 hours for running test without reassuming the role (mak 12 per Role definition)
+                    )
+                    aws_creds = assume_role_resp["Credentials"]
+                    TaskRequest.aws_credentials = {
+                        "access_key_id": aws_creds["AccessKeyId"],
+                        "secret_access_key": aws_creds["SecretAccessKey"],
+                        "session_token": aws_creds["SessionToken"]
+                    }
+        return TaskRequest.aws_credentials
+
+    def _needs_role(self)->bool:
+        ''' IAM authentication requested and the role is not assumed yet '''
+        return (self.definition.get("auth", "") or "") == "IAM" and TaskRequest.aws_credentials is None
+
+    def _configure_auth(self, request:TestRequest):
+        ''' fill in request credentials per task definition '''
+        # we need to identify what is desired authentication for this request
+        request_auth = self.definition.get("auth", "") or ""
+        match request_auth:
+            case "IAM":
+                # IAM authentication requested
+                request.auth_creds = { 
+                    **{ "auth_type": TestRequestAuthType.AWS_ASSUME },
+                    **TaskRequest._assume_role()
+                }
+            case "":
+                # we don't have any auth
+                # in our pattern this means do nothing
+                pass
+            case _:
+                # we have a token!
+                request.auth_creds = {
+                    "auth_type": TestRequestAuthType.JWT,
+                    "BEARER": request_auth
+                }
+
+    def _place_arguments(self, dry_run:bool)->dict:
+        return {
+            "url": self.definition["uri"], #! NOTE that uri supports format of <scheme>://<netloc>/<path>?<query>#<fragment>
+            "method": self.definition.get("method", "GET"),
+            "headers": self.definition.get("headers", {}),
+            "body": self.definition.get("body", None),
+            "dry_run": dry_run,
+        }
+
+    def _report_result(self, req_result:dict, extra_fields:dict):
+        ''' send request result to the result queue (or error queue if not successful) '''
+        if isinstance(req_result,dict) and req_result.get("statusCode",None) == 200:
+            self.result_queue.put_nowait({**req_result, **{"task": self.name}, **extra_fields})
+        else:
+            self.error_queue.put_nowait({**req_result, **{"task": self.name}, **extra_fields})
+
+    def _report_exception(self, e:Exception, extra_fields:dict):
+        message = f"Fail to execute request to URI {self.definition.get('uri','UNKNOWN')} with exception {e}"
+        _top_logger.error(message)
+        self.error_queue.put_nowait({"message": message, "task": self.name, **extra_fields})
+
+    def _report_incorrect_definition(self):
+        message = f"Request Task should have a dictionary as a definition but has {self.definition}"
+        _top_logger.error(message)
+        self.error_queue.put_nowait({"message": message, "task": self.name})
 
     def execute(self, dry_run:bool=False, options:Union[Dict, None]=None):
         ''' '''
-        if isinstance(self.definition, dict):
-            request = TestRequest()
-            # we need to identify what is desired authentication for this request
-            request_auth = self.definition.get("auth", "") or ""
-            match request_auth:
-                case "IAM":
-                    # IAM authentication requested
-                    if TaskRequest.aws_credentials is None:
-                        with open("cloud_config.json", "r") as f:
-                            cloud_config = json.load(f)
-                        # we'll assume predefined role
-                        sts_client = boto3.client('sts')
-                        assume_role_resp = sts_client.assume_role(
-                            RoleArn=cloud_config["ApiTestRoleStack"]["ApiInvocationRoleArn"],
-                            RoleSessionName=str(uuid4()),
-                            DurationSeconds=10*60*60 # 10 hours for running test without reassuming the role (mak 12 per Role definition)
-                        )
-                        aws_creds = assume_role_resp["Credentials"]
-                        TaskRequest.aws_credentials = {
-                            "access_key_id": aws_creds["AccessKeyId"],
-                            "secret_access_key": aws_creds["SecretAccessKey"],
-                            "session_token": aws_creds["SessionToken"]
-                        }
-                    request.auth_creds = { 
-                        **{ "auth_type": TestRequestAuthType.AWS_ASSUME },
-                        **TaskRequest.aws_credentials
-                    }
-                case "":
-                    # we don't have any auth
-                    # in our pattern this means do nothing
-                    pass
-                case _:
-                    # we have a token!
-                    request.auth_creds = {
-                        "auth_type": TestRequestAuthType.JWT,
-                        "BEARER": request_auth
-                    }
+        if not isinstance(self.definition, dict):
+            self._report_incorrect_definition()
+            return
+        self._place_one(dry_run, options or {})
+
+    async def execute_async(self, dry_run:bool=False, options:Union[Dict, None]=None):
+        ''' '''
+        if not isinstance(self.definition, dict):
+            self._report_incorrect_definition()
+            return
+        await self._place_one_async(dry_run, options or {})
+
+    def _place_one(self, dry_run:bool, options:dict, intended_start:Union[float, None]=None, tags:Union[dict, None]=None):
+        ''' 
+        place one request and report the result
+        intended_start - perf_counter() value when request was supposed to be sent (see _intended_timing)
+
+        tags - extra fields to be added to the result
+        '''
+        # we'll use pooled keep-alive connection unless fresh connection requested by the task or by the plan
+        connection_mode = self._connection_mode(options)
+        connection_pool:Union[ConnectionPool, None] = options.get("connection_pool", None)
+        overhead_timers = options.get("overhead_timers", False)
+        request = TestRequest(
+            session=connection_pool.session_for(self.definition.get("uri", ""), options.get("max_in_flight", 0)) if connection_mode==ConnectionMode.REUSE and connection_pool is not None else None,
+            overhead_timers=overhead_timers
+        )
+        extra_fields = {"connection": connection_mode.value, **self._warmup_fields(), **(tags or {})}
+        try:
+            auth_start = perf_counter()
+            self._configure_auth(request)
+            if overhead_timers:
+                extra_fields["overhead_auth"] = (perf_counter() - auth_start) * 1000
+            if not self._wait_rate_limit(dry_run, options, extra_fields):
+                return
             # now we're ready to place a request
+            sent = perf_counter()
             try:
-                req_result = request.place(
-                    url=self.definition["uri"], #! NOTE that uri supports format of <scheme>://<netloc>/<path>?<query>#<fragment>
-                    method=self.definition.get("method", "GET"),
-                    headers=self.definition.get("headers", {}),
-                    body=self.definition.get("body", None),
-                    dry_run=dry_run,
-                )
-                if isinstance(req_result,dict) and req_result.get("statusCode",None) == 200:
-                    self.result_queue.put_nowait({**req_result, **{"task": self.name}})
-                else:
-                    self.error_queue.put_nowait({**req_result, **{"task": self.name}})
-
-            except Exception as e:
-                message = f"Fail to execute request to URI {self.definition.get('uri','UNKNOWN')} with exception {e}"
-                _top_logger.error(message)
-                self.error_queue.put_nowait({"message": message, "task": self.name})
-        else:
-            message = f"Request Task should have a dictionary as a definition but has {self.definition}"
-            _top_logger.error(message)
-            self.error_queue.put_nowait({"message": message, "task": self.name})
+                req_result = request.place(**self._place_arguments(dry_run))
+            finally:
+                # waits are counted from the completion of the failed request as well
+                self._mark_completion(options)
+            if intended_start is not None:
+                extra_fields.update(self._intended_timing(req_result, intended_start, sent))
+            if overhead_timers:
+                # collector will turn it into overhead_queue (see ResultCollector)
+                extra_fields["overhead_enqueued"] = perf_counter()
+            self._report_result(req_result, extra_fields)
+        except Exception as e:
+            self._report_exception(e, extra_fields)
+        finally:
+            request.close()
+
+    async def _place_one_async(self, dry_run:bool, options:dict, intended_start:Union[float, None]=None, tags:Union[dict, None]=None):
+        ''' asyncio engine version of _place_one '''
+        connection_mode = self._connection_mode(options)
+        # asyncio engine provides the pool - see TestPlan.execute
+        async_pool = options["async_connection_pool"]
+        from .async_request import AsyncTestRequest   # aiohttp is required by asyncio engine only
+        overhead_timers = options.get("overhead_timers", False)
+        request = AsyncTestRequest(
+            session=async_pool.session(options.get("max_in_flight", 0)) if connection_mode==ConnectionMode.REUSE else async_pool.fresh_session(),
+            own_session=connection_mode!=ConnectionMode.REUSE,
+            overhead_timers=overhead_timers
+        )
+        extra_fields = {"connection": connection_mode.value, **self._warmup_fields(), **(tags or {})}
+        try:
+            auth_start = perf_counter()
+            if self._needs_role():
+                # boto3 is blocking - role is assumed outside of the event loop
+                await asyncio.to_thread(TaskRequest._assume_role)
+            self._configure_auth(request)
+            if overhead_timers:
+                extra_fields["overhead_auth"] = (perf_counter() - auth_start) * 1000
+            if not await self._wait_rate_limit_async(dry_run, options, extra_fields):
+                return
+            # now we're ready to place a request
+            sent = perf_counter()
+            try:
+                req_result = await request.place_async(**self._place_arguments(dry_run))
+            finally:
+                # waits are counted from the completion of the failed request as well
+                self._mark_completion(options)
+            if intended_start is not None:
+                extra_fields.update(self._intended_timing(req_result, intended_start, sent))
+            if overhead_timers:
+                # collector will turn it into overhead_queue (see ResultCollector)
+                extra_fields["overhead_enqueued"] = perf_counter()
+            self._report_result(req_result, extra_fields)
+        except Exception as e:
+            self._report_exception(e, extra_fields)
+        finally:
+            await request.close_async()
+
+    def _warmup_fields(self)->dict:
+        ''' task "warmup" settings for the report aggregator (see TestPlan/warmup.py) '''
+        return {"warmup_detection": self.definition["warmup"]} if "warmup" in self.definition else {}
+
+    def _rate_limit_deadline(self, options:dict)->Union[float, None]:
+        ''' take tokens of the plan and stage rate limits - returns perf_counter() moment when the request can be sent '''
+        rate_limiters:List[RateLimiter] = options.get("rate_limiters", [])
+        if len(rate_limiters) == 0:
+            return None
+        return reserve_all(rate_limiters, self.definition.get("uri", ""))
+
+    def _wait_rate_limit(self, dry_run:bool, options:dict, extra_fields:dict)->bool:
+        ''' wait for the rate limit (if any) and add rate_limit_wait (msec) to the result - False if stopped while waiting '''
+        deadline = self._rate_limit_deadline(options)
+        if deadline is None:
+            return True
+        wait_start = perf_counter()
+        if not dry_run:
+            sleep_until(deadline, stopped=self._stop_condition(options))
+        extra_fields["rate_limit_wait"] = (perf_counter() - wait_start) * 1000
+        return not is_stopped(options)
+
+    async def _wait_rate_limit_async(self, dry_run:bool, options:dict, extra_fields:dict)->bool:
+        ''' asyncio engine version of _wait_rate_limit '''
+        deadline = self._rate_limit_deadline(options)
+        if deadline is None:
+            return True
+        wait_start = perf_counter()
+        if not dry_run:
+            await sleep_until_async(deadline, stopped=self._stop_condition(options))
+        extra_fields["rate_limit_wait"] = (perf_counter() - wait_start) * 1000
+        return not is_stopped(options)
+
+    @staticmethod
+    def _mark_completion(options:dict):
+        ''' waits of the plan are counted from the latest request completion '''
+        timeline:Union[Timeline, None] = options.get("timeline", None)
+        if timeline is not None:
+            timeline.mark()
+
+    @staticmethod
+    def _intended_timing(req_result:dict, intended_start:float, sent:float)->dict:
+        ''' 
+        latency measured from the intended send time (free from coordinated omission)
+        original request latency is preserved as service_latency
+        '''
+        completed = perf_counter()
+        return {
+            "intended_timestamp": req_result["place_timestamp"] - (sent - intended_start),
+            "send_delay": (sent - intended_start) * 1000,
+            "service_latency": req_result["latency"],
+            "latency": (completed - intended_start) * 1000,
+        }
+
+class TaskRate(TaskRequest):
+    ''' 
+    open-loop request task - requests are sent at the fixed ("constant") or Poisson ("poisson") arrival rate
+    independently from response times. Task definition is the same as for the request task plus:
+
+        "rps" - target requests per second (REQUIRED)
+
+        "duration_sec" - how long to keep the rate (REQUIRED)
+
+        "arrival" - "constant" (default) or "poisson"
+
+        "max_in_flight" - max number of requests placed at the same time (and kept alive connections to the host), default 100
+
+        "seed" - random seed for "poisson" arrival (optional)
+
+    Every result has intended_timestamp and latency measured from the intended send time
+    '''
+    def _arrival_offsets(self, rps:float, duration:float, rand:random.Random, phase:float=0.0)->Generator[float, None, None]:
+        ''' 
+        intended send times (sec from the start of the duration) for the rps.
+        phase - share of the "constant" arrival interval left till the first arrival (see TaskProfile._schedule)
+        '''
+        if rps <= 0 or duration <= 0:
+            return
+        arrival = self.definition.get("arrival", "constant")
+        match arrival:
+            case "constant":
+                # arrivals are counted in intervals - tolerance keeps float error of rps * duration from adding one more
+                arrival_i = phase
+                while arrival_i < rps * duration - 1e-9:
+                    yield arrival_i / rps
+                    arrival_i += 1
+            case "poisson":
+                offset = rand.expovariate(rps)
+                while offset < duration:
+                    yield offset
+                    offset += rand.expovariate(rps)
+            case _:
+                raise ValueError(f"Unknown arrival '{arrival}' for the task {self.name}")
+
+    def _schedule(self)->Generator[Tuple[float, dict], None, None]:
+        ''' intended send times (sec from the task start) with tags for the result '''
+        rand = random.Random(self.definition.get("seed", None))
+        for offset in self._arrival_offsets(float(self.definition["rps"]), float(self.definition["duration_sec"]), rand):
+            yield (offset, {})
+
+    def execute(self, dry_run:bool=False, options:Union[Dict, None]=None):
+        ''' '''
+        if not isinstance(self.definition, dict):
+            self._report_incorrect_definition()
+            return
+        self._run_open_loop(self._schedule(), dry_run, options or {})
+
+    async def execute_async(self, dry_run:bool=False, options:Union[Dict, None]=None):
+        ''' '''
+        if not isinstance(self.definition, dict):
+            self._report_incorrect_definition()
+            return
+        await self._run_open_loop_async(self._schedule(), dry_run, options or {})
+
+    def _max_in_flight(self)->int:
+        return int(self.definition.get("max_in_flight", 100))
+
+    def _run_open_loop(self, schedule:Iterable[Tuple[float, dict]], dry_run:bool, options:dict):
+        ''' send requests at the intended times from the schedule '''
+        max_in_flight = self._max_in_flight()
+        # keep-alive pool of the task is sized to the requests in flight (see ConnectionPool.session_for)
+        options = {**options, "max_in_flight": max_in_flight}
+        task_start = perf_counter()
+        with ThreadPoolExecutor(max_workers=max_in_flight) as requests_pool:
+            for offset, tags in schedule:
+                intended_start = task_start + offset
+                if not dry_run:
+                    sleep_until(intended_start)
+                if is_stopped(options):
+                    break
+                # if all workers are busy request waits in the pool queue and this wait is included into the latency
+                requests_pool.submit(self._place_one, dry_run, options, intended_start, tags)
+
+    async def _run_open_loop_async(self, schedule:Iterable[Tuple[float, dict]], dry_run:bool, options:dict):
+        ''' asyncio engine version of _run_open_loop '''
+        in_flight_limit = asyncio.Semaphore(self._max_in_flight())
+        options = {**options, "max_in_flight": self._max_in_flight()}
+
+        async def place_at(intended_start:float, tags:dict):
+            async with in_flight_limit:
+                await self._place_one_async(dry_run, options, intended_start, tags)
+
+        requests_placed = set()
+        task_start = perf_counter()
+        for offset, tags in schedule:
+            intended_start = task_start + offset
+            if not dry_run:
+                await sleep_until_async(intended_start)
+            if is_stopped(options):
+                break
+            one_request = asyncio.create_task(place_at(intended_start, tags))
+            requests_placed.add(one_request)
+            one_request.add_done_callback(requests_placed.discard)
+        if len(requests_placed) > 0:
+            await asyncio.gather(*requests_placed)
+
+class TaskProfile(TaskRate):
+    ''' 
+    load profile task - request load follows the list of ramp/step segments. Task definition is the same as for the rate task
+    ("rps" and "duration_sec" are not used) plus:
+
+        "load" - "rate" (default, open-loop requests per second) or "concurrency" (number of closed-loop virtual users)
+
+        "segments" - list of {"start": <load>, "end": <load>, "duration_sec": <sec>, "step": <load increment>} (REQUIRED)
+            load is changed from start to end by step and every level is kept for the equal share of the segment duration.
+            If step is not provided load is changed every second
+
+    Every result is tagged with load_mode, load_segment and load_level
+    '''
+    def _load_mode(self)->str:
+        load_mode = self.definition.get("load", "rate")
+        if load_mode not in ("rate", "concurrency"):
+            raise ValueError(f"Unknown load '{load_mode}' for the profile task {self.name}")
+        return load_mode
+
+    def _levels(self)->Generator[Tuple[float, float, dict], None, None]:
+        ''' (level start sec from the task start, level duration sec, level tags) for all segments '''
+        level_start = 0.0
+        load_mode = self._load_mode()
+        for segment_i, segment in enumerate(self.definition["segments"]):
+            start = float(segment["start"])
+            end = float(segment.get("end", start))
+            duration = float(segment["duration_sec"])
+            if "step" in segment and float(segment["step"]) > 0:
+                steps_count = int(abs(end - start) // float(segment["step"]))
+                levels = [start + math.copysign(float(segment["step"]), end - start) * i for i in range(steps_count + 1)]
+                if levels[-1] != end:
+                    levels.append(end)
+            else:
+                # ramp has at least start and end levels even if it is shorter than 2 seconds
+                steps_count = max(1 if start == end else 2, int(duration))
+                levels = [start + (end - start) * i / max(1, steps_count - 1) for i in range(steps_count)]
+            level_duration = duration / len(levels)
+            for level in levels:
+                yield (level_start, level_duration, {"load_mode": load_mode, "load_segment": segment_i, "load_level": level})
+                level_start += level_duration
+
+    def _max_users(self)->int:
+        ''' virtual users of the highest level of the "concurrency" load '''
+        return max((int(round(tags["load_level"])) for _, _, tags in self._levels()), default=0)
+
+    def _schedule(self)->Generator[Tuple[float, dict], None, None]:
+        ''' 
+        continuous open-loop schedule through all rate levels - part of the arrival interval not used by the level
+        is carried to the next one, so fractional requests of the levels are not lost (level of 2.5 rps kept for 1 sec twice sends 5 requests)
+        '''
+        rand = random.Random(self.definition.get("seed", None))
+        phase = 0.0
+        for level_start, level_duration, tags in self._levels():
+            placed = 0
+            for offset in self._arrival_offsets(tags["load_level"], level_duration, rand, phase):
+                placed += 1
+                yield (level_start + offset, tags)
+            phase = min(max(0.0, phase + placed - max(0.0, tags["load_level"]) * level_duration), 1.0)
+
+    def execute(self, dry_run:bool=False, options:Union[Dict, None]=None):
+        ''' '''
+        if not isinstance(self.definition, dict):
+            self._report_incorrect_definition()
+            return
+        options = options or {}
+        if self._load_mode() == "rate":
+            self._run_open_loop(self._schedule(), dry_run, options)
+            return
+        # every level runs <level> virtual users placing requests one-by-one till the end of the level
+        options = {**options, "max_in_flight": self._max_users()}
+        task_start = perf_counter()
+        for level_start, level_duration, tags in self._levels():
+            users = max(0, int(round(tags["load_level"])))
+            level_end = task_start + level_start + level_duration
+            if not dry_run:
+                sleep_until(task_start + level_start, stopped=self._stop_condition(options))
+            if is_stopped(options):
+                break
+            if users == 0:
+                continue
+            def virtual_user():
+                # single request per virtual user for the dry run
+                self._place_one(dry_run, options, tags=tags)
+                while not dry_run and perf_counter() < level_end and not is_stopped(options):
+                    self._place_one(dry_run, options, tags=tags)
+            with ThreadPoolExecutor(max_workers=users) as users_pool:
+                for _ in range(users):
+                    users_pool.submit(virtual_user)
+
+    async def execute_async(self, dry_run:bool=False, options:Union[Dict, None]=None):
+        ''' '''
+        if not isinstance(self.definition, dict):
+            self._report_incorrect_definition()
+            return
+        options = options or {}
+        if self._load_mode() == "rate":
+            await self._run_open_loop_async(self._schedule(), dry_run, options)
+            return
+        options = {**options, "max_in_flight": self._max_users()}
+        task_start = perf_counter()
+        for level_start, level_duration, tags in self._levels():
+            users = max(0, int(round(tags["load_level"])))
+            level_end = task_start + level_start + level_duration
+            if not dry_run:
+                await sleep_until_async(task_start + level_start, stopped=self._stop_condition(options))
+            if is_stopped(options):
+                break
+            async def virtual_user():
+                # single request per virtual user for the dry run
+                await self._place_one_async(dry_run, options, tags=tags)
+                while not dry_run and perf_counter() < level_end and not is_stopped(options):
+                    await self._place_one_async(dry_run, options, tags=tags)
+            await asyncio.gather(*[virtual_user() for _ in range(users)])
 
 
 
@@ -143,6 +597,8 @@ class TaskFactory:
             TaskType.WAIT_MIN: TaskWait,
             TaskType.WAIT_SEC: TaskWait,
             TaskType.WAIT_MSEC: TaskWait,
+            TaskType.RATE: TaskRate,
+            TaskType.PROFILE: TaskProfile,
         }
     
     def __init__(self):
@@ -151,12 +607,12 @@ class TaskFactory:
         _top_logger.debug(f"TaskFactory initialized with {self._TASKS_BY_TYPES}")
 
     def create(self, task_type:str, task_name:str, task_definition:dict,
-               result_queue:Queue, error_queue:Queue) -> Task:
+               result_queue:Queue, error_queue:Queue, other_queue:Union[Queue, None]=None) -> Task:
         ''' '''
         task_type = clean_name(task_type)
         if task_type in TaskType:
             task_class = self._TASKS_BY_TYPES[TaskType.byValue(task_type)]
-            return task_class(task_name, task_definition, result_queue, error_queue)
+            return task_class(task_name, task_definition, result_queue, error_queue, other_queue)
         else:
             raise Exception(f"Unknown task type {task_type}")
 
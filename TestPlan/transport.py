@@ -0,0 +1,97 @@
+'''
+© 2024 Daniil Sokolov <daniil.sokolov@webcloudai.com>
+MIT License
+'''
+from typing import Dict, Union
+from time import perf_counter
+import threading
+import socket
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import NameResolutionError
+import logging
+_top_logger = logging.getLogger(__name__)
+
+# connection phases timings of the request currently placed by this thread
+_phase_timing_local = threading.local()
+
+
+def start_phase_timing()->Dict[str, Union[float, bool]]:
+    '''
+    start collecting connection phases timings for the request placed by this thread
+    all values are in msec and will be 0 if connection was reused from the pool
+    '''
+    timing:Dict[str, Union[float, bool]] = {
+        "latency_dns": 0.0,
+        "latency_connect": 0.0,
+        "latency_tls": 0.0,
+        "connection_reused": True,
+    }
+    _phase_timing_local.timing = timing
+    return timing
+
+def stop_phase_timing():
+    ''' stop collecting connection phases timings for this thread '''
+    _phase_timing_local.timing = None
+
+
+class _PhaseTimingMixin:
+    ''' measure DNS resolution, TCP connect and TLS handshake of the new connection '''
+
+    def _new_conn(self):
+        timing = getattr(_phase_timing_local, "timing", None)
+        if timing is None:
+            return super()._new_conn()
+        dns_host = self._dns_host
+        start = perf_counter()
+        try:
+            address = socket.getaddrinfo(dns_host, self.port, 0, socket.SOCK_STREAM)[0][4][0]
+        except socket.gaierror as e:
+            raise NameResolutionError(self.host, self, e) from e
+        resolved = perf_counter()
+        # connect to already resolved address (TLS will still use original host name)
+        self._dns_host = address
+        try:
+            sock = super()._new_conn()
+        finally:
+            self._dns_host = dns_host
+        timing["latency_dns"] = (resolved - start) * 1000
+        timing["latency_connect"] = (perf_counter() - resolved) * 1000
+        return sock
+
+    def connect(self):
+        start = perf_counter()
+        super().connect()
+        timing = getattr(_phase_timing_local, "timing", None)
+        if timing is None:
+            return
+        timing["connection_reused"] = False
+        if isinstance(self, HTTPSConnection):
+            # everything after socket connection is TLS handshake
+            timing["latency_tls"] = max(0.0, (perf_counter() - start) * 1000 - timing["latency_dns"] - timing["latency_connect"])
+
+class TimedHTTPConnection(_PhaseTimingMixin, HTTPConnection):
+    ''' '''
+
+class TimedHTTPSConnection(_PhaseTimingMixin, HTTPSConnection):
+    ''' '''
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ''' '''
+    ConnectionCls = TimedHTTPConnection
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ''' '''
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    ''' HTTPAdapter creating connections with phases timing instrumentation '''
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": TimedHTTPConnectionPool,
+            "https": TimedHTTPSConnectionPool,
+        }
@@ -0,0 +1,84 @@
+'''
+© 2024 Daniil Sokolov <daniil.sokolov@webcloudai.com>
+MIT License
+'''
+from typing import List, Union, Sequence
+import math
+import logging
+_top_logger = logging.getLogger(__name__)
+
+# moving window settings used when the task has no "warmup" definition
+DEFAULT_WARMUP = {
+    "window": 10,       # number of consecutive requests checked for the steady state
+    "max_cv": 0.25,     # window is steady when latency stddev / mean is not above this value
+    "min": 0,           # number of first requests always tagged as warm-up
+    "max": None,        # max number of requests tagged as warm-up (None - not limited)
+}
+
+# record fields used to detect the warm-up
+WARMUP_FIELDS = ("latency", "place_timestamp", "request_url", "warmup_detection")
+
+
+def warmup_settings(definition:Union[dict, bool, int, None])->Union[dict, None]:
+    '''
+    task "warmup" definition into the detection settings:
+
+        not provided or true - moving window detection with default settings
+
+        false - no warm-up tagging
+
+        number - fixed number of first requests is the warm-up
+
+        {"window": .., "max_cv": .., "min": .., "max": ..} - moving window detection with these settings
+    '''
+    if definition is None or definition is True:
+        return dict(DEFAULT_WARMUP)
+    if definition is False:
+        return None
+    if isinstance(definition, int):
+        return {**DEFAULT_WARMUP, "min": definition, "max": definition}
+    if isinstance(definition, dict):
+        return {**DEFAULT_WARMUP, **definition}
+    raise ValueError(f"Incorrect warmup definition {definition}")
+
+
+def steady_start(latencies:List[float], settings:dict)->int:
+    '''
+    index of the first steady-state request - start of the first window of consecutive requests
+    with the latency coefficient of variation not above max_cv.
+    If steady state is never reached only "min" first requests are the warm-up
+    '''
+    count = len(latencies)
+    first = min(int(settings.get("min", 0) or 0), count)
+    last = count if settings.get("max", None) is None else min(int(settings["max"]), count)
+    if first >= last:
+        return first
+    window = max(2, int(settings.get("window", DEFAULT_WARMUP["window"])))
+    max_cv = float(settings.get("max_cv", DEFAULT_WARMUP["max_cv"]))
+    if count - first < window:
+        return first
+    # running sums of the window so every step is O(1)
+    total = sum(latencies[first:first + window])
+    total_sq = sum(one_latency * one_latency for one_latency in latencies[first:first + window])
+    for start in range(first, min(last, count - window) + 1):
+        if start > first:
+            dropped, added = latencies[start - 1], latencies[start + window - 1]
+            total += added - dropped
+            total_sq += added * added - dropped * dropped
+        mean = total / window
+        variance = max(0.0, total_sq / window - mean * mean)
+        if mean > 0 and math.sqrt(variance) / mean <= max_cv:
+            return start
+    return last if settings.get("max", None) is not None else first
+
+
+def warmup_positions(timestamps:Sequence[float], latencies:Sequence[float], settings:Union[dict, None])->List[int]:
+    '''
+    positions (in the given order) of the warm-up requests of one series (e.g. requests of the stage to the same url)
+    timestamps - place timestamps of the requests, settings - from warmup_settings (None - no warm-up)
+    '''
+    if settings is None:
+        return []
+    order = sorted(range(len(timestamps)), key=timestamps.__getitem__)
+    steady = steady_start([latencies[sample_i] for sample_i in order], settings)
+    return order[:steady]
@@ -0,0 +1,172 @@
+'''
+© 2024 Daniil Sokolov <daniil.sokolov@webcloudai.com>
+MIT License
+'''
+from typing import List, Tuple, Any
+from pathlib import Path
+from xml.sax.saxutils import quoteattr, unescape
+import tempfile
+import zipfile
+import shutil
+import re
+import os
+import openpyxl
+import logging
+_top_logger = logging.getLogger(__name__)
+
+# max number of rows of the Excel sheet
+EXCEL_MAX_ROWS = 1048576
+
+_WORKSHEET_TYPE = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"
+_RELATIONSHIPS_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_WORKSHEET_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"
+
+
+class XlsxSheetWriter:
+    '''
+    Streams rows into new sheet(s) of the xlsx workbook. Rows are written by the openpyxl write-only workbook
+    (kept in temporary files, not in memory) and on close new sheets are added to the destination workbook
+    on the package (zip) level - existing sheets are copied as is without being loaded.
+    When the sheet reaches max_rows next rows go to the new sheet "<sheet name>_2", "<sheet name>_3", .. with the same header.
+    Rows should have plain values (strings, numbers, booleans) - new sheets don't bring styles into the destination workbook
+
+        with XlsxSheetWriter(destination, sheet_name, header) as writer:
+            for row in rows:
+                writer.append(row)
+    '''
+    def __init__(self, destination:Path, sheet_name:str, header:List[Any], max_rows:int=EXCEL_MAX_ROWS):
+        self._destination = Path(destination)
+        self._sheet_name = sheet_name
+        self._header = list(header)
+        # header row is the part of every sheet
+        self._max_rows = max(2, int(max_rows))
+        self._workbook = openpyxl.Workbook(write_only=True)
+        self._sheet_names:List[str] = []
+        self._sheet = None
+        self._rows = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+
+    def _new_sheet(self):
+        sheet_name = self._sheet_name if len(self._sheet_names) == 0 else f"{self._sheet_name}_{len(self._sheet_names) + 1}"
+        self._sheet_names.append(sheet_name)
+        self._sheet = self._workbook.create_sheet(title=sheet_name)
+        self._sheet.append(self._header)
+        self._rows = 1
+
+    def append(self, row:List[Any]):
+        ''' '''
+        if self._sheet is None or self._rows >= self._max_rows:
+            self._new_sheet()
+        self._sheet.append(row)
+        self._rows += 1
+
+    def close(self):
+        ''' save new sheets into the destination workbook (new workbook is created if destination doesn't exist) '''
+        if self._sheet is None:
+            self._new_sheet()
+        if not self._destination.is_file():
+            self._workbook.save(self._destination)
+            return
+        with tempfile.TemporaryDirectory() as tmp_folder:
+            new_sheets = Path(tmp_folder) / "new_sheets.xlsx"
+            self._workbook.save(new_sheets)
+            tmp_destination = self._destination.with_name(f"{self._destination.name}.tmp")
+            try:
+                _add_sheets(self._destination, new_sheets, tmp_destination)
+                os.replace(tmp_destination, self._destination)
+            finally:
+                tmp_destination.unlink(missing_ok=True)
+        _top_logger.info(f"Sheets {self._sheet_names} are added to {self._destination}")
+
+
+def _copy_entry(source:zipfile.ZipFile, name:str, target:zipfile.ZipFile, target_name:str):
+    ''' entry is streamed (not loaded into memory) '''
+    info = source.getinfo(name)
+    with source.open(info) as src, target.open(target_name, "w", force_zip64=info.file_size >= zipfile.ZIP64_LIMIT) as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+
+def _workbook_part(package:zipfile.ZipFile)->str:
+    ''' location of the workbook part (xl/workbook.xml for workbooks created by Excel or openpyxl) '''
+    rels = package.read("_rels/.rels").decode("utf-8")
+    for relationship in re.findall(r"<(?:\w+:)?Relationship\b[^>]*>", rels):
+        if re.search(r'Type="[^"]*/officeDocument"', relationship):
+            return re.search(r'Target="([^"]*)"', relationship).group(1).lstrip("/")
+    return "xl/workbook.xml"
+
+def _insert_before_end(xml:str, tag:str, elements:List[Tuple[str, str]])->str:
+    ''' (element name, attributes) elements are inserted before the closing tag using the same namespace prefix '''
+    closing = list(re.finditer(rf"</(\w+:)?{tag}\s*>", xml))
+    if len(closing) == 0:
+        raise ValueError(f"No {tag} element in the workbook")
+    prefix = closing[-1].group(1) or ""
+    position = closing[-1].start()
+    return xml[:position] + "".join(f"<{prefix}{name} {attributes}/>" for name, attributes in elements) + xml[position:]
+
+def _new_sheets(package:zipfile.ZipFile)->List[Tuple[str, str]]:
+    ''' (sheet name, worksheet part) of the workbook created by XlsxSheetWriter '''
+    workbook_part = _workbook_part(package)
+    workbook = package.read(workbook_part).decode("utf-8")
+    rels = package.read(f"{workbook_part.rsplit('/', 1)[0]}/_rels/{workbook_part.rsplit('/', 1)[1]}.rels").decode("utf-8")
+    targets = {
+        re.search(r'Id="([^"]*)"', relationship).group(1): re.search(r'Target="([^"]*)"', relationship).group(1)
+            for relationship in re.findall(r"<(?:\w+:)?Relationship\b[^>]*>", rels)
+    }
+    result = []
+    for sheet in re.findall(r"<(?:\w+:)?sheet\b[^>]*>", workbook):
+        name = unescape(re.search(r'\bname="([^"]*)"', sheet).group(1), {"&quot;": '"'})
+        target = targets[re.search(r'\b\w+:id="([^"]*)"', sheet).group(1)]
+        result.append((name, target.lstrip("/") if target.startswith("/") else f"{workbook_part.rsplit('/', 1)[0]}/{target}"))
+    return result
+
+def _add_sheets(destination:Path, new_sheets:Path, target:Path):
+    ''' target is the destination workbook with all sheets of the new_sheets workbook added at the end '''
+    with zipfile.ZipFile(destination, "r") as existing, zipfile.ZipFile(new_sheets, "r") as added, \
+         zipfile.ZipFile(target, "w", compression=zipfile.ZIP_DEFLATED) as result:
+        workbook_part = _workbook_part(existing)
+        workbook_folder, workbook_file = workbook_part.rsplit("/", 1)
+        rels_part = f"{workbook_folder}/_rels/{workbook_file}.rels"
+        workbook = existing.read(workbook_part).decode("utf-8")
+        rels = existing.read(rels_part).decode("utf-8")
+        content_types = existing.read("[Content_Types].xml").decode("utf-8")
+        names = set(existing.namelist())
+        sheet_names = set(re.findall(r'<(?:\w+:)?sheet\b[^>]*\bname="([^"]*)"', workbook))
+        sheet_id = max([int(v) for v in re.findall(r'<(?:\w+:)?sheet\b[^>]*\bsheetId="(\d+)"', workbook)] or [0])
+        rel_ids = set(re.findall(r'\bId="([^"]*)"', rels))
+
+        sheet_elements:List[Tuple[str, str]] = []
+        rel_elements:List[Tuple[str, str]] = []
+        type_elements:List[Tuple[str, str]] = []
+        part_i = 0
+        for sheet_name, sheet_part in _new_sheets(added):
+            part_i += 1
+            while f"{workbook_folder}/worksheets/sheet{part_i}.xml" in names:
+                part_i += 1
+            part_name = f"{workbook_folder}/worksheets/sheet{part_i}.xml"
+            names.add(part_name)
+            unique_name, name_i = sheet_name, 1
+            while quoteattr(unique_name)[1:-1] in sheet_names:
+                name_i += 1
+                unique_name = f"{sheet_name}-{name_i}"
+            sheet_names.add(quoteattr(unique_name)[1:-1])
+            sheet_id += 1
+            rel_id = f"rId{sheet_id}"
+            while rel_id in rel_ids:
+                rel_id = f"{rel_id}_"
+            rel_ids.add(rel_id)
+            _copy_entry(added, sheet_part, result, part_name)
+            sheet_elements.append(("sheet", f'xmlns:r="{_RELATIONSHIPS_NS}" name={quoteattr(unique_name)} sheetId="{sheet_id}" r:id="{rel_id}"'))
+            rel_elements.append(("Relationship", f'Id="{rel_id}" Type="{_WORKSHEET_TYPE}" Target="/{part_name}"'))
+            type_elements.append(("Override", f'PartName="/{part_name}" ContentType="{_WORKSHEET_CONTENT_TYPE}"'))
+
+        for name in existing.namelist():
+            if name not in (workbook_part, rels_part, "[Content_Types].xml"):
+                _copy_entry(existing, name, result, name)
+        result.writestr(workbook_part, _insert_before_end(workbook, "sheets", sheet_elements))
+        result.writestr(rels_part, _insert_before_end(rels, "Relationships", rel_elements))
+        result.writestr("[Content_Types].xml", _insert_before_end(content_types, "Types", type_elements))
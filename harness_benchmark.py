@@ -0,0 +1,329 @@
+'''
+© 2024 Daniil Sokolov <daniil.sokolov@webcloudai.com>
+MIT License
+'''
+from typing import Dict, List, Union, Callable, Tuple
+import sys
+import argparse
+from pathlib import Path
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from time import perf_counter
+import multiprocessing
+import contextlib
+import tempfile
+import platform
+import subprocess
+import datetime
+import shutil
+import json
+import time
+import io
+import os
+from TestPlan import TestPlan
+from TestPlan.engine import EngineType
+from TestPlan.reporter import Reporter, ReporterJsonRecords, LogRecord, LogRecordType
+from TestPlan.columnar import ReporterColumnar
+from TestPlan.sqlite import ReporterSqlite
+import logging
+# NOTE that we're logging into stderr
+logging.basicConfig(level=logging.WARNING, stream=sys.stderr, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+_top_logger = logging.getLogger(__name__)
+
+DEFAULT_CONCURRENCY = "1,10,50,100"
+DEFAULT_REQUESTS = 2000
+DEFAULT_DELAY_MSEC = 5.0
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    ''' keep-alive http handler responding after the fixed delay '''
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    delay:float = 0.0
+    body = json.dumps({"message": "ok"}).encode("utf-8")
+
+    def do_GET(self):
+        time.sleep(_StandInHandler.delay)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(_StandInHandler.body)))
+        self.end_headers()
+        self.wfile.write(_StandInHandler.body)
+
+    do_POST = do_GET
+
+    def log_message(self, format, *args):
+        pass
+
+class _StandInServer(ThreadingHTTPServer):
+    ''' '''
+    daemon_threads = True
+    # default listen backlog (5) makes connection bursts of high concurrency levels wait for SYN retransmits
+    request_queue_size = 1024
+
+def _serve(port_queue, delay:float):
+    ''' stand-in server process body '''
+    _StandInHandler.delay = delay
+    server = _StandInServer(("127.0.0.1", 0), _StandInHandler)
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+def start_stand_in(delay:float)->Tuple[multiprocessing.Process, int]:
+    ''' start stand-in server in the separate process (so it doesn't compete with the harness for GIL), returns (process, port) '''
+    mp_context = multiprocessing.get_context("spawn")
+    port_queue = mp_context.Queue()
+    server_process = mp_context.Process(target=_serve, args=(port_queue, delay), daemon=True)
+    server_process.start()
+    return (server_process, port_queue.get(timeout=30))
+
+
+class _ReporterMemory(Reporter):
+    ''' keeps records in memory - baseline without storage cost '''
+    def __init__(self, reporter_options:dict):
+        self._records:Dict[LogRecordType, List[LogRecord]] = {record_type: [] for record_type in LogRecordType}
+
+    def add(self, record:LogRecord):
+        self._records[record.logType].append(record)
+
+    def add_bunch(self, records:List[LogRecord]):
+        for one_rec in records:
+            self.add(one_rec)
+
+    def list_all(self, record_type:LogRecordType)->List[str]:
+        return [str(rec_i) for rec_i in range(len(self._records[record_type]))]
+
+    def get_all(self, record_type:LogRecordType)->List[LogRecord]:
+        return self._records[record_type]
+
+    def get_one(self, record_id)->LogRecord:
+        raise ValueError("Records of the memory reporter can be collected with get_all only")
+
+# reporter name -> factory(work folder)
+REPORTERS:Dict[str, Callable[[Path], Reporter]] = {
+    "memory": lambda folder: _ReporterMemory({}),
+    "json": lambda folder: ReporterJsonRecords({
+        "logs_folder": str(folder / "log_records"),
+        "errs_folder": str(folder / "log_errors"),
+        "others_folder": str(folder / "log_others"),
+    }),
+    "columnar": lambda folder: ReporterColumnar({"folder": str(folder / "log_columns")}),
+    "sqlite": lambda folder: ReporterSqlite({"database": str(folder / "log_records.sqlite")}),
+}
+
+
+def _percentile(sorted_values:List[float], percentile:float)->Union[float, None]:
+    ''' nearest-rank percentile of already sorted values '''
+    if len(sorted_values) == 0:
+        return None
+    rank = max(0, min(len(sorted_values)-1, int(round(percentile / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+# stage of the benchmark plan which is measured (warm-up stage runs before it)
+BENCHMARK_STAGE = "1_benchmark"
+
+def _benchmark_plan(engine:str, concurrency:int, requests_count:int, url:str)->dict:
+    ''' 
+    concurrency closed-loop jobs repeating the same request
+    warm-up stage sends one request per job first, so thread / worker process pools and keep-alive connections
+    are ready (worker processes are shared by all stages of the plan) when the benchmark stage starts
+    '''
+    per_job = max(1, requests_count // concurrency)
+    return {
+        "engine": engine,
+        "max_concurrency": concurrency,
+        "connection": "reuse",
+        "stages": {
+            "0_warmup": {
+                "jobs": {
+                    f"{job_i}_warmup": {
+                        "tasks": {"1_public-bench-no-0": {"TASK_TYPE": "request", "uri": url}}
+                    } for job_i in range(concurrency)
+                }
+            },
+            BENCHMARK_STAGE: {
+                "jobs": {
+                    f"{job_i}_benchmark": {
+                        "repeat": {"count": per_job},
+                        "tasks": {"1_public-bench-no-0": {"TASK_TYPE": "request", "uri": url}}
+                    } for job_i in range(concurrency)
+                }
+            }
+        }
+    }
+
+def _steady_wall(records:List[LogRecord])->float:
+    ''' seconds from the first request sent to the last response received (plan setup and teardown are not included) '''
+    starts = []
+    ends = []
+    for one_rec in records:
+        if not isinstance(one_rec.data, dict) or not isinstance(one_rec.data.get("place_timestamp", None), (int, float)):
+            continue
+        starts.append(one_rec.data["place_timestamp"])
+        ends.append(one_rec.data["place_timestamp"] + (one_rec.data.get("latency", None) or 0.0) / 1000)
+    return max(ends) - min(starts) if len(starts) > 0 else 0.0
+
+def run_one(engine:str, reporter_name:str, concurrency:int, requests_count:int, url:str, delay:float)->dict:
+    ''' 
+    execute one benchmark plan and summarize harness throughput, added latency and CPU cost
+    throughput is measured for the steady state of the benchmark stage, CPU includes the warm-up stage requests
+    '''
+    work_folder = Path(tempfile.mkdtemp(prefix="harness_benchmark_"))
+    reporter = None
+    try:
+        reporter = REPORTERS[reporter_name](work_folder)
+        plan = TestPlan("harness_benchmark", _benchmark_plan(engine, concurrency, requests_count, url), reporter)
+        cpu_start = os.times()
+        wall_start = perf_counter()
+        # stage progress is printed into stdout
+        with contextlib.redirect_stdout(io.StringIO()):
+            plan.execute()
+        total_wall = perf_counter() - wall_start
+        cpu_end = os.times()
+        results = list(reporter.iter_records(LogRecordType.LATENCY, {"stage": BENCHMARK_STAGE}))
+        errors = list(reporter.iter_records(LogRecordType.ERROR, {"stage": BENCHMARK_STAGE}))
+        all_requests = sum(1 for _ in reporter.iter_records(LogRecordType.LATENCY)) + sum(1 for _ in reporter.iter_records(LogRecordType.ERROR))
+        # worker processes of the "process" engine report their own CPU usage
+        workers_cpu = sum(
+            one_rec.data.get("cpu_user_sec", 0.0) + one_rec.data.get("cpu_system_sec", 0.0)
+                for one_rec in reporter.iter_records(LogRecordType.OTHER)
+                    if isinstance(one_rec.data, dict) and one_rec.data.get("task", None) == "cpu_usage"
+        )
+        cpu = (cpu_end.user - cpu_start.user) + (cpu_end.system - cpu_start.system) + workers_cpu
+        overheads = sorted(
+            one_rec.data["latency"] - delay * 1000
+                for one_rec in results if isinstance(one_rec.data, dict) and isinstance(one_rec.data.get("latency", None), (int, float))
+        )
+        requests_placed = len(results) + len(errors)
+        wall = _steady_wall(results + errors)
+        return {
+            "engine": engine,
+            "reporter": reporter_name,
+            "concurrency": concurrency,
+            "requests": requests_placed,
+            "errors": len(errors),
+            "wall_sec": wall,
+            "total_wall_sec": total_wall,
+            "throughput_rps": requests_placed / wall if wall > 0 else 0.0,
+            "overhead_p50_msec": _percentile(overheads, 50),
+            "overhead_p99_msec": _percentile(overheads, 99),
+            "cpu_msec_per_request": cpu * 1000 / all_requests if all_requests > 0 else None,
+        }
+    finally:
+        # flush threads, atexit hooks and database connections must not outlive the work folder
+        if reporter is not None:
+            reporter.close()
+        shutil.rmtree(work_folder, ignore_errors=True)
+
+def _harness_version()->str:
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True, check=True, cwd=Path(__file__).parent).stdout.strip()
+    except Exception:
+        return "unknown"
+
+def compare_with_baseline(results:List[dict], baseline:dict, tolerance:float)->List[str]:
+    ''' regressions of throughput and p99 overhead (more than tolerance share) against the baseline results '''
+    baseline_results = {
+        (one_res["engine"], one_res["reporter"], one_res["concurrency"]): one_res for one_res in baseline.get("results", [])
+    }
+    regressions = []
+    for one_res in results:
+        base_res = baseline_results.get((one_res["engine"], one_res["reporter"], one_res["concurrency"]), None)
+        if base_res is None:
+            continue
+        name = f"{one_res['engine']}/{one_res['reporter']}/{one_res['concurrency']}"
+        if base_res["throughput_rps"] and one_res["throughput_rps"] < base_res["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{name} throughput {base_res['throughput_rps']:.0f} -> {one_res['throughput_rps']:.0f} rps")
+        if base_res["overhead_p99_msec"] is not None and one_res["overhead_p99_msec"] is not None \
+                and one_res["overhead_p99_msec"] > base_res["overhead_p99_msec"] * (1 + tolerance):
+            regressions.append(f"{name} overhead p99 {base_res['overhead_p99_msec']:.2f} -> {one_res['overhead_p99_msec']:.2f} msec")
+    return regressions
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description='''Measure max throughput, added latency and CPU cost of the harness itself against the local stand-in server with the fixed response time''',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=f'''
+
+
+examples:
+
+python harness_benchmark.py
+    This will run every engine with every reporter at concurrency {DEFAULT_CONCURRENCY} and store results into harness_benchmark.json
+
+python harness_benchmark.py --engines thread,asyncio --reporters memory --concurrency 100,500,1000 --requests 20000
+
+python harness_benchmark.py --output new.json --baseline harness_benchmark.json
+    This will compare results with the previous version results and exit with code 1 if any regression found
+
+'''
+    )
+    parser.add_argument("--engines", dest="engines", required=False, default=",".join(v.value for v in EngineType), help="comma-separated engines to measure. Default is all engines")
+    parser.add_argument("--reporters", dest="reporters", required=False, default=",".join(REPORTERS.keys()), help=f"comma-separated reporters to measure ({', '.join(REPORTERS.keys())}). Default is all reporters")
+    parser.add_argument("--concurrency", dest="concurrency", required=False, default=DEFAULT_CONCURRENCY, help=f"comma-separated concurrency levels (jobs running in parallel). Default is {DEFAULT_CONCURRENCY}")
+    parser.add_argument("--requests", dest="requests", required=False, default=DEFAULT_REQUESTS, type=int, help=f"number of requests per measurement. Default is {DEFAULT_REQUESTS}")
+    parser.add_argument("--delay", dest="delay", required=False, default=DEFAULT_DELAY_MSEC, type=float, help=f"response time of the stand-in server (msec). Default is {DEFAULT_DELAY_MSEC}")
+    parser.add_argument("--output", "-o", dest="output_file", required=False, default="harness_benchmark.json", help="location of the results file. Default is 'harness_benchmark.json'")
+    parser.add_argument("--baseline", "-b", dest="baseline_file", required=False, default=None, help="results file of the previous run to compare with")
+    parser.add_argument("--tolerance", dest="tolerance", required=False, default=0.1, type=float, help="allowed throughput / overhead p99 degradation share before reported as regression. Default is 0.1")
+
+    args = parser.parse_args()
+    return args
+
+if __name__=="__main__":
+    my_args = parse_arguments()
+    engines = [one_engine.strip() for one_engine in my_args.engines.split(",") if one_engine.strip()]
+    reporters = [one_reporter.strip() for one_reporter in my_args.reporters.split(",") if one_reporter.strip()]
+    concurrency_levels = [int(one_level) for one_level in my_args.concurrency.split(",") if one_level.strip()]
+    delay = my_args.delay / 1000
+    for one_engine in engines:
+        EngineType.byValue(one_engine)
+    for one_reporter in reporters:
+        if one_reporter not in REPORTERS:
+            raise ValueError(f"Unknown reporter '{one_reporter}'")
+    if EngineType.ASYNCIO.value in engines:
+        try:
+            import aiohttp
+        except ImportError:
+            _top_logger.warning("aiohttp is not available - asyncio engine will not be measured")
+            engines.remove(EngineType.ASYNCIO.value)
+
+    server_process, port = start_stand_in(delay)
+    url = f"http://127.0.0.1:{port}/benchmark"
+    results = []
+    try:
+        for one_engine in engines:
+            # warm up imports (pools and connections are warmed up by every plan - see _benchmark_plan)
+            run_one(one_engine, "memory", 1, 10, url, delay)
+            for one_reporter in reporters:
+                for one_level in concurrency_levels:
+                    one_res = run_one(one_engine, one_reporter, one_level, my_args.requests, url, delay)
+                    results.append(one_res)
+                    print(f"{one_engine:>8} {one_reporter:>8} x{one_level:<5} "
+                          f"{one_res['throughput_rps']:9.0f} rps  "
+                          f"overhead p50 {one_res['overhead_p50_msec'] or 0:7.2f} p99 {one_res['overhead_p99_msec'] or 0:7.2f} msec  "
+                          f"cpu {one_res['cpu_msec_per_request'] or 0:6.3f} msec/request  errors {one_res['errors']}")
+    finally:
+        server_process.terminate()
+
+    report = {
+        "harness_version": _harness_version(),
+        "created": datetime.datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "stand_in_delay_msec": my_args.delay,
+        "requests": my_args.requests,
+        "results": results,
+    }
+    with open(my_args.output_file, "w") as f:
+        json.dump(report, f, indent=3)
+    print(f"Results stored in {my_args.output_file}")
+
+    if isinstance(my_args.baseline_file, str):
+        with open(my_args.baseline_file, "r") as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(results, baseline, my_args.tolerance)
+        for one_regression in regressions:
+            print(f"REGRESSION {one_regression}")
+        if len(regressions) > 0:
+            exit(1)
+        print(f"No regressions against {my_args.baseline_file} ({baseline.get('harness_version', 'unknown')})")
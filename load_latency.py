@@ -11,7 +11,12 @@ import re
 from jinja2 import Environment, PackageLoader, select_autoescape, Undefined
 from jinja2.nativetypes import NativeEnvironment
 from TestPlan import TestPlan
+from TestPlan.engine import EngineType
+from TestPlan.distributed import Coordinator, run_worker
+from TestPlan.checkpoint import Checkpoint
 from TestPlan.reporter import ReporterJsonRecords, ReportAggregatorCsv, LogRecordType, ReportAggregatorXlsx
+from TestPlan.columnar import ReporterColumnar
+from TestPlan.sqlite import ReporterSqlite
 import logging
 # NOTE that we're logging into stderr
 logging.basicConfig(level=logging.INFO, stream=sys.stderr, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -99,6 +104,16 @@ python load_latency.py --dry
 python load_latency.py --final load_test.FINAL.json
     This will skip all template handling and use mentioned file to proceed with test execution
 
+python load_latency.py --coordinator 0.0.0.0:7070 --workers 3
+python load_latency.py --worker <coordinator host>:7070
+    This will split jobs of every stage across 3 worker processes (run the second command on every worker node) and collect all results on the coordinator
+
+python load_latency.py --final load_test.FINAL.json --resume
+    This will continue stopped test execution skipping stages and jobs already completed per temp_logs/checkpoint.json
+
+python load_latency.py --engine asyncio
+    This will run all jobs of every stage as coroutines in one event loop (Test Plan "max_concurrency" limits jobs running at the same time)
+
 
 '''
     )
@@ -109,6 +124,17 @@ python load_latency.py --final load_test.FINAL.json
     parser.add_argument("--report", "-o", dest="report_file", required=False, default="load_test_report.xlsx", help="location of generated report file. Default is 'load_test_report.xlsx'")
     parser.add_argument("--dry", "-d", dest="dry", required=False, action="store_true", help="will just generate test plan but do not run it. Best option to validate your template.")
     parser.add_argument("--dry_run", "-dr", dest="dry_run", required=False, action="store_true", help="will run the test but without real requests to the API. Best debugging option.")
+    parser.add_argument("--engine", "-e", dest="engine", required=False, default=None, choices=[v.value for v in EngineType], help="request engine overriding Test Plan 'engine'. 'thread' (default) runs one thread per job, 'asyncio' runs all jobs in one event loop (requires aiohttp) to support thousands of concurrent jobs, 'process' spreads jobs across worker processes to keep the harness from being CPU bound.")
+    parser.add_argument("--coordinator", "-c", dest="coordinator", required=False, default=None, help="<host>:<port> to listen for workers. Test Plan stages will be split across workers and all results will be collected by this process.")
+    parser.add_argument("--workers", "-w", dest="workers", required=False, default=1, type=int, help="number of workers the coordinator waits for before the Test Plan is started. Default is 1")
+    parser.add_argument("--worker", dest="worker", required=False, default=None, help="<host>:<port> of the coordinator. Will execute stages sent by the coordinator (all other options are ignored).")
+    parser.add_argument("--resume", "-r", dest="resume", required=False, action="store_true", help="will continue the stopped Test Plan from the checkpoint in temp_logs skipping completed stages and jobs. Test Plan must be exactly the same (use --final with FINAL json of the stopped run). New records are added to already collected ones.")
+    parser.add_argument("--exclude_warmup", "-x", dest="exclude_warmup", required=False, action="store_true", help="will not include requests tagged as warm-up (before the steady state of the request url is reached) into the report. Warm-up detection is configured by the request task 'warmup'.")
+    parser.add_argument("--tag_warmup", dest="tag_warmup", required=False, action="store_true", help="will add 'phase' column ('warmup' or 'steady') to the report. Not added by default (--exclude_warmup detects warm-up as well).")
+    parser.add_argument("--reporter", dest="reporter", required=False, default="json", choices=["json", "columnar", "sqlite"], help="how collected records are stored in temp_logs. 'json' (default) - JSON-lines segments, 'columnar' - typed column files (report can read only required fields, see --columns), 'sqlite' - SQLite database indexed by stage, job, task and timestamp.")
+    parser.add_argument("--columns", dest="columns", required=False, default=None, help="comma separated record fields to be included into the report (all fields by default), e.g. 'latency,statusCode,request_url'.")
+    parser.add_argument("--summary", "-s", dest="summary_file", required=False, default=None, help="location of the latency summary (.csv, .xlsx or .json) - count, mean, stddev, percentiles with confidence intervals and max per stage and task auth / lang / func / size. Warm-up requests are not included. Not created by default.")
+    parser.add_argument("--summary_histograms", dest="summary_histograms", required=False, action="store_true", help="will create --summary from latency histograms (Test Plan 'latency_histograms') instead of latency records. Warm-up requests are included.")
     parser.add_argument("--aggregate_only", "-a", dest="aggregate_only", required=False, action="store_true", help="will run only the aggregation of already collected data. Best option when test was stopped but some data collected.")
 
     args = parser.parse_args()
@@ -116,6 +142,11 @@ python load_latency.py --final load_test.FINAL.json
 
 if __name__=="__main__":
     my_args = parse_arguments()
+    if isinstance(my_args.worker, str):
+        # worker gets everything from the coordinator
+        run_worker(my_args.worker)
+        print("+++COMPLETED+++")
+        exit(0)
     template_file = my_args.template_file or (DEFAULT_TEST_TEMPLATE if my_args.input_file is None else None)
     report_file = Path(my_args.report_file)
     dry_run = my_args.dry_run or False
@@ -123,14 +154,30 @@ if __name__=="__main__":
     final_input_file = my_args.final_input_file
     aggregate_only = my_args.aggregate_only or False
 
-    # Create JSON Reporter (will store every record as a separate file)
-    myReporter = ReporterJsonRecords(
-        reporter_options={
-            "name":final_input_file,
-            "logs_folder": str(Path("temp_logs") / "log_records"),
-            "errs_folder": str(Path("temp_logs") / "log_errors")
-        }
-    )
+    if my_args.reporter == "sqlite":
+        # Create SQLite Reporter (records can be queried by stage, job, task and timestamp)
+        myReporter = ReporterSqlite(
+            reporter_options={
+                "database": str(Path("temp_logs") / "log_records.sqlite"),
+            }
+        )
+    elif my_args.reporter == "columnar":
+        # Create Columnar Reporter (every record field is stored as a separate typed column)
+        myReporter = ReporterColumnar(
+            reporter_options={
+                "folder": str(Path("temp_logs") / "log_columns"),
+            }
+        )
+    else:
+        # Create JSON Reporter (will store records into JSON-lines segments)
+        myReporter = ReporterJsonRecords(
+            reporter_options={
+                "name":final_input_file,
+                "logs_folder": str(Path("temp_logs") / "log_records"),
+                "errs_folder": str(Path("temp_logs") / "log_errors"),
+                "others_folder": str(Path("temp_logs") / "log_others")
+            }
+        )
 
     if not aggregate_only:
         if not isinstance(final_input_file, str) or len(final_input_file)==0:
@@ -198,8 +245,22 @@ if __name__=="__main__":
             exit(0)
         
         # run the Test Plan
-        myTestPlan = TestPlan(Path(final_input_file).stem, final_input if isinstance(final_input,dict) else {}, myReporter)
-        myTestPlan.execute(dry_run=dry_run)
+        if isinstance(my_args.coordinator, str):
+            plan_definition = final_input if isinstance(final_input,dict) else {}
+            if isinstance(my_args.engine, str):
+                plan_definition = {**plan_definition, "engine": my_args.engine}
+            myCoordinator = Coordinator(Path(final_input_file).stem, plan_definition, myReporter, my_args.coordinator, my_args.workers)
+            myCoordinator.execute(dry_run=dry_run)
+        else:
+            plan_definition = final_input if isinstance(final_input,dict) else {}
+            # completed stages and jobs are recorded so stopped run can be continued with --resume
+            try:
+                myCheckpoint = Checkpoint(Path("temp_logs") / "checkpoint.json", plan_definition, resume=my_args.resume)
+            except Exception as e:
+                _top_logger.error(f"Fail to resume the Test Plan with exception {e}")
+                exit(-1)
+            myTestPlan = TestPlan(Path(final_input_file).stem, plan_definition, myReporter, engine=my_args.engine, checkpoint=myCheckpoint)
+            myTestPlan.execute(dry_run=dry_run)
 
     # run report aggregation
     match report_file.suffix:
@@ -214,6 +275,20 @@ if __name__=="__main__":
         source=myReporter,
         record_type=LogRecordType.LATENCY,
         destination=report_file,
+        options={
+            "warmup_detection": my_args.tag_warmup or my_args.exclude_warmup,
+            "exclude_warmup": my_args.exclude_warmup,
+            "columns": my_args.columns.split(",") if isinstance(my_args.columns, str) else None,
+        },
     )
+    if isinstance(my_args.summary_file, str):
+        from TestPlan.summary import ReportAggregatorSummary   # NumPy is required by the summary only
+        ReportAggregatorSummary().aggregate(
+            source=myReporter,
+            record_type=LogRecordType.LATENCY,
+            destination=Path(my_args.summary_file),
+            options={"histograms": my_args.summary_histograms},
+        )
+    myReporter.close()
 
     print("+++COMPLETED+++")
\ No newline at end of file
@@ -0,0 +1,132 @@
+from typing import List
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+import threading
+import json
+import time
+import pytest
+from TestPlan.reporter import Reporter, ReporterJsonRecords, LogRecord, LogRecordType
+from TestPlan.columnar import ReporterColumnar
+from TestPlan.sqlite import ReporterSqlite
+
+
+class MemoryReporter(Reporter):
+    ''' keeps records in memory and the order of add_bunch / flush calls '''
+    def __init__(self, reporter_options:dict=None):
+        self.records:List[LogRecord] = []
+        self.events:List[tuple] = []
+        self._lock = threading.Lock()
+
+    def add(self, record:LogRecord):
+        self.add_bunch([record])
+
+    def add_bunch(self, records:List[LogRecord]):
+        with self._lock:
+            self.records.extend(records)
+            self.events.append(("add", [(one_rec.job, one_rec.logType) for one_rec in records]))
+
+    def flush(self):
+        with self._lock:
+            self.events.append(("flush",))
+
+    def drop_records(self, stage:str, job_names:List[str]):
+        with self._lock:
+            self.records = [one_rec for one_rec in self.records if not (one_rec.stage == stage and one_rec.job in job_names)]
+
+    def list_all(self, record_type:LogRecordType)->List[str]:
+        return [str(rec_i) for rec_i, one_rec in enumerate(self.records) if one_rec.logType == record_type]
+
+    def get_all(self, record_type:LogRecordType)->List[LogRecord]:
+        return [one_rec for one_rec in self.records if one_rec.logType == record_type]
+
+    def get_one(self, record_id)->LogRecord:
+        return self.records[int(record_id)]
+
+    def data(self, record_type:LogRecordType=LogRecordType.LATENCY, task:str=None)->List[dict]:
+        ''' data of the records of the type (and task) '''
+        return [one_rec.data for one_rec in self.get_all(record_type) if task is None or one_rec.task == task]
+
+@pytest.fixture
+def memory_reporter()->MemoryReporter:
+    return MemoryReporter()
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    '''
+    keep-alive http handler: /deny responds with 403, /fail with 500, any other path with 200.
+    Response is sent after ms=<delay> of the query (100 msec for /slow by default)
+    '''
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    body = json.dumps({"message": "ok"}).encode("utf-8")
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        self.server.requests += 1
+        delay = parse_qs(url.query).get("ms", ["100" if url.path == "/slow" else "0"])[0]
+        time.sleep(float(delay) / 1000)
+        status = {"/deny": 403, "/fail": 500}.get(url.path, 200)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(_StandInHandler.body)))
+        self.end_headers()
+        self.wfile.write(_StandInHandler.body)
+
+    do_POST = do_GET
+
+    def log_message(self, format, *args):
+        pass
+
+class StandInServer(ThreadingHTTPServer):
+    ''' counts accepted connections and requests '''
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _StandInHandler)
+        self.connections = 0
+        self.requests = 0
+
+    def process_request(self, request, client_address):
+        self.connections += 1
+        super().process_request(request, client_address)
+
+    def url(self, path:str="/")->str:
+        return f"http://127.0.0.1:{self.server_address[1]}{path}"
+
+@pytest.fixture
+def stand_in()->StandInServer:
+    server = StandInServer()
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def make_reporter(tmp_path):
+    ''' factory of the reporters storing records in the test tmp folder - all of them are closed after the test '''
+    created:List[Reporter] = []
+
+    def make(kind:str, **options)->Reporter:
+        match kind:
+            case "json":
+                reporter = ReporterJsonRecords({
+                    "logs_folder": tmp_path / "log_records",
+                    "errs_folder": tmp_path / "log_errors",
+                    "others_folder": tmp_path / "log_others",
+                    **options,
+                })
+            case "columnar":
+                reporter = ReporterColumnar({"folder": tmp_path / "log_columns", **options})
+            case "sqlite":
+                reporter = ReporterSqlite({"database": tmp_path / "log_records.sqlite", **options})
+            case _:
+                raise ValueError(f"Unknown reporter {kind}")
+        created.append(reporter)
+        return reporter
+
+    yield make
+    for reporter in created:
+        reporter.close()
@@ -0,0 +1,57 @@
+import pytest
+from time import perf_counter
+import TestPlan
+from TestPlan.engine import EngineType
+from TestPlan.reporter import LogRecordType
+
+pytest.importorskip("aiohttp")
+
+
+def _plan(stand_in, jobs_count:int, path:str="/test", **plan_options)->dict:
+    tasks = {"request": {"uri": stand_in.url(path)}, "wait_msec": 10, "second": {"TASK_TYPE": "request", "uri": stand_in.url(path)}}
+    return {**plan_options, "stages": {"stage": {"jobs": {f"job_{job_i}": {"tasks": tasks} for job_i in range(jobs_count)}}}}
+
+
+def test_engine_by_value():
+    assert EngineType.byValue("asyncio") == EngineType.ASYNCIO
+    with pytest.raises(ValueError):
+        EngineType.byValue("greenlet")
+
+def test_all_jobs_are_reported(stand_in, memory_reporter):
+    TestPlan.TestPlan("plan", _plan(stand_in, 5), memory_reporter, max_concurrency=2, engine="asyncio").execute()
+    results = memory_reporter.data()
+    assert len(results) == 10
+    assert {one_rec["statusCode"] for one_rec in results} == {200}
+    assert memory_reporter.get_all(LogRecordType.ERROR) == []
+    # keep-alive connections are shared by all coroutines
+    assert stand_in.connections <= 2
+
+def test_jobs_run_concurrently_in_one_event_loop(stand_in, memory_reporter):
+    start = perf_counter()
+    TestPlan.TestPlan("plan", _plan(stand_in, 10, "/slow?ms=200"), memory_reporter, max_concurrency=10, engine="asyncio").execute()
+    # 10 jobs of 2 requests of 200 msec each
+    assert perf_counter() - start < 2
+    assert len(memory_reporter.data()) == 20
+
+def test_connection_phases(stand_in, memory_reporter):
+    TestPlan.TestPlan("plan", _plan(stand_in, 1), memory_reporter, engine="asyncio").execute()
+    first, second = memory_reporter.data()
+    assert first["connection_reused"] is False
+    assert second["connection_reused"] is True
+    assert (second["latency_dns"], second["latency_connect"]) == (0, 0)
+    assert first["latency_ttfb"] + first["latency_download"] <= first["latency"] + 1
+
+def test_fresh_connections(stand_in, memory_reporter):
+    TestPlan.TestPlan("plan", _plan(stand_in, 2, connection="fresh"), memory_reporter, engine="asyncio").execute()
+    assert {one_rec["connection_reused"] for one_rec in memory_reporter.data()} == {False}
+    assert stand_in.connections == 4
+
+def test_failed_requests_are_errors(stand_in, memory_reporter):
+    TestPlan.TestPlan("plan", _plan(stand_in, 1, "/fail"), memory_reporter, engine="asyncio").execute()
+    assert memory_reporter.data() == []
+    assert [one_rec["statusCode"] for one_rec in memory_reporter.data(LogRecordType.ERROR)] == [500, 500]
+
+def test_dry_run(stand_in, memory_reporter):
+    TestPlan.TestPlan("plan", _plan(stand_in, 3), memory_reporter, engine="asyncio").execute(dry_run=True)
+    assert len(memory_reporter.data()) == 6
+    assert stand_in.requests == 0
@@ -0,0 +1,67 @@
+import pytest
+import json
+import TestPlan
+from TestPlan.checkpoint import Checkpoint
+from TestPlan.reporter import LogRecord, LogRecordType
+
+
+def _plan(stand_in)->dict:
+    job = lambda count: {"tasks": {"request": {"uri": stand_in.url("/test"), "repeat": {"count": count}}}}
+    return {"stages": {
+        "done": {"jobs": {"job": job(2)}},
+        "stopped": {"jobs": {"completed": job(3), "interrupted": job(4)}},
+    }}
+
+def _record(stage:str, job:str, i:int)->LogRecord:
+    return LogRecord(stage, job, "request", LogRecordType.LATENCY, {"id": i, "place_timestamp": 1000.0 + i})
+
+
+def test_progress_is_stored_and_loaded(tmp_path):
+    checkpoint = Checkpoint(tmp_path / "checkpoint.json", {"stages": {}})
+    checkpoint.stage_started("first")
+    checkpoint.jobs_done("first", ["job_1", "job_2"])
+    checkpoint.stage_done("first")
+    checkpoint.stage_started("second")
+    checkpoint.job_done("second", "job_1")
+    resumed = Checkpoint(tmp_path / "checkpoint.json", {"stages": {}}, resume=True)
+    assert resumed.is_stage_done("first") and not resumed.is_stage_done("second")
+    assert resumed.is_job_done("second", "job_1") and not resumed.is_job_done("second", "job_2")
+    # stage started by the stopped run is interrupted till it's started again
+    assert resumed.is_stage_interrupted("second") and not resumed.is_stage_interrupted("first")
+    resumed.stage_started("second")
+    assert not resumed.is_stage_interrupted("second")
+
+def test_checkpoint_of_another_plan_is_rejected(tmp_path):
+    Checkpoint(tmp_path / "checkpoint.json", {"stages": {"one": {}}})
+    with pytest.raises(ValueError):
+        Checkpoint(tmp_path / "checkpoint.json", {"stages": {"two": {}}}, resume=True)
+
+def test_new_checkpoint_has_no_interrupted_stages(tmp_path):
+    checkpoint = Checkpoint(tmp_path / "checkpoint.json", {"stages": {}})
+    checkpoint.stage_started("first")
+    assert not Checkpoint(tmp_path / "checkpoint.json", {"stages": {}}).is_stage_interrupted("first")
+
+@pytest.mark.parametrize("kind", ["json", "columnar", "sqlite"])
+def test_records_of_interrupted_jobs_are_not_stored_twice(kind, make_reporter, stand_in, tmp_path):
+    plan = _plan(stand_in)
+    reporter = make_reporter(kind)
+    # stopped run - "done" stage and "completed" job are stored, "interrupted" job was stopped after 2 requests
+    reporter.add_bunch([_record("done", "job", i) for i in range(2)])
+    reporter.add_bunch([_record("stopped", "completed", i) for i in range(3)] + [_record("stopped", "interrupted", i) for i in range(2)])
+    reporter.flush()
+    checkpoint = Checkpoint(tmp_path / "checkpoint.json", plan)
+    checkpoint.stage_started("done")
+    checkpoint.job_done("done", "job")
+    checkpoint.stage_done("done")
+    checkpoint.stage_started("stopped")
+    checkpoint.job_done("stopped", "completed")
+
+    TestPlan.TestPlan("plan", plan, reporter, checkpoint=Checkpoint(tmp_path / "checkpoint.json", plan, resume=True)).execute()
+    reporter.flush()
+    counts = {}
+    for one_rec in reporter.iter_records(LogRecordType.LATENCY):
+        counts[(one_rec.stage, one_rec.job)] = counts.get((one_rec.stage, one_rec.job), 0) + 1
+    assert counts == {("done", "job"): 2, ("stopped", "completed"): 3, ("stopped", "interrupted"): 4}
+    with open(tmp_path / "checkpoint.json", "r") as f:
+        stored = json.load(f)
+    assert (stored["completed_stages"], stored["started_stages"]) == (["done", "stopped"], [])
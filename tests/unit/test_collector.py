@@ -0,0 +1,71 @@
+import time
+from TestPlan.collector import ResultCollector
+from TestPlan.reporter import LogRecordType
+from TestPlan.stage import Stage
+
+
+def test_records_of_all_jobs_are_reported_in_batches(memory_reporter):
+    collector = ResultCollector("stage", memory_reporter, batch_size=10, flush_interval=0.05)
+    collector.start()
+    for job_i in range(3):
+        results = collector.queue_for(f"job_{job_i}", LogRecordType.LATENCY)
+        for i in range(10):
+            results.put({"task": "request", "id": job_i * 10 + i})
+    collector.queue_for("job_0", LogRecordType.ERROR).put_nowait({"task": "request", "message": "failed"})
+    collector.queue_for("job_0", LogRecordType.OTHER).put_nowait("not a dict")
+    collector.close()
+    assert [one_rec["id"] for one_rec in memory_reporter.data()] == list(range(30))
+    assert {one_rec.job for one_rec in memory_reporter.get_all(LogRecordType.LATENCY)} == {"job_0", "job_1", "job_2"}
+    assert all(len(event[1]) <= 10 for event in memory_reporter.events if event[0] == "add")
+    assert collector.records_count == {LogRecordType.LATENCY: 30, LogRecordType.ERROR: 1, LogRecordType.OTHER: 1}
+    other = memory_reporter.get_all(LogRecordType.OTHER)[0]
+    assert (other.stage, other.task, other.data) == ("stage", "NIM", "not a dict")
+
+def test_records_are_reported_while_jobs_are_running(memory_reporter):
+    collector = ResultCollector("stage", memory_reporter, flush_interval=0.05)
+    collector.start()
+    try:
+        collector.queue_for("job", LogRecordType.LATENCY).put({"task": "request"})
+        deadline = time.monotonic() + 5
+        while len(memory_reporter.records) == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert len(memory_reporter.records) == 1
+    finally:
+        collector.close()
+
+def test_close_without_start(memory_reporter):
+    collector = ResultCollector("stage", memory_reporter)
+    collector.close()
+    assert memory_reporter.records == []
+
+def test_stage_streams_results_of_all_jobs(memory_reporter):
+    jobs = {f"job_{job_i}": {"tasks": {"request": {"uri": "http://localhost/test"}}} for job_i in range(5)}
+    Stage("stage", {"jobs": jobs}, memory_reporter, max_concurrency=2).execute(dry_run=True)
+    results = memory_reporter.get_all(LogRecordType.LATENCY)
+    assert sorted(one_rec.job for one_rec in results) == sorted(jobs.keys())
+    assert all(one_rec.stage == "stage" and one_rec.task == "request" for one_rec in results)
+
+def test_completed_job_is_passed_on_only_after_its_records_are_stored(memory_reporter):
+    collector = ResultCollector("stage", memory_reporter, flush_interval=0.05, checkpoint_interval=0)
+    stored = []
+    collector.on_jobs_stored = lambda job_names: stored.append((job_names, list(memory_reporter.events)))
+    collector.start()
+    for job_name in ("job_0", "job_1"):
+        results = collector.queue_for(job_name, LogRecordType.LATENCY)
+        for i in range(3):
+            results.put({"task": "request", "id": i})
+        collector.job_done(job_name)
+    collector.close()
+    assert [job_name for job_names, _ in stored for job_name in job_names] == ["job_0", "job_1"]
+    for job_names, events in stored:
+        # all records of the job were added and the reporter flushed after them
+        added = [job for event in events if event[0] == "add" for job, _ in event[1]]
+        assert all(added.count(job_name) == 3 for job_name in job_names)
+        assert events[-1] == ("flush",)
+
+def test_completed_jobs_are_not_passed_on_without_listener(memory_reporter):
+    collector = ResultCollector("stage", memory_reporter)
+    collector.start()
+    collector.job_done("job_0")
+    collector.close()
+    assert memory_reporter.records == []
@@ -0,0 +1,113 @@
+import time
+import math
+from TestPlan.columnar import ColumnType, _column_type
+from TestPlan.reporter import LogRecord, LogRecordType
+
+
+def _record(i:int, job:str="job", **data)->LogRecord:
+    return LogRecord("stage", job, "task", LogRecordType.LATENCY, {"id": i, "place_timestamp": 1000.0 + i, **data})
+
+def _parts(reporter, record_type:LogRecordType=LogRecordType.LATENCY):
+    return list(reporter._parts(record_type))
+
+
+def test_column_types():
+    assert _column_type([1, None, -2]) == ColumnType.INT
+    assert _column_type([1, 2.5]) == ColumnType.FLOAT
+    assert _column_type([2**70]) == ColumnType.JSON
+    assert _column_type([True, None, False]) == ColumnType.BOOL
+    assert _column_type([None, None]) == ColumnType.BOOL
+    assert _column_type([1.5, math.nan, None, math.inf]) == ColumnType.FLOAT
+    assert _column_type(["a", None, "b"]) == ColumnType.STR
+    assert _column_type(["a", 1]) == ColumnType.JSON
+    assert _column_type([{"a": 1}, [1, 2]]) == ColumnType.JSON
+
+def test_records_round_trip(make_reporter):
+    reporter = make_reporter("columnar")
+    records = [
+        _record(0, latency=12.5, statusCode=200, ok=True, url="http://a", body={"items": [1, 2]}),
+        _record(1, latency=3, statusCode=404, ok=False, url="http://b", body="text", headers={"x": "1"}),
+        # record data field with the name of the record column is kept as a separate column
+        _record(2, latency=7.25, job="job_2", task="data task"),
+    ]
+    reporter.add_bunch(records)
+    assert [one_rec.as_dict() for one_rec in reporter.get_all(LogRecordType.LATENCY)] == [
+        {**one_rec.as_dict(), "logType": "latency"} for one_rec in records
+    ]
+
+def test_none_and_nan_values_round_trip(make_reporter):
+    reporter = make_reporter("columnar")
+    reporter.add_bunch([
+        _record(0, latency=math.nan, status=None, ok=None, url=None, body=None),
+        _record(1, latency=1.5, status=200, ok=True, url="http://a", body={"a": math.inf}),
+        # fields missing in the record are not added as None
+        _record(2),
+        LogRecord("stage", "job", "task", LogRecordType.LATENCY, None),
+    ])
+    first, second, third, fourth = reporter.get_all(LogRecordType.LATENCY)
+    assert math.isnan(first.data.pop("latency"))
+    assert first.data == {"id": 0, "place_timestamp": 1000.0, "status": None, "ok": None, "url": None, "body": None}
+    assert second.data == {"id": 1, "place_timestamp": 1001.0, "latency": 1.5, "status": 200, "ok": True, "url": "http://a", "body": {"a": math.inf}}
+    assert third.data == {"id": 2, "place_timestamp": 1002.0}
+    assert fourth.data is None
+    latency = reporter.get_columns(LogRecordType.LATENCY, ["latency"])["latency"]
+    assert math.isnan(latency[0]) and latency[1:] == [1.5, None, None]
+
+def test_not_dict_data(make_reporter):
+    reporter = make_reporter("columnar")
+    reporter.add_bunch([LogRecord("stage", "job", "NIM", LogRecordType.OTHER, "text"), LogRecord("stage", "job", "NIM", LogRecordType.OTHER, [1, 2])])
+    assert [one_rec.data for one_rec in reporter.get_all(LogRecordType.OTHER)] == ["text", [1, 2]]
+
+def test_records_are_split_into_parts(make_reporter):
+    reporter = make_reporter("columnar", part_rows=4)
+    for i in range(10):
+        reporter.add(_record(i, latency=float(i)))
+    assert [part.rows for part in _parts(reporter)] == [4, 4, 2]
+    assert [one_rec.data["id"] for one_rec in reporter.iter_records(LogRecordType.LATENCY)] == list(range(10))
+
+def test_get_columns_reads_requested_columns(make_reporter):
+    reporter = make_reporter("columnar", part_rows=3)
+    reporter.add_bunch([_record(i, job=f"job_{i % 2}", latency=float(i), status=200 + i) for i in range(6)])
+    columns = reporter.get_columns(LogRecordType.LATENCY, ["job", "latency", "missing"])
+    assert columns == {"job": ["job_0", "job_1"] * 3, "latency": [float(i) for i in range(6)], "missing": [None] * 6}
+    filtered = reporter.get_columns(LogRecordType.LATENCY, ["id"], filters={"job": "job_1", "timestamp_from": 1002})
+    assert filtered == {"id": [3, 5]}
+
+def test_column_names(make_reporter):
+    reporter = make_reporter("columnar", part_rows=1)
+    reporter.add_bunch([_record(0, latency=1.0), _record(1, status=200)])
+    assert reporter.column_names(LogRecordType.LATENCY) == ["stage", "job", "task", "id", "place_timestamp", "latency", "status"]
+
+def test_heavy_columns_can_be_skipped(make_reporter):
+    reporter = make_reporter("columnar", heavy_columns=False)
+    reporter.add(_record(0, latency=1.0, body={"large": True}, headers={}, request_headers={}))
+    assert reporter.get_all(LogRecordType.LATENCY)[0].data == {"id": 0, "place_timestamp": 1000.0, "latency": 1.0}
+
+def test_get_one_by_id(make_reporter):
+    reporter = make_reporter("columnar", part_rows=2)
+    reporter.add_bunch([_record(i) for i in range(5)])
+    record_ids = reporter.list_all(LogRecordType.LATENCY)
+    assert len(record_ids) == 5
+    assert reporter.get_one(record_ids[3]).data["id"] == 3
+
+def test_record_types_are_stored_separately(make_reporter):
+    reporter = make_reporter("columnar")
+    reporter.add_bunch([_record(0), LogRecord("stage", "job", "task", LogRecordType.ERROR, {"id": 1}), _record(2)])
+    assert [one_rec.data["id"] for one_rec in reporter.get_all(LogRecordType.LATENCY)] == [0, 2]
+    assert [one_rec.data["id"] for one_rec in reporter.get_all(LogRecordType.ERROR)] == [1]
+
+def test_not_completed_part_is_ignored(make_reporter, tmp_path):
+    reporter = make_reporter("columnar")
+    reporter.add(_record(0))
+    reporter.flush()
+    # part without meta.json (write was interrupted)
+    (tmp_path / "log_columns" / "latency" / "part-0").mkdir()
+    assert len(reporter.get_all(LogRecordType.LATENCY)) == 1
+
+def test_pending_records_are_stored_after_flush_interval(make_reporter, tmp_path):
+    reporter = make_reporter("columnar", flush_interval=0.05)
+    reporter.add(_record(0))
+    assert list((tmp_path / "log_columns" / "latency").iterdir()) == []
+    time.sleep(0.06)
+    reporter.add(_record(1))
+    assert len(list((tmp_path / "log_columns" / "latency").iterdir())) == 1
@@ -0,0 +1,80 @@
+import pytest
+from queue import Queue
+import TestPlan
+from TestPlan.connection import ConnectionMode, ConnectionPool
+from TestPlan.reporter import LogRecordType
+from TestPlan.task import TaskRequest
+
+
+def _request_task(definition:dict):
+    results, errors = Queue(), Queue()
+    return (TaskRequest("request", definition, results, errors), results, errors)
+
+def _plan(stand_in, jobs_count:int, requests_count:int, **plan_options)->dict:
+    tasks = {f"request_{request_i}": {"TASK_TYPE": "request", "uri": stand_in.url("/test")} for request_i in range(requests_count)}
+    return {**plan_options, "stages": {"stage": {"jobs": {f"job_{job_i}": {"tasks": tasks} for job_i in range(jobs_count)}}}}
+
+
+def test_connection_mode_by_value():
+    assert ConnectionMode.byValue("reuse") == ConnectionMode.REUSE
+    assert ConnectionMode.byValue("fresh") == ConnectionMode.FRESH
+    with pytest.raises(ValueError):
+        ConnectionMode.byValue("warm")
+
+def test_one_session_per_host():
+    connection_pool = ConnectionPool(pool_size=2)
+    try:
+        session = connection_pool.session_for("http://a.example.com/one")
+        assert connection_pool.session_for("http://a.example.com/two?x=1") is session
+        assert connection_pool.session_for("https://a.example.com/one") is not session
+        assert connection_pool.session_for("http://b.example.com/one") is not session
+    finally:
+        connection_pool.close()
+
+def test_session_is_sized_to_requests_in_flight():
+    connection_pool = ConnectionPool(pool_size=2)
+    try:
+        session = connection_pool.session_for("http://a.example.com/one")
+        assert connection_pool.session_for("http://a.example.com/one", 1) is session
+        larger = connection_pool.session_for("http://a.example.com/one", 20)
+        assert larger is not session
+        assert connection_pool.session_for("http://a.example.com/two", 20) is larger
+        assert larger.get_adapter("http://a.example.com")._pool_maxsize == 20
+    finally:
+        connection_pool.close()
+
+def test_pooled_requests_reuse_the_connection(stand_in):
+    connection_pool = ConnectionPool(pool_size=2)
+    try:
+        task, results, errors = _request_task({"uri": stand_in.url("/test")})
+        for _ in range(5):
+            task.execute(options={"connection_pool": connection_pool, "connection": ConnectionMode.REUSE})
+    finally:
+        connection_pool.close()
+    assert errors.empty()
+    assert results.qsize() == 5
+    assert results.get()["connection"] == "reuse"
+    assert stand_in.connections == 1
+
+def test_fresh_connection_for_every_request(stand_in):
+    connection_pool = ConnectionPool(pool_size=2)
+    try:
+        task, results, _ = _request_task({"uri": stand_in.url("/test"), "connection": "fresh"})
+        for _ in range(5):
+            task.execute(options={"connection_pool": connection_pool, "connection": ConnectionMode.REUSE})
+    finally:
+        connection_pool.close()
+    assert results.qsize() == 5
+    assert results.get()["connection"] == "fresh"
+    assert stand_in.connections == 5
+
+def test_plan_shares_connections_across_jobs(stand_in, memory_reporter):
+    TestPlan.TestPlan("plan", _plan(stand_in, 4, 5), memory_reporter, max_concurrency=2).execute()
+    assert len(memory_reporter.get_all(LogRecordType.LATENCY)) == 20
+    # connections are kept alive across tasks and jobs - at most one per running job
+    assert stand_in.connections <= 2
+
+def test_plan_fresh_connections(stand_in, memory_reporter):
+    TestPlan.TestPlan("plan", _plan(stand_in, 2, 3, connection="fresh"), memory_reporter, max_concurrency=2).execute()
+    assert {one_rec["connection"] for one_rec in memory_reporter.data()} == {"fresh"}
+    assert stand_in.connections == 6
@@ -0,0 +1,62 @@
+import pytest
+from time import perf_counter
+import TestPlan
+from TestPlan.dag import StageGraph
+from TestPlan.reporter import LogRecordType
+
+
+def _stage(stand_in, path:str="/slow?ms=200", **stage_options)->dict:
+    return {**stage_options, "jobs": {"job": {"tasks": {"request": {"uri": stand_in.url(path)}}}}}
+
+def _spans(memory_reporter)->dict:
+    ''' (first request start, last request end) of every stage by place_timestamp and latency '''
+    spans = {}
+    for one_rec in memory_reporter.get_all(LogRecordType.LATENCY):
+        start = one_rec.data["place_timestamp"]
+        end = start + one_rec.data["latency"] / 1000
+        first, last = spans.get(one_rec.stage, (start, end))
+        spans[one_rec.stage] = (min(first, start), max(last, end))
+    return spans
+
+
+def test_stages_without_after_are_sequential():
+    graph = StageGraph({"a": {}, "b": {}, "c": {}})
+    assert not graph.has_dependencies
+    assert graph.dependencies == {"a": [], "b": ["a"], "c": ["b"]}
+    assert graph.ready(set(), set()) == ["a"]
+    assert graph.ready({"a"}, {"a"}) == ["b"]
+
+def test_after_dependencies():
+    graph = StageGraph({"a": {}, "b": {"after": []}, "c": {"after": "a"}, "d": {"after": ["b", "c"]}, "e": {}})
+    assert graph.has_dependencies
+    assert graph.dependencies == {"a": [], "b": [], "c": ["a"], "d": ["b", "c"], "e": ["d"]}
+    assert graph.ready(set(), set()) == ["a", "b"]
+    assert graph.ready({"a"}, {"a", "b"}) == ["c"]
+    assert graph.ready({"a", "b", "c"}, {"a", "b", "c"}) == ["d"]
+
+def test_unknown_dependency():
+    with pytest.raises(ValueError):
+        StageGraph({"a": {}, "b": {"after": ["x"]}})
+
+def test_circular_dependencies():
+    with pytest.raises(ValueError):
+        StageGraph({"a": {"after": ["b"]}, "b": {"after": ["a"]}})
+    with pytest.raises(ValueError):
+        StageGraph({"a": {"after": "a"}})
+
+@pytest.mark.parametrize("engine", ["thread", "asyncio"])
+def test_independent_chains_run_in_parallel(stand_in, memory_reporter, engine):
+    stages = {
+        "a1": _stage(stand_in), "a2": _stage(stand_in),
+        "b1": _stage(stand_in, after=[]), "b2": _stage(stand_in, after="b1"),
+        "joined": _stage(stand_in, "/test", after=["a2", "b2"]),
+    }
+    start = perf_counter()
+    TestPlan.TestPlan("plan", {"stages": stages}, memory_reporter, engine=engine).execute()
+    # 2 chains of 2 stages with 200 msec requests
+    assert perf_counter() - start < 0.7
+    spans = _spans(memory_reporter)
+    assert set(spans.keys()) == set(stages.keys())
+    assert spans["a2"][0] >= spans["a1"][1]
+    assert spans["b2"][0] >= spans["b1"][1]
+    assert spans["joined"][0] >= max(spans["a2"][1], spans["b2"][1])
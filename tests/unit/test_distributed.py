@@ -0,0 +1,75 @@
+import socket
+import threading
+import time
+from TestPlan.distributed import Coordinator, run_worker
+from TestPlan.reporter import LogRecordType
+
+
+def _free_address()->str:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return f"127.0.0.1:{sock.getsockname()[1]}"
+
+def _job(stand_in, path:str, count:int)->dict:
+    return {"tasks": {"request": {"uri": stand_in.url(path), "repeat": {"count": count}}}}
+
+def _run_worker(address:str):
+    # coordinator may not listen yet
+    while True:
+        try:
+            run_worker(address)
+            return
+        except ConnectionRefusedError:
+            time.sleep(0.01)
+
+def _execute(plan:dict, memory_reporter, workers_count:int=2):
+    ''' coordinator with workers running in threads of this process '''
+    address = _free_address()
+    coordinator = Coordinator("plan", plan, memory_reporter, address, workers_count, start_delay=0.05, clock_samples=1)
+    coordinator_thread = threading.Thread(target=coordinator.execute)
+    coordinator_thread.start()
+    workers = [threading.Thread(target=_run_worker, args=(address,)) for _ in range(workers_count)]
+    for worker in workers:
+        worker.start()
+    coordinator_thread.join(timeout=30)
+    for worker in workers:
+        worker.join(timeout=30)
+    assert not coordinator_thread.is_alive() and not any(worker.is_alive() for worker in workers)
+    return coordinator
+
+def _failing_plan(stand_in, action:str)->dict:
+    # jobs are split round-robin - first worker gets failing job, second one - the long job with successful requests
+    stages = {
+        "failing": {
+            "guardrails": {"max_consecutive_failures": 3, "action": action},
+            "jobs": {"failing": _job(stand_in, "/fail?ms=10", 50), "long": _job(stand_in, "/slow?ms=50", 50)},
+        },
+        "next": {"jobs": {"job_0": _job(stand_in, "/test", 1), "job_1": _job(stand_in, "/test", 1)}},
+    }
+    return {"stages": stages}
+
+
+def test_stages_are_split_across_workers(stand_in, memory_reporter):
+    stages = {f"stage_{stage_i}": {"jobs": {f"job_{job_i}": _job(stand_in, "/test", 2) for job_i in range(4)}} for stage_i in range(2)}
+    _execute({"stages": stages}, memory_reporter)
+    results = memory_reporter.get_all(LogRecordType.LATENCY)
+    assert len(results) == 16
+    assert {(one_rec.job, one_rec.data["worker"]) for one_rec in results} == {("job_0", 0), ("job_1", 1), ("job_2", 0), ("job_3", 1)}
+
+def test_stage_guardrail_breach_stops_the_stage_on_all_workers(stand_in, memory_reporter):
+    _execute(_failing_plan(stand_in, "stop_stage"), memory_reporter)
+    assert 3 <= len(memory_reporter.get_all(LogRecordType.ERROR)) < 50
+    # successful requests of the other worker are stopped as well
+    long_job = [one_rec for one_rec in memory_reporter.get_all(LogRecordType.LATENCY) if one_rec.job == "long"]
+    assert len(long_job) < 25
+    breach, = memory_reporter.data(LogRecordType.OTHER, task="guardrail")
+    assert breach["rule"] == "max_consecutive_failures"
+    # plan continues with the next stage
+    assert sorted(one_rec.job for one_rec in memory_reporter.get_all(LogRecordType.LATENCY) if one_rec.stage == "next") == ["job_0", "job_1"]
+
+def test_plan_guardrail_breach_stops_the_plan_on_all_workers(stand_in, memory_reporter):
+    coordinator = _execute(_failing_plan(stand_in, "stop_plan"), memory_reporter)
+    assert coordinator.plan_stop.is_set()
+    assert 3 <= len(memory_reporter.get_all(LogRecordType.ERROR)) < 50
+    assert len(memory_reporter.get_all(LogRecordType.LATENCY)) < 25
+    assert [one_rec for one_rec in memory_reporter.get_all(LogRecordType.LATENCY) if one_rec.stage == "next"] == []
@@ -0,0 +1,104 @@
+import pytest
+import threading
+import time
+import TestPlan
+from TestPlan.guardrails import Guardrails, GuardrailMonitor, PolledStopEvent, GuardrailAction, is_stopped
+from TestPlan.reporter import LogRecordType
+
+
+def _monitor(**definition):
+    stage_stop, plan_stop = threading.Event(), threading.Event()
+    return (GuardrailMonitor(Guardrails("stage", definition), stage_stop, plan_stop), stage_stop, plan_stop)
+
+def _job(stand_in, path:str, count:int)->dict:
+    return {"tasks": {"request": {"uri": stand_in.url(path), "repeat": {"count": count}}}}
+
+
+def test_definition_is_validated():
+    with pytest.raises(ValueError):
+        Guardrails("stage", {"window": 10})
+    with pytest.raises(ValueError):
+        Guardrails("stage", {"max_error_rate": 0.1, "action": "stop_everything"})
+    guardrails = Guardrails("stage", {"max_error_rate": 0.1, "window": 10, "min_requests": 50})
+    assert guardrails.min_requests == 10
+    assert guardrails.action == GuardrailAction.STOP_STAGE
+
+def test_consecutive_failures_stop_the_stage():
+    monitor, stage_stop, plan_stop = _monitor(max_consecutive_failures=3)
+    for log_type in [LogRecordType.ERROR, LogRecordType.ERROR, LogRecordType.LATENCY, LogRecordType.ERROR, LogRecordType.ERROR]:
+        assert monitor.observe(log_type, {"latency": 10}) is None
+    breach = monitor.observe(LogRecordType.ERROR, {"latency": 10})
+    assert breach == {"task": "guardrail", "rule": "max_consecutive_failures", "value": 3, "threshold": 3, "action": "stop_stage", "window": 6}
+    assert stage_stop.is_set() and not plan_stop.is_set()
+    # breach is reported once
+    assert monitor.observe(LogRecordType.ERROR, {"latency": 10}) is None
+
+def test_error_rate_needs_min_requests():
+    monitor, _, plan_stop = _monitor(max_error_rate=0.5, window=10, min_requests=4, action="stop_plan")
+    for _ in range(3):
+        assert monitor.observe(LogRecordType.ERROR, {}) is None
+    breach = monitor.observe(LogRecordType.ERROR, {})
+    assert (breach["rule"], breach["value"]) == ("max_error_rate", 1.0)
+    assert plan_stop.is_set()
+
+def test_error_rate_of_the_sliding_window():
+    monitor, stage_stop, _ = _monitor(max_error_rate=0.5, window=4, min_requests=4)
+    # old errors leave the window
+    for log_type in [LogRecordType.ERROR] * 2 + [LogRecordType.LATENCY] * 4 + [LogRecordType.ERROR] * 2:
+        assert monitor.observe(log_type, {"latency": 1}) is None
+    assert not stage_stop.is_set()
+    assert monitor.observe(LogRecordType.ERROR, {"latency": 1})["value"] == 0.75
+
+def test_p99_of_the_sliding_window():
+    monitor, stage_stop, _ = _monitor(max_p99_msec=100, window=5, min_requests=5)
+    for latency in [10, 10, 10, 10, 10, 10]:
+        assert monitor.observe(LogRecordType.LATENCY, {"latency": latency}) is None
+    breach = monitor.observe(LogRecordType.LATENCY, {"latency": 200})
+    assert (breach["rule"], breach["value"]) == ("max_p99_msec", 200)
+    assert stage_stop.is_set()
+
+def test_other_records_are_not_observed():
+    monitor, stage_stop, _ = _monitor(max_consecutive_failures=1)
+    assert monitor.observe(LogRecordType.OTHER, {"task": "wait"}) is None
+    assert not stage_stop.is_set()
+
+def test_is_stopped():
+    stop_event = threading.Event()
+    assert not is_stopped(None)
+    assert not is_stopped({"stop_events": [stop_event]})
+    stop_event.set()
+    assert is_stopped({"stop_events": [threading.Event(), stop_event]})
+
+def test_polled_stop_event_is_cached_between_polls():
+    event = threading.Event()
+    polled = PolledStopEvent(event, interval=0.05)
+    assert not polled.is_set()
+    event.set()
+    assert not polled.is_set()
+    time.sleep(0.06)
+    assert polled.is_set()
+    # once set it stays set
+    event.clear()
+    assert polled.is_set()
+
+def test_stage_guardrail_stops_only_the_stage(stand_in, memory_reporter):
+    stages = {
+        "failing": {"guardrails": {"max_consecutive_failures": 3}, "jobs": {"job": _job(stand_in, "/fail?ms=10", 50)}},
+        "next": {"jobs": {"job": _job(stand_in, "/test", 2)}},
+    }
+    TestPlan.TestPlan("plan", {"stages": stages}, memory_reporter).execute()
+    failing = [one_rec for one_rec in memory_reporter.get_all(LogRecordType.ERROR) if one_rec.stage == "failing"]
+    assert 3 <= len(failing) < 50
+    breach, = memory_reporter.data(LogRecordType.OTHER, task="guardrail")
+    assert breach["rule"] == "max_consecutive_failures"
+    assert [one_rec.stage for one_rec in memory_reporter.get_all(LogRecordType.LATENCY)] == ["next", "next"]
+
+def test_plan_guardrail_stops_the_plan(stand_in, memory_reporter):
+    stages = {
+        "failing": {"jobs": {"job": _job(stand_in, "/fail?ms=10", 50)}},
+        "next": {"jobs": {"job": _job(stand_in, "/test", 2)}},
+    }
+    plan = {"guardrails": {"max_consecutive_failures": 3, "action": "stop_plan"}, "stages": stages}
+    TestPlan.TestPlan("plan", plan, memory_reporter).execute()
+    assert 3 <= len(memory_reporter.get_all(LogRecordType.ERROR)) < 50
+    assert memory_reporter.get_all(LogRecordType.LATENCY) == []
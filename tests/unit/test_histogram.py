@@ -0,0 +1,120 @@
+import json
+import math
+import random
+import pytest
+from TestPlan.histogram import LatencyHistogram, histogram_settings, DEFAULT_HISTOGRAMS
+
+
+def _exact_percentile(values, quantile):
+    ''' nearest rank - the same rank as LatencyHistogram.percentile '''
+    ordered = sorted(values)
+    return ordered[min(len(ordered), max(1, math.ceil(quantile * len(ordered)))) - 1]
+
+def _latencies(count=20000, seed=0):
+    rng = random.Random(seed)
+    return [rng.lognormvariate(3, 1.5) for _ in range(count)]
+
+def _histogram(values, significant_digits=2, resolution_msec=0.001):
+    histogram = LatencyHistogram(significant_digits, resolution_msec)
+    for value in values:
+        histogram.record(value)
+    return histogram
+
+
+@pytest.mark.parametrize("significant_digits", [1, 2, 3])
+def test_value_is_within_its_bucket(significant_digits):
+    # resolution of 1 keeps bucket ranges in exact units
+    histogram = LatencyHistogram(significant_digits, 1)
+    rng = random.Random(0)
+    for units in list(range(5000)) + [rng.randrange(1 << 40) for _ in range(5000)]:
+        lowest, highest = histogram._range(histogram._index(units))
+        assert lowest <= units <= highest
+
+@pytest.mark.parametrize("significant_digits", [1, 2, 3])
+def test_bucket_ranges_are_contiguous(significant_digits):
+    histogram = LatencyHistogram(significant_digits, 1)
+    assert histogram._range(0)[0] == 0
+    for index in range(40 << histogram._magnitude):
+        assert histogram._range(index)[1] + 1 == histogram._range(index + 1)[0]
+
+@pytest.mark.parametrize("significant_digits", [1, 2, 3])
+def test_percentile_relative_error(significant_digits):
+    values = _latencies()
+    histogram = _histogram(values, significant_digits)
+    for quantile in (0.01, 0.1, 0.5, 0.9, 0.95, 0.99, 0.999, 1.0):
+        exact = _exact_percentile(values, quantile)
+        assert abs(histogram.percentile(quantile) - exact) <= exact * 10 ** -significant_digits
+
+def test_exact_statistics():
+    values = _latencies(1000)
+    histogram = _histogram(values)
+    assert histogram.count == len(values)
+    assert histogram.min == min(values)
+    assert histogram.max == max(values)
+    assert histogram.mean() == pytest.approx(sum(values) / len(values))
+    mean = sum(values) / len(values)
+    assert histogram.stddev() == pytest.approx(math.sqrt(sum((v - mean) ** 2 for v in values) / (len(values) - 1)))
+    assert histogram.min <= histogram.percentile(0.0) <= histogram.percentile(1.0) <= histogram.max
+
+def test_empty_and_single_value():
+    histogram = LatencyHistogram()
+    assert histogram.mean() is None
+    assert histogram.stddev() is None
+    assert histogram.percentile(0.5) is None
+    histogram.record(12.5)
+    assert histogram.stddev() == 0.0
+    assert histogram.percentile(0.5) == 12.5
+
+def test_merge_equals_recording_all_values():
+    values = _latencies(5000)
+    merged = _histogram(values[:1000])
+    for start in range(1000, 5000, 1000):
+        merged.merge(_histogram(values[start:start + 1000]))
+    whole = _histogram(values)
+    assert merged.counts == whole.counts
+    assert merged.count == whole.count
+    assert (merged.min, merged.max) == (whole.min, whole.max)
+    assert merged.sum == pytest.approx(whole.sum)
+    assert merged.sum_squares == pytest.approx(whole.sum_squares)
+    for quantile in (0.5, 0.99):
+        assert merged.percentile(quantile) == whole.percentile(quantile)
+
+def test_merge_of_different_settings():
+    with pytest.raises(ValueError):
+        LatencyHistogram(2).merge(LatencyHistogram(3))
+    with pytest.raises(ValueError):
+        LatencyHistogram(2, 0.001).merge(LatencyHistogram(2, 0.01))
+
+def test_dict_round_trip():
+    histogram = _histogram(_latencies(5000), 3, 0.01)
+    restored = LatencyHistogram.from_dict(json.loads(json.dumps(histogram.to_dict())))
+    assert (restored.significant_digits, restored.resolution) == (3, 0.01)
+    assert restored.counts == histogram.counts
+    assert (restored.count, restored.sum, restored.sum_squares) == (histogram.count, histogram.sum, histogram.sum_squares)
+    assert (restored.min, restored.max) == (histogram.min, histogram.max)
+    assert restored.percentile(0.99) == histogram.percentile(0.99)
+
+def test_empty_dict_round_trip():
+    definition = LatencyHistogram().to_dict()
+    assert definition["min"] is None and definition["max"] is None
+    restored = LatencyHistogram.from_dict(json.loads(json.dumps(definition)))
+    assert restored.count == 0
+    assert restored.percentile(0.5) is None
+    # empty histogram doesn't change the one it is merged into
+    histogram = _histogram([1.0, 2.0])
+    histogram.merge(restored)
+    assert (histogram.count, histogram.min, histogram.max) == (2, 1.0, 2.0)
+
+def test_significant_digits_range():
+    with pytest.raises(ValueError):
+        LatencyHistogram(0)
+    with pytest.raises(ValueError):
+        LatencyHistogram(6)
+
+def test_histogram_settings():
+    assert histogram_settings(None) is None
+    assert histogram_settings(False) is None
+    assert histogram_settings(True) == DEFAULT_HISTOGRAMS
+    assert histogram_settings({"significant_digits": 3}) == {**DEFAULT_HISTOGRAMS, "significant_digits": 3}
+    with pytest.raises(ValueError):
+        histogram_settings("yes")
@@ -0,0 +1,53 @@
+import threading
+import time
+import TestPlan
+from TestPlan.job import Job
+from TestPlan.stage import Stage
+from TestPlan.reporter import LogRecordType
+
+
+def _jobs(jobs_count:int, tasks:dict)->dict:
+    return {f"job_{job_i}": {"tasks": tasks} for job_i in range(jobs_count)}
+
+
+def test_stage_is_created_right_before_it_is_executed(memory_reporter, monkeypatch):
+    events = []
+    create_stage = TestPlan.TestPlan._create_stage
+    monkeypatch.setattr(TestPlan.TestPlan, "_create_stage", lambda self, stage_name: events.append(("create", stage_name)) or create_stage(self, stage_name))
+    monkeypatch.setattr(Stage, "execute", lambda self, dry_run=False, options=None: events.append(("execute", self.name)))
+    stages = {f"stage_{stage_i}": {"jobs": _jobs(1, {"wait_sec": 1})} for stage_i in range(3)}
+    plan = TestPlan.TestPlan("plan", {"stages": stages}, memory_reporter)
+    assert events == []
+    plan.execute(dry_run=True)
+    assert events == [(action, f"stage_{stage_i}") for stage_i in range(3) for action in ("create", "execute")]
+
+def test_stage_keeps_at_most_pool_size_jobs(memory_reporter, monkeypatch):
+    lock = threading.Lock()
+    created = []
+    alive = {"now": 0, "max": 0}
+    init_job = Job.__init__
+
+    def counted_init(self, *args, **kwargs):
+        init_job(self, *args, **kwargs)
+        with lock:
+            created.append(self.name)
+            alive["now"] += 1
+            alive["max"] = max(alive["max"], alive["now"])
+
+    def execute(self, dry_run=False, options=None):
+        time.sleep(0.02)
+        with lock:
+            alive["now"] -= 1
+
+    monkeypatch.setattr(Job, "__init__", counted_init)
+    monkeypatch.setattr(Job, "execute", execute)
+    Stage("stage", {"jobs": _jobs(10, {})}, memory_reporter, max_concurrency=3).execute(dry_run=True)
+    assert len(created) == 10
+    assert alive["max"] <= 3
+
+def test_unknown_task_type_is_the_task_error(memory_reporter):
+    tasks = {"first": {"TASK_TYPE": "request", "uri": "http://localhost/test"}, "unknown": {"TASK_TYPE": "teleport"},
+             "last": {"TASK_TYPE": "request", "uri": "http://localhost/test"}}
+    TestPlan.TestPlan("plan", {"stages": {"stage": {"jobs": _jobs(1, tasks)}}}, memory_reporter).execute(dry_run=True)
+    assert [one_rec.task for one_rec in memory_reporter.get_all(LogRecordType.LATENCY)] == ["first", "last"]
+    assert [one_rec.task for one_rec in memory_reporter.get_all(LogRecordType.ERROR)] == ["unknown"]
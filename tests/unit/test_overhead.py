@@ -0,0 +1,34 @@
+import TestPlan
+from TestPlan.reporter import LogRecordType
+
+REQUEST_TIMERS = ("overhead_auth", "overhead_prepare", "overhead_sign", "overhead_parse", "overhead_queue")
+
+
+def _plan(stand_in, **plan_options)->dict:
+    tasks = {f"request_{request_i}": {"TASK_TYPE": "request", "uri": stand_in.url("/test"), "auth": "token"} for request_i in range(3)}
+    return {**plan_options, "stages": {"stage": {"jobs": {f"job_{job_i}": {"tasks": tasks} for job_i in range(2)}}}}
+
+
+def test_requests_get_overhead_timings(stand_in, memory_reporter):
+    TestPlan.TestPlan("plan", _plan(stand_in, overhead_timers=True), memory_reporter).execute()
+    results = memory_reporter.data()
+    assert len(results) == 6
+    for one_rec in results:
+        assert all(one_rec[timer] >= 0 for timer in REQUEST_TIMERS)
+        assert "overhead_enqueued" not in one_rec
+        # request is signed with the provided token
+        assert one_rec["request_headers"]["Authorization"] == "Bearer token"
+
+def test_overhead_summary(stand_in, memory_reporter):
+    TestPlan.TestPlan("plan", _plan(stand_in, overhead_timers=True), memory_reporter).execute()
+    summary, = memory_reporter.data(LogRecordType.OTHER, task="overhead_summary")
+    for timer in REQUEST_TIMERS:
+        assert summary[timer]["count"] == 6
+        assert 0 <= summary[timer]["mean"] <= summary[timer]["max"]
+    assert summary["reporter_write"]["records"] == 6
+    assert summary["reporter_write"]["batches"] >= 1
+
+def test_no_overhead_timings_by_default(stand_in, memory_reporter):
+    TestPlan.TestPlan("plan", _plan(stand_in), memory_reporter).execute()
+    assert all(not field.startswith("overhead_") for one_rec in memory_reporter.data() for field in one_rec)
+    assert memory_reporter.data(LogRecordType.OTHER, task="overhead_summary") == []
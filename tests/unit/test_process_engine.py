@@ -0,0 +1,87 @@
+from queue import Queue
+import TestPlan
+from TestPlan.engine import EngineType, WorkerBatchQueue
+from TestPlan.collector import CollectorQueue, ResultCollector
+from TestPlan.reporter import LogRecordType
+
+
+def _plan(stand_in, jobs_count:int, path:str="/test", **plan_options)->dict:
+    tasks = {"request": {"uri": stand_in.url(path)}, "second": {"TASK_TYPE": "request", "uri": stand_in.url(path)}}
+    return {**plan_options, "stages": {
+        f"stage_{stage_i}": {"jobs": {f"job_{job_i}": {"tasks": tasks} for job_i in range(jobs_count)}} for stage_i in range(2)
+    }}
+
+
+def test_engine_by_value():
+    assert EngineType.byValue("process") == EngineType.PROCESS
+
+def test_jobs_of_all_stages_are_reported(stand_in, memory_reporter):
+    TestPlan.TestPlan("plan", _plan(stand_in, 3), memory_reporter, max_concurrency=2, engine="process").execute()
+    results = memory_reporter.get_all(LogRecordType.LATENCY)
+    assert sorted((one_rec.stage, one_rec.job) for one_rec in results) == sorted(
+        (f"stage_{stage_i}", f"job_{job_i}") for stage_i in range(2) for job_i in range(3) for _ in range(2)
+    )
+    assert {one_rec.data["statusCode"] for one_rec in results} == {200}
+    assert stand_in.requests == 12
+    # every job reports CPU usage of the worker process
+    cpu_usage = [one_rec for one_rec in memory_reporter.get_all(LogRecordType.OTHER) if one_rec.task == "cpu_usage"]
+    assert len(cpu_usage) == 6
+    assert all(one_rec.data["wall_sec"] > 0 and one_rec.data["cpu_utilization"] >= 0 for one_rec in cpu_usage)
+
+def test_errors_are_reported(stand_in, memory_reporter):
+    TestPlan.TestPlan("plan", _plan(stand_in, 1, "/fail"), memory_reporter, engine="process").execute()
+    assert memory_reporter.get_all(LogRecordType.LATENCY) == []
+    assert [one_rec.data["statusCode"] for one_rec in memory_reporter.get_all(LogRecordType.ERROR)] == [500] * 4
+
+def test_waits_of_the_next_stage_are_counted_from_the_end_of_the_stage(stand_in, memory_reporter):
+    stages = {
+        # one worker process completes its request long before the stage end
+        "first": {"jobs": {"slow": {"tasks": {"request": {"uri": stand_in.url("/slow?ms=400")}}}, "fast": {"tasks": {"request": {"uri": stand_in.url("/test")}}}}},
+        "second": {"jobs": {f"job_{job_i}": {"tasks": {"wait_msec": 200}} for job_i in range(2)}},
+    }
+    TestPlan.TestPlan("plan", {"stages": stages}, memory_reporter, max_concurrency=2, engine="process").execute()
+    waits = [one_rec for one_rec in memory_reporter.data(LogRecordType.OTHER) if "wait_planned" in one_rec]
+    assert len(waits) == 2
+    for one_rec in waits:
+        assert one_rec["wait_planned"] == 200
+        assert abs(one_rec["wait_actual"] - one_rec["wait_planned"]) < 50
+
+def test_dry_run(stand_in, memory_reporter):
+    TestPlan.TestPlan("plan", _plan(stand_in, 2), memory_reporter, engine="process").execute(dry_run=True)
+    assert len(memory_reporter.get_all(LogRecordType.LATENCY)) == 8
+    assert stand_in.requests == 0
+
+def test_worker_batches_keep_order_and_drop_heavy_fields():
+    target = Queue()
+    batch_queue = WorkerBatchQueue(target, batch_size=3, flush_interval=60)
+    results = CollectorQueue(batch_queue, "job", LogRecordType.LATENCY)
+    errors = CollectorQueue(batch_queue, "job", LogRecordType.ERROR)
+    for i in range(4):
+        results.put({"id": i, "body": "large", "headers": {}, "request_headers": {}})
+    errors.put_nowait({"id": 4, "body": "kept"})
+    # first batch is sent as soon as it is full, the rest when closed
+    assert target.qsize() == 1
+    batch_queue.close()
+    batches = [target.get_nowait() for _ in range(target.qsize())]
+    assert all(job_name == ResultCollector._BATCH for job_name, _, _ in batches)
+    messages = [one_message for _, _, items in batches for one_message in items]
+    assert [message["id"] for _, _, message in messages] == list(range(5))
+    assert all(set(message.keys()) == {"id"} for _, log_type, message in messages if log_type == LogRecordType.LATENCY)
+    assert messages[-1] == ("job", LogRecordType.ERROR, {"id": 4, "body": "kept"})
+
+def test_worker_batch_is_sent_on_time():
+    target = Queue()
+    batch_queue = WorkerBatchQueue(target, flush_interval=0.05, heavy_fields=True)
+    try:
+        CollectorQueue(batch_queue, "job", LogRecordType.LATENCY).put({"id": 0, "body": "large"})
+        _, _, items = target.get(timeout=5)
+        assert items == [("job", LogRecordType.LATENCY, {"id": 0, "body": "large"})]
+    finally:
+        batch_queue.close()
+
+def test_collector_unpacks_worker_batches(memory_reporter):
+    collector = ResultCollector("stage", memory_reporter)
+    collector.start()
+    collector.queue.put((ResultCollector._BATCH, None, [("job_0", LogRecordType.LATENCY, {"id": 0}), ("job_1", LogRecordType.ERROR, {"id": 1})]))
+    collector.close()
+    assert [(one_rec.job, one_rec.logType) for one_rec in memory_reporter.records] == [("job_0", LogRecordType.LATENCY), ("job_1", LogRecordType.ERROR)]
@@ -0,0 +1,61 @@
+import random
+from time import perf_counter
+import TestPlan
+from TestPlan.reporter import LogRecordType
+from TestPlan.task import TaskRate, TaskProfile
+
+
+def _rate_plan(stand_in, path:str="/slow?ms=200", rps:int=50, duration_sec:float=1, **task_options)->dict:
+    task = {"TASK_TYPE": "rate", "uri": stand_in.url(path), "rps": rps, "duration_sec": duration_sec, **task_options}
+    return {"stages": {"stage": {"jobs": {"job": {"tasks": {"load": task}}}}}}
+
+
+def test_constant_arrival_offsets():
+    task = TaskRate("rate", {"rps": 4, "duration_sec": 1}, None, None)
+    assert list(task._arrival_offsets(4, 1, random.Random(1))) == [0.0, 0.25, 0.5, 0.75]
+
+def test_constant_arrival_offsets_of_fractional_rate():
+    task = TaskRate("rate", {"rps": 10, "duration_sec": 0.3}, None, None)
+    assert len(list(task._arrival_offsets(10, 0.3, random.Random(1)))) == 3
+    assert list(task._arrival_offsets(2.5, 1, random.Random(1))) == [0.0, 0.4, 0.8]
+    assert list(task._arrival_offsets(2.5, 1, random.Random(1), phase=0.5)) == [0.2, 0.6]
+
+def test_profile_levels_carry_fractional_arrivals():
+    steady = TaskProfile("profile", {"segments": [{"start": 2.5, "duration_sec": 4}]}, None, None)
+    assert len(list(steady._schedule())) == 10
+    # levels shorter than the arrival interval still send requests
+    slow = TaskProfile("profile", {"segments": [{"start": 0.5, "duration_sec": 4}]}, None, None)
+    assert [offset for offset, _ in slow._schedule()] == [0.0, 2.0]
+    ramp = TaskProfile("profile", {"segments": [{"start": 0.5, "end": 3.5, "duration_sec": 4}]}, None, None)
+    assert len(list(ramp._schedule())) == 8
+
+def test_poisson_arrival_is_seeded():
+    task = TaskRate("rate", {"rps": 100, "duration_sec": 1, "arrival": "poisson"}, None, None)
+    offsets = list(task._arrival_offsets(100, 1, random.Random(1)))
+    assert offsets == list(task._arrival_offsets(100, 1, random.Random(1)))
+    assert all(0 < offset < 1 for offset in offsets)
+    assert offsets == sorted(offsets)
+
+def test_requests_are_sent_at_the_rate(stand_in, memory_reporter):
+    TestPlan.TestPlan("plan", _rate_plan(stand_in, "/test", rps=20, duration_sec=0.5), memory_reporter).execute()
+    results = memory_reporter.data()
+    assert len(results) == 10
+    assert all("intended_timestamp" in one_rec for one_rec in results)
+
+def test_connections_are_kept_alive_for_requests_in_flight(stand_in, memory_reporter):
+    # 3 bursts of 10 requests in flight at the same time - much more than the plan pool size
+    burst = {"TASK_TYPE": "rate", "uri": stand_in.url("/slow?ms=200"), "rps": 100, "duration_sec": 0.1, "max_in_flight": 20}
+    tasks = {f"burst_{burst_i}": burst for burst_i in range(3)}
+    plan = {"stages": {"stage": {"jobs": {"job": {"tasks": tasks}}}}}
+    TestPlan.TestPlan("plan", plan, memory_reporter, max_concurrency=3).execute()
+    assert len(memory_reporter.get_all(LogRecordType.LATENCY)) == 30
+    # connections over the plan pool size are not closed after the burst and are reused by the next one
+    assert stand_in.connections <= 12
+
+def test_asyncio_requests_in_flight_are_not_limited_by_the_pool_size(stand_in, memory_reporter):
+    start = perf_counter()
+    TestPlan.TestPlan("plan", _rate_plan(stand_in, max_in_flight=20), memory_reporter, max_concurrency=3, engine="asyncio").execute()
+    assert len(memory_reporter.get_all(LogRecordType.LATENCY)) == 50
+    # 3 connections would take 50 * 0.2 / 3 = 3.3 sec
+    assert perf_counter() - start < 2
+    assert stand_in.connections <= 20
@@ -0,0 +1,65 @@
+import pytest
+from time import perf_counter
+from TestPlan.ratelimit import TokenBucket, RateLimiter, reserve_all
+
+# reserve() is expected to return within this time (sec) from perf_counter() taken around it
+TOLERANCE = 0.005
+
+
+def test_burst_is_available_at_once():
+    bucket = TokenBucket(rps=10, burst=3)
+    start = perf_counter()
+    send_at = [bucket.reserve() for _ in range(3)]
+    assert all(one_send - start < TOLERANCE for one_send in send_at)
+
+def test_requests_after_burst_are_spaced_by_interval():
+    bucket = TokenBucket(rps=10, burst=3)
+    send_at = [bucket.reserve() for _ in range(6)]
+    # 4th request waits for the first token to be refilled, next ones come every 1 / rps
+    assert send_at[3] - send_at[0] == pytest.approx(0.1, abs=TOLERANCE)
+    for one_send, next_send in zip(send_at[3:], send_at[4:]):
+        assert next_send - one_send == pytest.approx(0.1, abs=TOLERANCE)
+
+def test_burst_of_one_spaces_every_request():
+    bucket = TokenBucket(rps=50)
+    send_at = [bucket.reserve() for _ in range(5)]
+    for one_send, next_send in zip(send_at, send_at[1:]):
+        assert next_send - one_send == pytest.approx(0.02, abs=TOLERANCE)
+
+def test_idle_bucket_does_not_accumulate_more_than_burst():
+    bucket = TokenBucket(rps=1000, burst=2)
+    bucket.reserve()
+    start = perf_counter()
+    while perf_counter() - start < 0.05:
+        pass
+    now = perf_counter()
+    send_at = [bucket.reserve() for _ in range(3)]
+    assert send_at[0] - now < TOLERANCE
+    assert send_at[1] - now < TOLERANCE
+    assert send_at[2] - send_at[1] == pytest.approx(0.001, abs=TOLERANCE)
+
+def test_bucket_requires_positive_rate():
+    with pytest.raises(ValueError):
+        TokenBucket(rps=0)
+
+def test_limiter_share_splits_rate_and_burst():
+    limiter = RateLimiter("plan", {"rps": 100, "burst": 4}, share=0.5)
+    send_at = [limiter.reserve("http://localhost/x") for _ in range(3)]
+    # burst 2 and 50 rps per share
+    assert send_at[1] - send_at[0] < TOLERANCE
+    assert send_at[2] - send_at[0] == pytest.approx(0.02, abs=TOLERANCE)
+
+def test_host_limit_applies_to_its_host_only():
+    limiter = RateLimiter("plan", {"hosts": {"slow.example.com": 10}})
+    slow = [limiter.reserve("https://slow.example.com/a") for _ in range(2)]
+    assert slow[1] - slow[0] == pytest.approx(0.1, abs=TOLERANCE)
+    other = [limiter.reserve("https://fast.example.com/a") for _ in range(2)]
+    assert other[1] - other[0] < TOLERANCE
+
+def test_reserve_all_waits_for_the_strictest_limiter():
+    plan = RateLimiter("plan", 1000)
+    stage = RateLimiter("stage", 10)
+    first = reserve_all([plan, stage], "http://localhost/x")
+    second = reserve_all([plan, stage], "http://localhost/x")
+    assert second - first == pytest.approx(0.1, abs=TOLERANCE)
+    assert reserve_all([], "http://localhost/x") == 0.0
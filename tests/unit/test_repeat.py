@@ -0,0 +1,78 @@
+import pytest
+from time import perf_counter
+import TestPlan
+from TestPlan.repeat import Repeat
+from TestPlan.reporter import LogRecordType
+
+
+def _iterations(definition:dict, dry_run:bool=False):
+    return list(Repeat("task", definition).iterations(dry_run))
+
+def _run(memory_reporter, job:dict, dry_run:bool=False):
+    TestPlan.TestPlan("plan", {"stages": {"stage": {"jobs": {"job": job}}}}, memory_reporter).execute(dry_run=dry_run)
+
+
+def test_definition_is_validated():
+    with pytest.raises(ValueError):
+        Repeat("task", 3)
+    with pytest.raises(ValueError):
+        Repeat("task", {"wait_sec": 1})
+    with pytest.raises(ValueError):
+        Repeat("task", {"until": "timeout"})
+
+def test_count_with_fixed_wait():
+    assert _iterations({"count": 3, "wait_sec": 2}) == [(0, 0.0), (1, 2.0), (2, 2.0)]
+    assert _iterations({"count": 2, "wait_msec": 250}) == [(0, 0.0), (1, 0.25)]
+
+def test_list_of_waits_is_cycled():
+    assert [wait for _, wait in _iterations({"count": 5, "wait_msec": [10, 20]})] == [0.0, 0.01, 0.02, 0.01, 0.02]
+
+def test_wait_distribution_is_repeatable_with_seed():
+    definition = {"count": 50, "wait_sec": {"distribution": "uniform", "min": 1, "max": 2}, "seed": 3}
+    waits = [wait for _, wait in _iterations(definition)]
+    assert waits == [wait for _, wait in _iterations(definition)]
+    assert all(1 <= wait <= 2 for wait in waits[1:])
+    # negative waits of the normal distribution are not waited
+    normal = _iterations({"count": 50, "wait_sec": {"distribution": "normal", "mean": 0, "stddev": 1}, "seed": 1})
+    assert all(wait >= 0 for _, wait in normal)
+    with pytest.raises(ValueError):
+        _iterations({"count": 2, "wait_sec": {"distribution": "zipf"}})
+
+def test_duration_includes_the_next_wait(stand_in, memory_reporter):
+    _run(memory_reporter, {"tasks": {"request": {"uri": stand_in.url("/test"), "repeat": {"duration_sec": 0.5, "wait_msec": 200}}}})
+    # the fourth iteration would start after the duration is over
+    assert [one_rec["repeat_iteration"] for one_rec in memory_reporter.data()] == [0, 1, 2]
+
+def test_dry_run_has_one_iteration_unless_count_is_provided():
+    assert len(_iterations({"duration_sec": 60}, dry_run=True)) == 1
+    assert len(_iterations({"count": 4}, dry_run=True)) == 4
+
+def test_job_repeat_tags_results(memory_reporter):
+    tasks = {"first": {"TASK_TYPE": "request", "uri": "http://localhost/test"}, "second": {"TASK_TYPE": "request", "uri": "http://localhost/test"}}
+    _run(memory_reporter, {"repeat": {"count": 3, "wait_msec": [10, 20]}, "tasks": tasks}, dry_run=True)
+    assert [(one_rec["task"], one_rec["repeat_iteration"], one_rec["repeat_wait"]) for one_rec in memory_reporter.data()] == [
+        ("first", 0, 0.0), ("second", 0, 0.0), ("first", 1, 10.0), ("second", 1, 10.0), ("first", 2, 20.0), ("second", 2, 20.0)
+    ]
+
+def test_task_repeat_waits_between_iterations(stand_in, memory_reporter):
+    start = perf_counter()
+    _run(memory_reporter, {"tasks": {"request": {"uri": stand_in.url("/test"), "repeat": {"count": 3, "wait_msec": 100}}}})
+    assert perf_counter() - start >= 0.2
+    assert [one_rec["repeat_iteration"] for one_rec in memory_reporter.data()] == [0, 1, 2]
+    waits = [one_rec for one_rec in memory_reporter.data(LogRecordType.OTHER) if one_rec["task"] == "request_repeat_wait_msec"]
+    assert [one_rec["repeat_iteration"] for one_rec in waits] == [1, 2]
+
+def test_repeat_until_error(stand_in, memory_reporter):
+    tasks = {"ok": {"TASK_TYPE": "request", "uri": stand_in.url("/test")}, "fail": {"TASK_TYPE": "request", "uri": stand_in.url("/fail")}}
+    _run(memory_reporter, {"repeat": {"count": 5, "until": "error"}, "tasks": tasks})
+    assert [one_rec["repeat_iteration"] for one_rec in memory_reporter.data()] == [0]
+    assert [one_rec["repeat_iteration"] for one_rec in memory_reporter.data(LogRecordType.ERROR)] == [0]
+
+def test_repeat_until_success(stand_in, memory_reporter):
+    _run(memory_reporter, {"tasks": {"request": {"uri": stand_in.url("/test"), "repeat": {"count": 5, "until": "success"}}}})
+    assert len(memory_reporter.data()) == 1
+
+def test_incorrect_repeat_is_the_job_error(memory_reporter):
+    _run(memory_reporter, {"repeat": {"wait_sec": 1}, "tasks": {"request": {"uri": "http://localhost/test"}}}, dry_run=True)
+    assert memory_reporter.data() == []
+    assert [one_rec["task"] for one_rec in memory_reporter.data(LogRecordType.ERROR)] == ["repeat"]
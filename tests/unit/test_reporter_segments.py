@@ -0,0 +1,64 @@
+import pytest
+from TestPlan.reporter import LogRecord, LogRecordType, SEGMENT_LINE_SEPARATOR
+
+
+def _latency(i:int, record_type:LogRecordType=LogRecordType.LATENCY)->LogRecord:
+    return LogRecord("stage", f"job_{i % 3}", "task", record_type, {"id": i, "latency": float(i), "place_timestamp": 1000.0 + i})
+
+def _ids(records):
+    return [one_rec.data["id"] for one_rec in records]
+
+
+def test_segments_rotate_by_size_and_are_read_in_order(make_reporter):
+    reporter = make_reporter("json", segment_max_mb=0.0001)
+    for bunch_i in range(10):
+        reporter.add_bunch([_latency(bunch_i * 5 + i) for i in range(5)])
+    assert _ids(reporter.iter_records(LogRecordType.LATENCY)) == list(range(50))
+    assert len(reporter._segments(LogRecordType.LATENCY)) > 1
+
+def test_segments_rotate_by_age(make_reporter):
+    reporter = make_reporter("json", segment_max_sec=0)
+    for i in range(3):
+        reporter.add(_latency(i))
+        reporter.flush()
+    assert len(reporter._segments(LogRecordType.LATENCY)) == 3
+    assert _ids(reporter.get_all(LogRecordType.LATENCY)) == [0, 1, 2]
+
+def test_record_types_go_to_own_folders(make_reporter):
+    reporter = make_reporter("json")
+    reporter.add_bunch([_latency(0), _latency(1, LogRecordType.ERROR), _latency(2, LogRecordType.OTHER)])
+    assert _ids(reporter.get_all(LogRecordType.LATENCY)) == [0]
+    assert _ids(reporter.get_all(LogRecordType.ERROR)) == [1]
+    assert _ids(reporter.get_all(LogRecordType.OTHER)) == [2]
+
+def test_gzip_segments_are_readable_before_and_after_close(make_reporter):
+    reporter = make_reporter("json", compression="gzip")
+    reporter.add_bunch([_latency(i) for i in range(20)])
+    # segment is still written
+    assert _ids(reporter.iter_records(LogRecordType.LATENCY)) == list(range(20))
+    reporter.close()
+    assert all(segment.suffix == ".gz" for segment in reporter._segments(LogRecordType.LATENCY))
+    assert _ids(reporter.iter_records(LogRecordType.LATENCY)) == list(range(20))
+    # closed reporter starts the new segment
+    reporter.add(_latency(20))
+    reporter.close()
+    assert _ids(reporter.iter_records(LogRecordType.LATENCY)) == list(range(21))
+
+def test_unknown_compression(make_reporter):
+    with pytest.raises(ValueError):
+        make_reporter("json", compression="zstd")
+
+def test_get_one_by_segment_line(make_reporter):
+    reporter = make_reporter("json")
+    reporter.add_bunch([_latency(i) for i in range(5)])
+    record_ids = reporter.list_all(LogRecordType.LATENCY)
+    assert all(SEGMENT_LINE_SEPARATOR in record_id for record_id in record_ids)
+    assert reporter.get_one(record_ids[3]).data["id"] == 3
+    with pytest.raises(ValueError):
+        reporter.get_one(f"{record_ids[0].rsplit(SEGMENT_LINE_SEPARATOR, 1)[0]}{SEGMENT_LINE_SEPARATOR}100")
+
+def test_record_which_cant_be_serialized_is_skipped(make_reporter):
+    reporter = make_reporter("json")
+    broken = LogRecord("stage", "job_0", "task", LogRecordType.LATENCY, {"id": 1, "latency": object()})
+    reporter.add_bunch([_latency(0), broken, _latency(2)])
+    assert _ids(reporter.get_all(LogRecordType.LATENCY)) == [0, 2]
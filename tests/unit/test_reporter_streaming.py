@@ -0,0 +1,112 @@
+import pytest
+from TestPlan.reporter import ReportAggregator, LogRecord, LogRecordType, record_matches
+
+# slow first requests and steady state from the 4th request of every series
+RAMP = [300, 100, 30, 10, 10, 10, 10]
+WARMUP = {"window": 3}
+
+
+def _record(stage="stage", job="job", task="task", **data)->LogRecord:
+    return LogRecord(stage, job, task, LogRecordType.LATENCY, data)
+
+def _series_records():
+    ''' 2 series (request url) of RAMP latencies - records are added not in the place time order '''
+    records = []
+    for series_i, url in enumerate(["http://a", "http://b"]):
+        for request_i, latency in enumerate(RAMP):
+            records.append(_record(
+                job=f"job_{request_i % 2}", id=f"{url}/{request_i}", request_url=url, latency=latency,
+                place_timestamp=1000.0 + request_i * 10 + series_i, warmup_detection=WARMUP,
+                status=200, extra={"size": request_i},
+            ))
+    return records[5:] + records[:5]
+
+# options of every reporter for small segments and parts
+REPORTERS = {
+    "json": {"segment_max_mb": 0.0005},
+    "columnar": {"part_rows": 4},
+    "sqlite": {},
+}
+
+@pytest.fixture(params=list(REPORTERS.keys()))
+def reporter(request, make_reporter):
+    reporter = make_reporter(request.param, **REPORTERS[request.param])
+    records = _series_records()
+    for bunch_i in range(0, len(records), 3):
+        reporter.add_bunch(records[bunch_i:bunch_i + 3])
+    return reporter
+
+
+def test_record_matches_names():
+    one_rec = _record(stage="s1", job="j1", task="t1", place_timestamp=10.0)
+    assert record_matches(one_rec, None)
+    assert record_matches(one_rec, {})
+    assert record_matches(one_rec, {"stage": "s1", "job": "j1", "task": "t1"})
+    assert record_matches(one_rec, {"stage": ["s0", "s1"]})
+    assert not record_matches(one_rec, {"stage": "s"})
+    assert not record_matches(one_rec, {"stage": ["s0", "s2"]})
+    assert not record_matches(one_rec, {"job": "j2"})
+    assert not record_matches(one_rec, {"task": "t2"})
+
+def test_record_matches_timestamps():
+    one_rec = _record(place_timestamp=10.0)
+    # timestamp_from is inclusive, timestamp_to is exclusive
+    assert record_matches(one_rec, {"timestamp_from": 10.0, "timestamp_to": 10.5})
+    assert not record_matches(one_rec, {"timestamp_from": 10.5})
+    assert not record_matches(one_rec, {"timestamp_to": 10.0})
+    assert not record_matches(_record(), {"timestamp_from": 0})
+    assert not record_matches(LogRecord("stage", "job", "task", LogRecordType.OTHER, "text"), {"timestamp_to": 100})
+
+def test_record_matches_unknown_filter():
+    with pytest.raises(ValueError):
+        record_matches(_record(), {"url": "http://a"})
+
+@pytest.mark.parametrize("options", [
+    {},
+    {"columns": ["latency", "status"]},
+    {"filters": {"job": "job_1"}},
+    {"columns": ["latency"], "filters": {"timestamp_from": 1020, "timestamp_to": 1050}},
+], ids=["all", "columns", "filters", "columns-filters"])
+def test_both_passes_read_records_in_the_same_order(reporter, options):
+    first = [one_rec.as_dict() for one_rec in ReportAggregator._iter_source(reporter, LogRecordType.LATENCY, options)]
+    second = [one_rec.as_dict() for one_rec in ReportAggregator._iter_source(reporter, LogRecordType.LATENCY, options)]
+    assert len(first) > 0
+    assert first == second
+
+def test_columns_option_reads_requested_and_warmup_fields(reporter):
+    options = {"columns": ["status"]}
+    for one_rec in ReportAggregator._iter_source(reporter, LogRecordType.LATENCY, options):
+        assert set(one_rec.data.keys()) <= {"status", "latency", "place_timestamp", "request_url", "warmup_detection"}
+        assert "status" in one_rec.data
+
+def test_filters_option(reporter):
+    options = {"filters": {"job": "job_1", "timestamp_from": 1010, "timestamp_to": 1040}}
+    ids = sorted(one_rec.data["id"] for one_rec in ReportAggregator._iter_source(reporter, LogRecordType.LATENCY, options))
+    assert ids == ["http://a/1", "http://a/3", "http://b/1", "http://b/3"]
+
+@pytest.mark.parametrize("columns", [None, ["id", "latency"]], ids=["all", "columns"])
+def test_warmup_records_are_tagged(reporter, columns):
+    options = {"columns": columns, "warmup_detection": True}
+    _, warmup, _ = ReportAggregator._scan(reporter, LogRecordType.LATENCY, options)
+    phases = {
+        one_rec.data["id"]: one_rec.data["phase"]
+            for one_rec in ReportAggregator._iter_report_records(reporter, LogRecordType.LATENCY, options, warmup)
+    }
+    expected_warmup = {f"{url}/{request_i}" for url in ["http://a", "http://b"] for request_i in range(3)}
+    assert {record_id for record_id, phase in phases.items() if phase == "warmup"} == expected_warmup
+    assert len(phases) == 2 * len(RAMP)
+
+def test_warmup_records_are_excluded(reporter):
+    options = {"exclude_warmup": True}
+    _, warmup, _ = ReportAggregator._scan(reporter, LogRecordType.LATENCY, options)
+    records = list(ReportAggregator._iter_report_records(reporter, LogRecordType.LATENCY, options, warmup))
+    assert len(records) == 2 * (len(RAMP) - 3)
+    assert all(one_rec.data["phase"] == "steady" for one_rec in records)
+    # detection settings are not reported
+    assert all("warmup_detection" not in one_rec.data for one_rec in records)
+
+def test_warmup_is_not_detected_by_default(reporter):
+    _, warmup, _ = ReportAggregator._scan(reporter, LogRecordType.LATENCY, {})
+    records = list(ReportAggregator._iter_report_records(reporter, LogRecordType.LATENCY, {}, warmup))
+    assert len(records) == 2 * len(RAMP)
+    assert all("phase" not in one_rec.data for one_rec in records)
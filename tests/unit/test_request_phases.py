@@ -0,0 +1,57 @@
+import pytest
+from TestPlan import request
+
+PHASES = ("latency_dns", "latency_connect", "latency_tls", "latency_ttfb", "latency_download")
+
+
+def _place(session, url:str)->dict:
+    test_request = request.TestRequest(session=session)
+    try:
+        return test_request.place(url=url, method="GET")
+    finally:
+        test_request.close()
+
+
+def test_new_connection_phases(stand_in):
+    session = request.create_session()
+    try:
+        result = _place(session, stand_in.url("/test"))
+    finally:
+        session.close()
+    assert result["statusCode"] == 200
+    assert result["connection_reused"] is False
+    assert all(result[phase] >= 0 for phase in PHASES)
+    # plain http connection has no TLS handshake
+    assert result["latency_tls"] == 0
+    assert sum(result[phase] for phase in PHASES) == pytest.approx(result["latency"], abs=1)
+    assert result["response_bytes"] == len(b'{"message": "ok"}')
+
+def test_reused_connection_has_no_connection_phases(stand_in):
+    session = request.create_session()
+    try:
+        _place(session, stand_in.url("/test"))
+        result = _place(session, stand_in.url("/test"))
+    finally:
+        session.close()
+    assert result["connection_reused"] is True
+    assert (result["latency_dns"], result["latency_connect"], result["latency_tls"]) == (0, 0, 0)
+    assert stand_in.connections == 1
+
+def test_server_time_is_time_to_first_byte(stand_in):
+    session = request.create_session()
+    try:
+        result = _place(session, stand_in.url("/slow?ms=100"))
+    finally:
+        session.close()
+    assert result["latency_ttfb"] >= 100
+    assert result["latency_download"] < result["latency_ttfb"]
+
+def test_dry_run_has_no_phases(stand_in):
+    test_request = request.TestRequest()
+    try:
+        result = test_request.place(url=stand_in.url("/test"), method="GET", dry_run=True)
+    finally:
+        test_request.close()
+    assert result["connection_reused"] is True
+    assert all(result[phase] == pytest.approx(0, abs=1) for phase in PHASES)
+    assert stand_in.requests == 0
@@ -0,0 +1,34 @@
+from time import perf_counter
+from TestPlan.scheduler import Timeline, sleep_until
+
+
+def test_timeline_anchor_is_the_latest_mark():
+    timeline = Timeline()
+    before = perf_counter()
+    assert timeline.anchor() >= before
+    assert timeline.last_mark is None
+    timeline.mark(10.0)
+    timeline.mark(5.0)
+    assert timeline.anchor() == 10.0
+    assert timeline.last_mark == 10.0
+
+def test_job_timeline_starts_at_the_stage_anchor_and_marks_the_parent():
+    chain = Timeline()
+    chain.mark(10.0)
+    job_a, job_b = Timeline(chain.anchor(), parent=chain), Timeline(chain.anchor(), parent=chain)
+    assert job_a.anchor() == 10.0 and job_a.last_mark is None
+    job_a.mark(20.0)
+    job_b.mark(15.0)
+    # jobs don't see activity of each other
+    assert (job_a.anchor(), job_b.anchor()) == (20.0, 15.0)
+    # next stage is anchored to the latest activity of all jobs
+    assert chain.anchor() == 20.0
+
+def test_sleep_until_deadline():
+    deadline = perf_counter() + 0.05
+    assert sleep_until(deadline) >= deadline
+
+def test_sleep_until_is_interrupted():
+    start = perf_counter()
+    woke = sleep_until(start + 10, stopped=lambda: perf_counter() - start > 0.05)
+    assert woke - start < 1
@@ -0,0 +1,76 @@
+import pytest
+import inspect
+import sqlite3
+from TestPlan.reporter import Reporter, LogRecord, LogRecordType
+from TestPlan.sqlite import ReporterSqlite
+
+
+def _record(i:int, stage:str="stage", job:str="job", task:str="task", record_type:LogRecordType=LogRecordType.LATENCY, **data)->LogRecord:
+    return LogRecord(stage, job, task, record_type, {"id": i, "place_timestamp": 1000.0 + i, **data})
+
+def _ids(records):
+    return [one_rec.data["id"] for one_rec in records]
+
+@pytest.fixture
+def reporter(make_reporter):
+    reporter = make_reporter("sqlite")
+    reporter.add_bunch([
+        _record(i, stage=f"stage_{i % 2}", job=f"job_{i % 3}", task="login" if i < 5 else "search", latency=float(i))
+            for i in range(10)
+    ])
+    reporter.add_bunch([_record(10, record_type=LogRecordType.ERROR, message="failed"), LogRecord("stage", "job", "NIM", LogRecordType.OTHER, "text")])
+    return reporter
+
+
+def test_records_are_read_in_the_order_they_were_added(reporter):
+    assert _ids(reporter.get_all(LogRecordType.LATENCY)) == list(range(10))
+    assert _ids(reporter.get_all(LogRecordType.ERROR)) == [10]
+    assert [one_rec.data for one_rec in reporter.get_all(LogRecordType.OTHER)] == ["text"]
+    first = reporter.get_all(LogRecordType.LATENCY)[0]
+    assert (first.stage, first.job, first.task, first.logType) == ("stage_0", "job_0", "login", "latency")
+
+@pytest.mark.parametrize("method", ["list_all", "get_all", "iter_records", "get_columns"])
+def test_methods_match_the_reporter(method):
+    assert inspect.signature(getattr(ReporterSqlite, method)) == inspect.signature(getattr(Reporter, method))
+
+def test_get_one_by_id(reporter):
+    record_ids = reporter.list_all(LogRecordType.LATENCY)
+    assert len(record_ids) == 10
+    assert reporter.get_one(record_ids[4]).data["id"] == 4
+    with pytest.raises(ValueError):
+        reporter.get_one(1000)
+
+def test_iter_records_with_filters(reporter):
+    assert _ids(reporter.iter_records(LogRecordType.LATENCY, {"stage": "stage_1", "task": ["search"]})) == [5, 7, 9]
+    assert _ids(reporter.iter_records(LogRecordType.LATENCY, {"job": ["job_0", "job_2"], "timestamp_from": 1003, "timestamp_to": 1008})) == [3, 5, 6]
+    with pytest.raises(ValueError):
+        list(reporter.iter_records(LogRecordType.LATENCY, {"url": "http://a"}))
+
+def test_iter_records_reads_in_batches(reporter, monkeypatch):
+    monkeypatch.setattr(type(reporter), "FETCH_ROWS", 3)
+    assert _ids(reporter.iter_records(LogRecordType.LATENCY)) == list(range(10))
+
+def test_get_columns(reporter):
+    assert reporter.get_columns(LogRecordType.LATENCY, ["job", "latency", "missing"], {"task": "login"}) == {
+        "job": ["job_0", "job_1", "job_2", "job_0", "job_1"], "latency": [0.0, 1.0, 2.0, 3.0, 4.0], "missing": [None] * 5
+    }
+
+def test_records_are_indexed(reporter, tmp_path):
+    connection = sqlite3.connect(tmp_path / "log_records.sqlite")
+    try:
+        plan = connection.execute("EXPLAIN QUERY PLAN SELECT data FROM records WHERE logType = ? AND task = ?", ("latency", "login")).fetchall()
+    finally:
+        connection.close()
+    assert any("USING INDEX" in str(row) for row in plan)
+
+def test_reporters_share_the_database(reporter, make_reporter):
+    make_reporter("sqlite").add(_record(11))
+    assert _ids(reporter.get_all(LogRecordType.LATENCY)) == list(range(10)) + [11]
+
+def test_get_columns_returns_values_as_added(make_reporter):
+    reporter = make_reporter("sqlite")
+    values = {"nested": {"window": 3}, "items": [1, "a"], "ok": True, "failed": False, "text": "[1]", "empty": None}
+    reporter.add(_record(0, **values))
+    columns = reporter.get_columns(LogRecordType.LATENCY, list(values.keys()))
+    assert columns == {name: [value] for name, value in values.items()}
+    assert columns["ok"][0] is True
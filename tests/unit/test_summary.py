@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+from TestPlan.summary import ReportAggregatorSummary, SUMMARY_PERCENTILES
+
+
+def _groups(*samples):
+    ''' codes and latencies of the groups (records of groups are interleaved) '''
+    codes = np.concatenate([np.full(len(sample), group_i, dtype=np.int64) for group_i, sample in enumerate(samples)])
+    latencies = np.concatenate([np.asarray(sample, dtype=np.float64) for sample in samples])
+    order = np.random.default_rng(1).permutation(len(codes))
+    return (codes[order], latencies[order])
+
+
+def test_statistics_match_numpy():
+    rng = np.random.default_rng(0)
+    samples = [rng.lognormal(3, 0.5, 1000), rng.exponential(20, 37), [5.0], [1.0, 2.0]]
+    codes, latencies = _groups(*samples)
+    stats = ReportAggregatorSummary.summary(codes, latencies, len(samples), bootstrap=0)
+    for group_i, sample in enumerate(samples):
+        assert stats["count"][group_i] == len(sample)
+        assert stats["mean"][group_i] == pytest.approx(np.mean(sample))
+        assert stats["stddev"][group_i] == pytest.approx(np.std(sample, ddof=1) if len(sample) > 1 else 0.0)
+        assert stats["max"][group_i] == pytest.approx(np.max(sample))
+        for name, quantile in SUMMARY_PERCENTILES.items():
+            assert stats[name][group_i] == pytest.approx(np.percentile(sample, quantile * 100))
+
+def test_no_confidence_intervals_without_bootstrap():
+    codes, latencies = _groups([1.0, 2.0, 3.0])
+    stats = ReportAggregatorSummary.summary(codes, latencies, 1, bootstrap=0)
+    assert not any(name.endswith("_ci_low") or name.endswith("_ci_high") for name in stats)
+
+def test_confidence_intervals_contain_estimate():
+    rng = np.random.default_rng(0)
+    samples = [rng.lognormal(3, 0.5, 500), rng.exponential(20, 50)]
+    codes, latencies = _groups(*samples)
+    stats = ReportAggregatorSummary.summary(codes, latencies, len(samples), bootstrap=500)
+    for group_i in range(len(samples)):
+        for name in SUMMARY_PERCENTILES:
+            assert stats[f"{name}_ci_low"][group_i] <= stats[name][group_i] <= stats[f"{name}_ci_high"][group_i]
+
+def test_median_confidence_interval_covers_true_median():
+    sample = np.random.default_rng(0).normal(100, 10, 5000)
+    codes, latencies = _groups(sample)
+    stats = ReportAggregatorSummary.summary(codes, latencies, 1, bootstrap=1000, confidence=0.99)
+    assert stats["p50_ci_low"][0] <= 100 <= stats["p50_ci_high"][0]
+    # standard error of the median is ~ 1.25 * 10 / sqrt(5000)
+    assert stats["p50_ci_high"][0] - stats["p50_ci_low"][0] < 2
+
+def test_confidence_intervals_shrink_with_sample_size():
+    rng = np.random.default_rng(0)
+    samples = [rng.normal(100, 10, 100), rng.normal(100, 10, 10000)]
+    codes, latencies = _groups(*samples)
+    stats = ReportAggregatorSummary.summary(codes, latencies, len(samples), bootstrap=1000)
+    for name in ("p50", "p90"):
+        widths = [stats[f"{name}_ci_high"][group_i] - stats[f"{name}_ci_low"][group_i] for group_i in range(len(samples))]
+        assert widths[1] < widths[0] / 3
+
+def test_bootstrap_is_deterministic_for_seed():
+    codes, latencies = _groups(np.random.default_rng(0).exponential(20, 300))
+    first = ReportAggregatorSummary.summary(codes, latencies, 1, bootstrap=200, seed=7)
+    assert ReportAggregatorSummary.summary(codes, latencies, 1, bootstrap=200, seed=7) == first
+    assert ReportAggregatorSummary.summary(codes, latencies, 1, bootstrap=200, seed=8) != first
+
+def test_no_records():
+    stats = ReportAggregatorSummary.summary(np.zeros(0, dtype=np.int64), np.zeros(0), 0)
+    assert all(values == [] for values in stats.values())
@@ -0,0 +1,55 @@
+import pytest
+from TestPlan.warmup import steady_start, warmup_positions, warmup_settings, DEFAULT_WARMUP
+
+WINDOW_3 = {**DEFAULT_WARMUP, "window": 3}
+# cold start, slow first requests and steady state from the 4th request
+RAMP = [300, 100, 30, 10, 10, 10, 10]
+# latency never settles
+NOISY = [100, 10, 100, 10, 100, 10]
+
+
+def test_steady_start_is_the_first_low_variation_window():
+    assert steady_start(RAMP, WINDOW_3) == 3
+
+def test_steady_from_the_first_request():
+    assert steady_start([10, 11, 10, 9, 10], WINDOW_3) == 0
+
+def test_min_requests_are_always_warmup():
+    assert steady_start(RAMP, {**WINDOW_3, "min": 5}) == 5
+    # steady window found after min is not moved
+    assert steady_start(RAMP, {**WINDOW_3, "min": 2}) == 3
+
+def test_max_limits_the_warmup():
+    assert steady_start(RAMP, {**WINDOW_3, "max": 2}) == 2
+
+def test_never_steady_series():
+    # only min first requests are the warm-up unless max is provided
+    assert steady_start(NOISY, WINDOW_3) == 0
+    assert steady_start(NOISY, {**WINDOW_3, "min": 1}) == 1
+    assert steady_start(NOISY, {**WINDOW_3, "max": 4}) == 4
+
+def test_series_shorter_than_window():
+    assert steady_start([300, 10], WINDOW_3) == 0
+    assert steady_start([], WINDOW_3) == 0
+
+def test_fixed_number_of_warmup_requests():
+    settings = warmup_settings(2)
+    assert steady_start([10] * 20, settings) == 2
+    assert steady_start([1000, 10, 10], settings) == 2
+
+def test_warmup_settings():
+    assert warmup_settings(None) == DEFAULT_WARMUP
+    assert warmup_settings(True) == DEFAULT_WARMUP
+    assert warmup_settings(False) is None
+    assert warmup_settings({"window": 5}) == {**DEFAULT_WARMUP, "window": 5}
+    with pytest.raises(ValueError):
+        warmup_settings("fast")
+
+def test_warmup_positions_follow_place_time_order():
+    # records are not in the place time order - positions of the 2 earliest requests are returned
+    timestamps = [5, 1, 2, 3, 4, 6, 7]
+    latencies = [10, 300, 100, 10, 10, 10, 10]
+    assert warmup_positions(timestamps, latencies, WINDOW_3) == [1, 2]
+
+def test_no_warmup_positions_without_settings():
+    assert warmup_positions([1, 2, 3], [300, 10, 10], None) == []
@@ -0,0 +1,100 @@
+import openpyxl
+from openpyxl.styles import Font, PatternFill
+from TestPlan.xlsx import XlsxSheetWriter, _add_sheets
+
+
+def _existing_workbook(path):
+    ''' workbook with styled sheet, formula and the second sheet - as saved by Excel / openpyxl '''
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.title = "results"
+    sheet.append(["name", "value"])
+    sheet["A1"].font = Font(bold=True)
+    sheet["A1"].fill = PatternFill("solid", fgColor="FFFF00")
+    for i in range(1, 6):
+        sheet.append([f"row {i}", i])
+    sheet["B7"] = "=SUM(B2:B6)"
+    notes = workbook.create_sheet("notes")
+    notes["A1"] = "keep me"
+    workbook.save(path)
+
+def _write(destination, sheet_name, header, rows, max_rows=None):
+    options = {} if max_rows is None else {"max_rows": max_rows}
+    with XlsxSheetWriter(destination, sheet_name, header, **options) as writer:
+        for row in rows:
+            writer.append(row)
+
+def _values(sheet):
+    return [list(row) for row in sheet.iter_rows(values_only=True)]
+
+
+def test_new_workbook_is_created(tmp_path):
+    destination = tmp_path / "report.xlsx"
+    _write(destination, "summary", ["a", "b"], [[1, "x"], [2, "y"]])
+    workbook = openpyxl.load_workbook(destination)
+    assert workbook.sheetnames == ["summary"]
+    assert _values(workbook["summary"]) == [["a", "b"], [1, "x"], [2, "y"]]
+
+def test_sheets_are_added_to_existing_workbook(tmp_path):
+    destination = tmp_path / "report.xlsx"
+    _existing_workbook(destination)
+    _write(destination, "summary", ["a", "b"], [[1, "x"], [2, True]])
+    workbook = openpyxl.load_workbook(destination)
+    assert workbook.sheetnames == ["results", "notes", "summary"]
+    assert _values(workbook["summary"]) == [["a", "b"], [1, "x"], [2, True]]
+    # existing sheets are intact
+    results = workbook["results"]
+    assert _values(results)[:6] == [["name", "value"]] + [[f"row {i}", i] for i in range(1, 6)]
+    assert results["B7"].value == "=SUM(B2:B6)"
+    assert results["A1"].font.bold
+    assert results["A1"].fill.fgColor.rgb.endswith("FFFF00")
+    assert workbook["notes"]["A1"].value == "keep me"
+
+def test_duplicate_sheet_name_gets_suffix(tmp_path):
+    destination = tmp_path / "report.xlsx"
+    _existing_workbook(destination)
+    _write(destination, "results", ["a"], [[1]])
+    _write(destination, "results", ["a"], [[2]])
+    workbook = openpyxl.load_workbook(destination)
+    assert workbook.sheetnames == ["results", "notes", "results-2", "results-3"]
+    assert _values(workbook["results-2"]) == [["a"], [1]]
+    assert _values(workbook["results-3"]) == [["a"], [2]]
+
+def test_rows_over_max_go_to_next_sheet_with_header(tmp_path):
+    destination = tmp_path / "report.xlsx"
+    _existing_workbook(destination)
+    _write(destination, "x", ["n"], [[i] for i in range(5)], max_rows=3)
+    workbook = openpyxl.load_workbook(destination)
+    assert workbook.sheetnames == ["results", "notes", "x", "x_2", "x_3"]
+    assert _values(workbook["x"]) == [["n"], [0], [1]]
+    assert _values(workbook["x_2"]) == [["n"], [2], [3]]
+    assert _values(workbook["x_3"]) == [["n"], [4]]
+
+def test_empty_writer_adds_header_only_sheet(tmp_path):
+    destination = tmp_path / "report.xlsx"
+    _existing_workbook(destination)
+    _write(destination, "empty", ["a", "b"], [])
+    assert _values(openpyxl.load_workbook(destination)["empty"]) == [["a", "b"]]
+
+def test_add_sheets(tmp_path):
+    destination = tmp_path / "report.xlsx"
+    _existing_workbook(destination)
+    new_sheets = tmp_path / "new.xlsx"
+    workbook = openpyxl.Workbook(write_only=True)
+    for name in ["notes", "more"]:
+        workbook.create_sheet(title=name).append([name])
+    workbook.save(new_sheets)
+    target = tmp_path / "target.xlsx"
+    _add_sheets(destination, new_sheets, target)
+    result = openpyxl.load_workbook(target)
+    assert result.sheetnames == ["results", "notes", "notes-2", "more"]
+    assert _values(result["notes-2"]) == [["notes"]]
+    assert _values(result["more"]) == [["more"]]
+    assert result["notes"]["A1"].value == "keep me"
+
+def test_sheet_name_with_xml_characters(tmp_path):
+    destination = tmp_path / "report.xlsx"
+    _existing_workbook(destination)
+    _write(destination, "R&D <p50>", ["a"], [[1]])
+    _write(destination, "R&D <p50>", ["a"], [[2]])
+    assert openpyxl.load_workbook(destination).sheetnames == ["results", "notes", "R&D <p50>", "R&D <p50>-2"]